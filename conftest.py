@@ -3,10 +3,14 @@ from __future__ import unicode_literals
 import sys
 
 from tests.fixture_browser import browser
+from tests.fixture_cache import clear_shelf_cache
 from tests.fixture_configs import *
 from tests.fixture_fix_underscore import fix_underscore
 from tests.fixture_generic import *
 from tests.fixture_identify import identify
+from tests.fixture_server import server
+from tests.fixture_shelves import shelf_server
+from tests.fixture_worker import create_worker
 
 # Setup calibre paths.
 sys.path.insert(0, '/usr/lib/calibre')
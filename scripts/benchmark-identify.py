@@ -0,0 +1,266 @@
+#!./scripts/kill-and-run.sh
+
+"""
+Benchmark the hot paths of the identify pipeline, using the recorded pages in tests/_responses.
+
+This measures:
+
+- parse_shelves: parsing a recorded shelves page.
+- map_threshold: mapping the shelves of a recorded page to tags and applying the thresholds.
+- worker: a full Worker.run against a MockBrowser that serves the recorded pages after an artificial latency.
+- identify: a full integrated identify, with a number of simulated Goodreads candidates.
+
+The cache and the rate limit are disabled for the duration of the benchmark, without changing the preferences. The
+results are written as JSON to stdout (and a summary to stderr). If a baseline (the JSON of an earlier run) is given,
+this exits with a non-zero status if any benchmark has become slower than the tolerance allows.
+
+Usage: ./scripts/benchmark-identify.py [--rounds N] [--candidates N] [--latency MS] [--baseline FILE]
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import glob
+from itertools import count
+from io import StringIO
+import json
+import os.path
+import platform
+import sys
+from queue import Queue
+from threading import Event, Thread
+import time
+
+from calibre.customize.ui import all_metadata_plugins, find_plugin  # noqa
+from calibre.ebooks.metadata.book.base import Metadata
+from calibre.utils.browser import Browser
+from calibre.utils.logging import DEBUG, FileStream, ThreadSafeLog
+from calibre_plugins.goodreads_more_tags import GoodreadsMoreTags
+import calibre_plugins.goodreads_more_tags.settings as settings_module
+from calibre_plugins.goodreads_more_tags.connections import HTTPClient
+from calibre_plugins.goodreads_more_tags.goodreads_integration import QueueHandler, SharedData
+from calibre_plugins.goodreads_more_tags.prefs import (
+    KEY_CACHE_ENABLED, KEY_INTEGRATION_ENABLED, KEY_RETRIEVAL_PAGES, KEY_RETRIEVAL_RATE, plugin_prefs,
+)
+from calibre_plugins.goodreads_more_tags.settings import Settings, invalidate_settings
+from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+from calibre_plugins.goodreads_more_tags.worker import Worker, get_tags
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+from tests.fixture_browser import MockBrowser  # noqa
+
+RESPONSES = os.path.join(ROOT, 'tests', '_responses')
+
+# The preferences that are changed for the benchmark, so that every run does the same amount of work.
+OVERRIDES = {
+    tuple(KEY_CACHE_ENABLED): False,
+    tuple(KEY_INTEGRATION_ENABLED): True,
+    tuple(KEY_RETRIEVAL_PAGES): 1,
+    tuple(KEY_RETRIEVAL_RATE): 0,
+}
+
+
+class OverriddenPrefs(object):
+    """ The preferences, with some values replaced. """
+    def __init__(self, prefs, overrides):
+        self.prefs = prefs
+        self.overrides = overrides
+
+    def get(self, key):
+        if tuple(key) in self.overrides:
+            return self.overrides[tuple(key)]
+        return self.prefs.get(key)
+
+
+def load_pages():
+    """ Get the recorded shelves pages, as a list of (name, data). """
+    pages = []
+    for path in sorted(glob.glob(os.path.join(RESPONSES, 'goodreads-shelves-*.html'))):
+        with open(path, 'rb') as f:
+            pages.append((os.path.basename(path), f.read()))
+    return pages
+
+
+def create_log():
+    """ Create a log that records everything, like the log of a metadata download in calibre. """
+    log = ThreadSafeLog(level = DEBUG)
+    log.outputs = [FileStream(StringIO())]
+    return log
+
+
+def install_browser(pages, latency):
+    """ Serve the recorded pages after the given latency (in seconds) to all requests, cycling through the pages. """
+    browser = MockBrowser()
+
+    def respond(match):
+        time.sleep(latency)
+        return pages[int(match.group('id')) % len(pages)][1]
+    browser.add_response(r'^https?://(www\.)?goodreads\.com/book/shelves/(?P<id>\d+)\D*', respond)
+
+    Browser.open_novisit = browser.open_novisit
+    HTTPClient.open = lambda self, url, headers = (), timeout = None: browser.open_novisit(url)
+
+
+def measure(func, rounds):
+    """ Run func the given amount of times, returning statistics of the durations in seconds. """
+    durations = []
+    for _ in range(rounds):
+        start = time.time()
+        func()
+        durations.append(time.time() - start)
+    durations.sort()
+    return {
+        'rounds': rounds,
+        'min': durations[0],
+        'median': durations[len(durations) // 2],
+        'mean': sum(durations) / len(durations),
+        'max': durations[-1],
+    }
+
+
+def benchmark_parse(pages, rounds):
+    def run():
+        for name, data in pages:
+            parse_shelves(data)
+    return measure(run, rounds)
+
+
+def benchmark_map_threshold(pages, settings, rounds):
+    log = create_log()
+    shelves = [(name, parse_shelves(data)) for name, data in pages]
+
+    def run():
+        for name, page_shelves in shelves:
+            get_tags(page_shelves, settings, log, name)
+    return measure(run, rounds)
+
+
+def benchmark_worker(plugin, settings, rounds):
+    log = create_log()
+    identifiers = count(1)
+
+    def run():
+        results = Queue()
+        Worker(plugin, str(next(identifiers)), log = log, result_queue = results, settings = settings).run()
+        assert results.qsize() == 1
+    return measure(run, rounds)
+
+
+def simulate_goodreads(abort, identifiers, latency):
+    """
+    Act like the Goodreads plugin during an integrated identify: announce all candidates, and then provide the results
+    for these after the latency.
+    """
+    queue = QueueHandler.get_instance().create_queue(abort)
+    shared_data = [SharedData(identifier) for identifier in identifiers]
+    for shared_datum in shared_data:
+        queue.put(shared_datum)
+    # The Goodreads plugin creates all of its workers before it runs any of them.
+    queue.kill()
+    time.sleep(latency)
+    for shared_datum in shared_data:
+        result = Metadata('Title {}'.format(shared_datum.identifier), ['Author'])
+        result.set_identifier('goodreads', shared_datum.identifier)
+        shared_datum.results.put(result)
+        shared_datum.is_done.set()
+
+
+def benchmark_identify(plugin, candidates, latency, rounds):
+    log = create_log()
+    offsets = count(0, candidates)
+
+    def run():
+        offset = next(offsets)
+        identifiers = [str(offset + i) for i in range(1, candidates + 1)]
+        abort = Event()
+        goodreads = Thread(target = simulate_goodreads, args = (abort, identifiers, latency))
+        goodreads.start()
+        results = Queue()
+        plugin.identify(log, results, abort, identifiers = {})
+        goodreads.join()
+        assert results.qsize() == candidates, 'Got {} results for {} candidates'.format(results.qsize(), candidates)
+    return measure(run, rounds)
+
+
+def compare(results, baseline, tolerance):
+    """ Get descriptions of the benchmarks that are slower than the baseline (plus the tolerance). """
+    regressions = []
+    for name, result in results['benchmarks'].items():
+        previous = baseline.get('benchmarks', {}).get(name)
+        if previous is None:
+            continue
+        if result['median'] > previous['median'] * (1 + tolerance):
+            regressions.append('{} median {:.3f}ms, was {:.3f}ms'.format(
+                name,
+                result['median'] * 1000,
+                previous['median'] * 1000,
+            ))
+    return regressions
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'Benchmark the hot paths of the identify pipeline.')
+    parser.add_argument('--rounds', type = int, default = 20, help = 'Times to run each benchmark.')
+    parser.add_argument('--candidates', type = int, default = 10, help = 'Simulated Goodreads candidates per identify.')
+    parser.add_argument('--latency', type = float, default = 50, help = 'Artificial latency per request, in ms.')
+    parser.add_argument('--baseline', help = 'The JSON output of an earlier run to compare with.')
+    parser.add_argument('--tolerance', type = float, default = 0.2, help = 'Allowed slowdown compared to the baseline.')
+    opts = parser.parse_args(argv)
+
+    pages = load_pages()
+    latency = opts.latency / 1000
+    install_browser(pages, latency)
+
+    plugin = find_plugin(GoodreadsMoreTags.name)
+    settings = Settings(OverriddenPrefs(plugin_prefs, OVERRIDES))
+    # Use the same settings for the identify, which gets the current snapshot itself.
+    settings_module._settings = settings
+    # The integration is simulated, so it does not matter whether the Goodreads plugin is installed.
+    is_integrated, plugin.is_integrated = plugin.is_integrated, True
+    plugin.apply_settings(settings)
+    try:
+        benchmarks = {
+            'parse_shelves': benchmark_parse(pages, opts.rounds),
+            'map_threshold': benchmark_map_threshold(pages, settings, opts.rounds),
+            'worker': benchmark_worker(plugin, settings, opts.rounds),
+            'identify': benchmark_identify(plugin, opts.candidates, latency, opts.rounds),
+        }
+    finally:
+        plugin.is_integrated = is_integrated
+        invalidate_settings()
+
+    results = {
+        'config': {
+            'rounds': opts.rounds,
+            'candidates': opts.candidates,
+            'latency_ms': opts.latency,
+            'pages': [name for name, data in pages],
+            'pool_size': settings.pool_size,
+            'python': platform.python_version(),
+            'plugin_version': '.'.join(str(part) for part in GoodreadsMoreTags.version),
+        },
+        'benchmarks': benchmarks,
+    }
+    for name, result in sorted(benchmarks.items()):
+        print('{:<15} min {:8.3f}ms, median {:8.3f}ms'.format(
+            name,
+            result['min'] * 1000,
+            result['median'] * 1000,
+        ), file = sys.stderr)
+    print(json.dumps(results, indent = 2, sort_keys = True))
+
+    if opts.baseline:
+        with open(opts.baseline) as f:
+            regressions = compare(results, json.load(f), opts.tolerance)
+        for regression in regressions:
+            print('Regression: {}'.format(regression), file = sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+Measure how long it takes to load the plugin for a headless identify, and which GUI modules that drags in.
+
+The plugin is zipped from both the working tree and a baseline revision (the commit before the preferences were split
+from the config widget, by default). Each measurement is done in a fresh calibre-debug process that has only set up
+the plugin loader, so that neither the plugin nor any other plugins have been imported yet. The clock covers loading
+the plugin zip and importing the worker, which is what a headless identify needs.
+
+Usage: ./scripts/benchmark-import-time.py [runs] [baseline revision]
+"""
+
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+SNIPPET = '''
+import json, sys, time
+from calibre.customize.zipplugin import loader
+before = set(sys.modules)
+start = time.time()
+loader.load({path!r})
+import calibre_plugins.goodreads_more_tags.worker
+duration = time.time() - start
+print(json.dumps({{
+    'duration': duration,
+    'gui_modules': sorted(m for m in set(sys.modules) - before if m.startswith(('PyQt', 'calibre.gui2'))),
+}}))
+'''
+
+BASELINE = 'acfe862'
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PLUGIN_DIR = os.path.join('src', 'goodreads_more_tags')
+
+
+def zip_working_tree(path):
+    with zipfile.ZipFile(path, 'w') as archive:
+        for directory, _, filenames in os.walk(os.path.join(ROOT, PLUGIN_DIR)):
+            for filename in filenames:
+                if filename.endswith('.pyc'):
+                    continue
+                filename = os.path.join(directory, filename)
+                archive.write(filename, os.path.relpath(filename, os.path.join(ROOT, PLUGIN_DIR)))
+
+
+def zip_revision(path, revision):
+    subprocess.check_call(
+        ['git', 'archive', '--format=zip', '-o', path, '{}:{}'.format(revision, PLUGIN_DIR)],
+        cwd = ROOT,
+    )
+
+
+def measure(path):
+    output = subprocess.check_output(['calibre-debug', '-c', SNIPPET.format(path = path)])
+    return json.loads(output.decode('utf-8').strip().splitlines()[-1])
+
+
+def main(runs, baseline):
+    tempdir = tempfile.mkdtemp()
+    try:
+        plugins = [
+            ('working tree', os.path.join(tempdir, 'current.zip')),
+            ('baseline ({})'.format(baseline), os.path.join(tempdir, 'baseline.zip')),
+        ]
+        zip_working_tree(plugins[0][1])
+        zip_revision(plugins[1][1], baseline)
+
+        results = {}
+        for name, path in plugins:
+            durations = []
+            for _ in range(runs):
+                result = measure(path)
+                durations.append(result['duration'])
+            durations.sort()
+            results[name] = {
+                'min': durations[0],
+                'median': durations[len(durations) // 2],
+                'gui_modules': result['gui_modules'],
+            }
+            print('{:<30} min {:.3f}s, median {:.3f}s, {} GUI modules loaded{}'.format(
+                name,
+                results[name]['min'],
+                results[name]['median'],
+                len(result['gui_modules']),
+                ''.join('\n    ' + module for module in result['gui_modules'] if module.startswith('PyQt')),
+            ), file = sys.stderr)
+        print(json.dumps(results, indent = 2))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    main(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 5,
+        sys.argv[2] if len(sys.argv) > 2 else BASELINE,
+    )
@@ -0,0 +1,208 @@
+#!./scripts/kill-and-run.sh
+
+"""
+Benchmark how the shelf parsing and the tag handling scale with the amount of shelves, and how the workers scale with
+the amount of concurrent books, using generated shelves pages served by a local stand-in for Goodreads.
+
+This measures:
+
+- parse: parsing a single page with all shelves of a book, and the peak memory used by this.
+- tags: mapping the shelves to tags and applying the thresholds.
+- workers: retrieving the tags of many books at the same time, with every book spread over multiple pages.
+
+The cache and the rate limit are disabled for the duration of the benchmark, without changing the preferences. The
+results are written as JSON to stdout (and a summary to stderr).
+
+Usage: ./scripts/benchmark-scaling.py [--shelves 100,1000,5000] [--workers 1,10,100] [--pages N] [--latency MS]
+"""
+
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+from io import StringIO
+import json
+import os.path
+from queue import Queue
+import sys
+from threading import Thread
+import time
+import tracemalloc
+
+from calibre.customize.ui import all_metadata_plugins, find_plugin  # noqa
+from calibre.utils.logging import INFO, FileStream, ThreadSafeLog
+from calibre_plugins.goodreads_more_tags import GoodreadsMoreTags
+import calibre_plugins.goodreads_more_tags.worker as worker_module
+from calibre_plugins.goodreads_more_tags.prefs import (
+    KEY_CACHE_ENABLED, KEY_INTEGRATION_HOST_LIMIT, KEY_RETRIEVAL_PAGES, KEY_RETRIEVAL_RATE, plugin_prefs,
+)
+from calibre_plugins.goodreads_more_tags.settings import Settings
+from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+from calibre_plugins.goodreads_more_tags.worker import Worker, get_tags
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from tests.fixture_server import serving  # noqa
+from tests.fixture_shelves import DISTRIBUTIONS, ShelfServer, generate_shelves, render_page  # noqa
+
+
+class OverriddenPrefs(object):
+    """ The preferences, with some values replaced. """
+    def __init__(self, prefs, overrides):
+        self.prefs = prefs
+        self.overrides = overrides
+
+    def get(self, key):
+        if tuple(key) in self.overrides:
+            return self.overrides[tuple(key)]
+        return self.prefs.get(key)
+
+
+def parse_counts(value):
+    """ Parse a comma separated list of counts. """
+    return [int(part) for part in value.split(',')]
+
+
+def create_log():
+    """ Create a log that only records the important messages, so that logging does not dominate the results. """
+    log = ThreadSafeLog(level = INFO)
+    log.outputs = [FileStream(StringIO())]
+    return log
+
+
+def best_of(func, repeat):
+    """ Run func the given amount of times, returning the shortest duration in seconds. """
+    durations = []
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        durations.append(time.time() - start)
+    return min(durations)
+
+
+def peak_memory(func):
+    """ Get the peak amount of memory allocated while running func, in bytes. """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def benchmark_shelves(count, distribution, settings, repeat):
+    shelves = generate_shelves(count, distribution, seed = count)
+    data = render_page('1', shelves, page_size = count)
+    parsed = parse_shelves(data)
+    assert parsed == dict(shelves)
+    log = create_log()
+    return {
+        'bytes': len(data),
+        'parse_seconds': best_of(lambda: parse_shelves(data), repeat),
+        'parse_peak_bytes': peak_memory(lambda: parse_shelves(data)),
+        'tags_seconds': best_of(lambda: get_tags(parsed, settings, log, '1'), repeat),
+        'tags_peak_bytes': peak_memory(lambda: get_tags(parsed, settings, log, '1')),
+    }
+
+
+def benchmark_workers(plugin, settings, server, count, offset):
+    log = create_log()
+    results = Queue()
+    workers = [
+        Worker(plugin, str(offset + i), log = log, result_queue = results, settings = settings)
+        for i in range(1, count + 1)
+    ]
+    threads = [Thread(target = worker.run) for worker in workers]
+    requests = len(server.requests)
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    duration = time.time() - start
+    return {
+        'seconds': duration,
+        'books_per_second': count / duration,
+        'requests': len(server.requests) - requests,
+        'tagged': results.qsize(),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description = 'Benchmark the scaling of the shelf handling with generated pages.')
+    parser.add_argument('--shelves', type = parse_counts, default = [100, 1000, 5000],
+                        help = 'Comma separated amounts of shelves per book.')
+    parser.add_argument('--distribution', choices = DISTRIBUTIONS, default = DISTRIBUTIONS[0],
+                        help = 'The distribution of the amount of people per shelf.')
+    parser.add_argument('--workers', type = parse_counts, default = [1, 10, 100],
+                        help = 'Comma separated amounts of concurrent workers.')
+    parser.add_argument('--worker-shelves', type = int, default = 1000, help = 'Shelves per book for the workers.')
+    parser.add_argument('--pages', type = int, default = 3, help = 'Pages to retrieve per book for the workers.')
+    parser.add_argument('--page-size', type = int, default = 100, help = 'Shelves per page for the workers.')
+    parser.add_argument('--host-limit', type = int, default = 4, help = 'Concurrent requests to the server.')
+    parser.add_argument('--latency', type = float, default = 50, help = 'Artificial latency per request, in ms.')
+    parser.add_argument('--repeat', type = int, default = 5, help = 'Times to run each parse/tags benchmark.')
+    opts = parser.parse_args(argv)
+
+    settings = Settings(OverriddenPrefs(plugin_prefs, {
+        tuple(KEY_CACHE_ENABLED): False,
+        tuple(KEY_INTEGRATION_HOST_LIMIT): opts.host_limit,
+        tuple(KEY_RETRIEVAL_PAGES): opts.pages,
+        tuple(KEY_RETRIEVAL_RATE): 0,
+    }))
+    shelves = {}
+    for count in opts.shelves:
+        shelves[count] = result = benchmark_shelves(count, opts.distribution, settings, opts.repeat)
+        print('{:>6} shelves: parse {:8.2f}ms, tags {:8.2f}ms'.format(
+            count,
+            result['parse_seconds'] * 1000,
+            result['tags_seconds'] * 1000,
+        ), file = sys.stderr)
+
+    plugin = find_plugin(GoodreadsMoreTags.name)
+    plugin.apply_settings(settings)
+    server = ShelfServer(
+        shelves = opts.worker_shelves,
+        distribution = opts.distribution,
+        page_size = opts.page_size,
+        latency = opts.latency / 1000,
+    )
+    url_template = worker_module.URL_TEMPLATE, worker_module.PAGE_URL_TEMPLATE
+    worker_module.URL_TEMPLATE = server.url_template
+    worker_module.PAGE_URL_TEMPLATE = server.url_template + '?page={page}'
+    workers = {}
+    try:
+        with serving(server):
+            offset = 0
+            for count in opts.workers:
+                workers[count] = result = benchmark_workers(plugin, settings, server, count, offset)
+                offset += count
+                print('{:>6} workers: {:8.2f}s, {:8.1f} books/s, {} requests'.format(
+                    count,
+                    result['seconds'],
+                    result['books_per_second'],
+                    result['requests'],
+                ), file = sys.stderr)
+    finally:
+        worker_module.URL_TEMPLATE, worker_module.PAGE_URL_TEMPLATE = url_template
+
+    results = {
+        'config': {
+            'distribution': opts.distribution,
+            'worker_shelves': opts.worker_shelves,
+            'pages': opts.pages,
+            'page_size': opts.page_size,
+            'host_limit': opts.host_limit,
+            'latency_ms': opts.latency,
+            'repeat': opts.repeat,
+        },
+        # JSON object keys are always strings.
+        'shelves': dict((str(count), result) for count, result in shelves.items()),
+        'workers': dict((str(count), result) for count, result in workers.items()),
+    }
+    print(json.dumps(results, indent = 2, sort_keys = True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
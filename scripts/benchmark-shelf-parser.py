@@ -0,0 +1,44 @@
+#!./scripts/kill-and-run.sh
+
+"""
+Compare the speed of the fast path of the shelf parsing to the DOM based parsing, using the recorded shelves pages.
+"""
+
+from __future__ import division
+from __future__ import print_function
+
+import glob
+import json
+import os.path
+import sys
+import timeit
+
+from calibre.customize.ui import all_metadata_plugins  # noqa
+from calibre_plugins.goodreads_more_tags.shelves import parse_shelves_fast, parse_shelves_tree
+
+RESPONSES = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'tests', '_responses')
+NUMBER = 200
+
+
+def benchmark(func, text):
+    return min(timeit.repeat(lambda: func(text), number = NUMBER, repeat = 5)) / NUMBER
+
+
+if __name__ == '__main__':
+    results = {}
+    for path in sorted(glob.glob(os.path.join(RESPONSES, 'goodreads-shelves-*.html'))):
+        with open(path, 'rb') as f:
+            text = f.read().decode('utf-8', errors = 'replace').strip()
+        assert parse_shelves_fast(text) == parse_shelves_tree(text)
+
+        fast = benchmark(parse_shelves_fast, text)
+        tree = benchmark(parse_shelves_tree, text)
+        name = os.path.basename(path)
+        results[name] = { 'fast': fast, 'tree': tree, 'speedup': tree / fast }
+        print('{:<35} fast {:.3f}ms, tree {:.3f}ms, {:.1f}x'.format(
+            name,
+            fast * 1000,
+            tree * 1000,
+            tree / fast,
+        ), file = sys.stderr)
+    print(json.dumps(results, indent = 2))
@@ -1,15 +1,19 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 
-try:
-    from queue import Queue
-except:
-    # Python 2.x
-    from Queue import Queue
+from queue import Empty, Queue
+import sys
+from threading import Lock
+import time
 
 from calibre.ebooks.metadata.sources.base import Source
 
-from .config import plugin_prefs, KEY_INTEGRATION_ENABLED, KEY_INTEGRATION_TIMEOUT
+from .connections import HTTPClient
+from .instrumentation import LazyFormat, Timings
+from .monitoring import metrics
+from .pool import WorkerPool, rate_limiter
+from .sync import CountDownLatch
+from .settings import get_settings
 
 __license__ = 'BSD 3-clause'
 __copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
@@ -22,7 +26,7 @@ class GoodreadsMoreTags(Source):
     author = 'Michon van Dooren'
 
     version = (1, 2, 1)
-    minimum_calibre_version = (0, 7, 53)
+    minimum_calibre_version = (5, 0, 0)
     supported_platforms = ['windows', 'osx', 'linux']
 
     capabilities = frozenset(['identify'])
@@ -31,6 +35,20 @@ class GoodreadsMoreTags(Source):
     def __init__(self, *args, **kwargs):
         Source.__init__(self, *args, **kwargs)
 
+        # The pool that all workers run in, shared between all identify calls to limit the total amount of concurrent
+        # workers.
+        settings = get_settings()
+        self.pool = WorkerPool(settings.pool_size, settings.host_limit)
+
+        # The pool that additional pages of shelves are retrieved in. This cannot be the same pool as the workers, as
+        # these wait for the pages, which could deadlock if all threads of the pool are waiting. The limit of requests
+        # per host is shared with the worker pool.
+        self.page_pool = WorkerPool(self.pool.size, None, self.pool.host_limiter)
+
+        # The client that keeps connections to Goodreads alive between requests, created on first use.
+        self.http_client = None
+        self.http_client_lock = Lock()
+
         # Try to inject into the regular Goodreads plugin. If this succeeds, this will provide data for use in our
         # identify (identifiers and results for all Goodreads results). If this fails, we do want to perform our
         # identify as normal. The advantage of this integration is that it works for items that don't already have a
@@ -44,6 +62,31 @@ class GoodreadsMoreTags(Source):
             pass
         print('Integration status:', self.is_integrated)
 
+    def apply_settings(self, settings):
+        """ Update the pools and the rate limiter to match the given Settings. """
+        self.pool.configure(settings.pool_size, settings.host_limit)
+        self.page_pool.configure(settings.pool_size, settings.host_limit)
+        rate_limiter.configure(settings.rate_limit)
+        if self.http_client is not None:
+            self.http_client.configure(settings.host_limit)
+
+    def get_http_client(self):
+        """
+        Get the HTTPClient for requests to Goodreads, or None if it cannot be used.
+
+        The client does not support proxies, so if calibre is configured to use any the browser is used instead.
+        """
+        from calibre import get_proxies
+        with self.http_client_lock:
+            if self.http_client is None and not get_proxies():
+                self.http_client = HTTPClient(self.pool.host_limiter.limit, self.browser.addheaders)
+            return self.http_client
+
+    def cli_main(self, argv):
+        """ Get tags for all books in a library. Run `calibre-debug -r "Goodreads More Tags" -- --help` for details. """
+        from .bulk import main
+        sys.exit(main(self, argv))
+
     def config_widget(self):
         from .config import ConfigWidget
         return ConfigWidget(self)
@@ -56,16 +99,32 @@ class GoodreadsMoreTags(Source):
         that. If not, it will only get tags if the current set of identifiers contains one for Goodreads.
         """
         from .worker import Worker
-        workers = []
+        metrics.increment('identify_calls')
+        start = time.time()
+        futures = []
         shared_data = {}
-        temp_queue = Queue()
-        use_integration = self.is_integrated and plugin_prefs.get(KEY_INTEGRATION_ENABLED)
+        settings = get_settings()
+        for key, error in sorted(settings.mapper.invalid.items()):
+            log.warn('Ignoring the shelf mapping for {}, as it is not a valid pattern: {}'.format(key, error))
+        timeout = settings.integration_timeout
+        # The time spent in each stage by all workers of this identify, plus the time spent waiting here.
+        timings = Timings()
+        self.apply_settings(settings)
+        use_integration = self.is_integrated and settings.integration_enabled
+
+        # When streaming, the workers pass on their results as soon as they are done. Otherwise, the results are
+        # collected here and only passed on once all workers are done. The workers measure the time spent passing on
+        # their results themselves, so in that case the finisher should not measure it again.
+        streaming = settings.streaming
+        finisher = ResultFinisher(log, result_queue, identifiers, shared_data, timeout, None if streaming else timings)
+        temp_queue = finisher if streaming else Queue()
 
         if use_integration:
             # Integration is enabled, so get the identifiers from the shared data.
             from .goodreads_integration import QueueHandler, QueueTimeoutError
             try:
-                queue = QueueHandler.get_instance().get_queue(abort, 1)
+                with timings.measure('integration-wait'):
+                    queue = QueueHandler.get_instance().get_queue(abort, 1)
             except QueueTimeoutError:
                 use_integration = False
                 log.debug((
@@ -73,11 +132,10 @@ class GoodreadsMoreTags(Source):
                     'skipping integration for this run.'
                 ))
         if use_integration:
-            workers = []
-            timeout = plugin_prefs.get(KEY_INTEGRATION_TIMEOUT)
             while not abort.is_set():
                 try:
-                    shared_datum = queue.get(timeout = timeout)
+                    with timings.measure('integration-wait'):
+                        shared_datum = queue.get(timeout = timeout)
                 except QueueTimeoutError:
                     log.warn((
                         'Timeout hit ({}s) while waiting for results from the Goodreads plugin. '
@@ -89,62 +147,107 @@ class GoodreadsMoreTags(Source):
                     QueueHandler.get_instance().remove_queue(abort)
                     break
                 log.debug('Received identifier from Goodreads plugin: {}'.format(shared_datum.identifier))
-                worker = Worker(self, shared_datum.identifier, log = log, result_queue = temp_queue, **kwargs)
-                worker.start()
                 shared_data[shared_datum.identifier] = shared_datum
-                workers.append(worker)
-
-        if len(workers) == 0:
+                worker = Worker(
+                    self,
+                    shared_datum.identifier,
+                    log = log,
+                    result_queue = temp_queue,
+                    settings = settings,
+                    abort = abort,
+                    timings = timings,
+                    **kwargs
+                )
+                futures.append(self.pool.submit(worker.run))
+
+        if len(futures) == 0:
             # It's possible to end up here when integration is enabled when it fails to find any results.
             if use_integration:
                 log.warn('Got no results from the Goodreads plugin, proceeding without integration')
             # No integration, so only proceed if there is a known goodreads identifier.
             if 'goodreads' not in identifiers:
                 log.error('No goodreads identifier found, not grabbing extra tags')
+                metrics.observe('identify_seconds', time.time() - start)
                 return
             log.debug('Using existing goodreads identifier from metadata: {}'.format(identifiers['goodreads']))
-            worker = Worker(self, identifiers['goodreads'], log = log, result_queue = temp_queue, **kwargs)
-            worker.start()
-            workers.append(worker)
-
-        while not abort.is_set():
-            for worker in workers:
-                if worker.is_alive():
-                    worker.join(0.1)
-                    break
-            else:
-                # All of the workers are done, so we can continue now.
-                break
+            worker = Worker(
+                self,
+                identifiers['goodreads'],
+                log = log,
+                result_queue = temp_queue,
+                settings = settings,
+                abort = abort,
+                timings = timings,
+                **kwargs
+            )
+            futures.append(self.pool.submit(worker.run))
+
+        # Wait until all of the workers are done, or until we are aborted, whichever comes first.
+        latch = CountDownLatch(len(futures))
+        for future in futures:
+            future.add_done_callback(lambda future: latch.count_down())
+        with timings.measure('workers-wait'):
+            latch.wait(abort = abort)
+        for future in futures:
+            if future.done() and future.exception() is not None:
+                log.error('Worker failed: {!r}'.format(future.exception()))
+
+        # Pass on the results that were collected, unless these have already been passed on as they came in.
+        while not streaming and not abort.is_set() and not temp_queue.empty():
+            finisher.put(temp_queue.get())
+
+        log.info(LazyFormat('Timings of {} worker(s), summed over all workers: {}', len(futures), timings))
+        metrics.observe('identify_seconds', time.time() - start)
+
+
+class ResultFinisher(object):
+    """
+    Completes the results of the workers with data from the corresponding Goodreads results, and passes them on to the
+    result queue of calibre.
+
+    This has the same put method as a queue, so that workers can use it as their result queue directly. The time spent
+    waiting for the Goodreads results is added to timings, if given.
+    """
+    def __init__(self, log, result_queue, identifiers, shared_data, timeout, timings):
+        self.log = log
+        self.result_queue = result_queue
+        self.shared_data = shared_data
+        self.timeout = timeout
+        self.timings = timings
 
         # Copy the isbn to the results, as this plays an important role in merging. If integration is available, the
         # goodreads results may overwrite this with a different isbn.
-        extra_identifiers = {}
+        self.extra_identifiers = {}
         if 'isbn' in identifiers:
-            extra_identifiers['isbn'] = identifiers['isbn']
+            self.extra_identifiers['isbn'] = identifiers['isbn']
+
+    def put(self, result):
+        identifier = result.identifiers['goodreads']
+        result.identifiers.update(self.extra_identifiers)
 
         # Results are only merged if the title and authors are the same, so copy these values from the corresponding
         # goodreads results, if any.
-        while not abort.is_set() and not temp_queue.empty():
-            result = temp_queue.get()
-            identifier = result.identifiers['goodreads']
-            result.identifiers.update(extra_identifiers)
-
-            shared_datum = shared_data.get(identifier)
-            if shared_datum is None:
-                log.warn('[{}] No goodreads result found (1), not copying id, title & author'.format(identifier))
-                result_queue.put(result)
-                continue
-            shared_datum.is_done.wait()
-
-            goodreads_result = shared_datum.results.get()
-            if goodreads_result is None:
-                log.warn('[{}] No goodreads result found (2), not copying id, title & author'.format(identifier))
-                result_queue.put(result)
-                continue
-
-            log.debug('[{}] Goodreads result found, copying id, title & author'.format(identifier))
-            result.identifiers = goodreads_result.identifiers
-            result.title = goodreads_result.title
-            result.authors = goodreads_result.authors
-            result_queue.put(result)
+        shared_datum = self.shared_data.get(identifier)
+        if shared_datum is None:
+            self.log.warn('[{}] No goodreads result found (1), not copying id, title & author'.format(identifier))
+            self.result_queue.put(result)
+            return
+        start = time.time()
+        shared_datum.is_done.wait(self.timeout)
+        if self.timings is not None:
+            self.timings.add('integration-wait', time.time() - start)
 
+        try:
+            goodreads_result = shared_datum.results.get_nowait()
+        except Empty:
+            goodreads_result = None
+        if goodreads_result is None:
+            self.log.warn('[{}] No goodreads result found (2), not copying id, title & author'.format(identifier))
+            self.result_queue.put(result)
+            return
+
+        self.log.debug('[{}] Goodreads result found, copying id, title & author'.format(identifier))
+        result.identifiers = goodreads_result.identifiers
+        result.title = goodreads_result.title
+        result.authors = goodreads_result.authors
+        self.result_queue.put(result)
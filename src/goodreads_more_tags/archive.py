@@ -0,0 +1,83 @@
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from threading import Lock
+from zipfile import ZIP_DEFLATED, ZipFile
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+MODE_RECORD = 'record'
+MODE_REPLAY = 'replay'
+
+
+class ShelfArchive(object):
+    """
+    A compressed archive (zip file) of raw shelf pages, keyed by Goodreads identifier and page number.
+
+    In record mode the pages that are retrieved from Goodreads are added to the archive, and in replay mode the pages
+    are read from the archive instead of being retrieved from Goodreads. This makes it possible to try out different
+    mappings and thresholds against the exact same data, without any network access.
+
+    Recording into an existing archive adds to it, but pages that are already in the archive are kept as they are.
+
+    This is safe to use from multiple threads at the same time.
+    """
+    def __init__(self, path, mode):
+        if mode not in (MODE_RECORD, MODE_REPLAY):
+            raise ValueError('Unknown archive mode {}'.format(mode))
+        self.path = path
+        self.mode = mode
+        self.lock = Lock()
+        self.zip = ZipFile(path, 'a' if mode == MODE_RECORD else 'r', ZIP_DEFLATED)
+        self.names = set(self.zip.namelist())
+
+    @property
+    def recording(self):
+        return self.mode == MODE_RECORD
+
+    @property
+    def replaying(self):
+        return self.mode == MODE_REPLAY
+
+    @staticmethod
+    def get_name(identifier, page):
+        """
+        Get the name of the file in the archive for a page.
+
+        >>> ShelfArchive.get_name('902715', 1)
+        'shelves/902715/1.html'
+        """
+        return 'shelves/{}/{}.html'.format(identifier, page)
+
+    def read(self, identifier, page):
+        """ Get the raw contents of a page, or None if it is not in the archive. """
+        name = self.get_name(identifier, page)
+        with self.lock:
+            if name not in self.names:
+                return None
+            return self.zip.read(name)
+
+    def write(self, identifier, page, data):
+        """ Add the raw contents of a page to the archive, unless it is already in there. """
+        name = self.get_name(identifier, page)
+        with self.lock:
+            if name in self.names:
+                return
+            self.zip.writestr(name, data)
+            self.names.add(name)
+
+    def __len__(self):
+        with self.lock:
+            return len(self.names)
+
+    def close(self):
+        with self.lock:
+            self.zip.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,396 @@
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+import argparse
+import json
+import os.path
+import sys
+from threading import Event
+import time
+
+from .archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+from .cache import get_cache, get_cache_path
+from .instrumentation import Timings
+from .monitoring import FORMAT_JSON, FORMATS, MetricsExporter, metrics
+from .settings import get_settings
+from .sync import CountDownLatch
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# Tagging a whole library for books that already have a Goodreads identifier, without going through the full metadata
+# download of calibre. Run using calibre-debug -r "Goodreads More Tags" -- [options].
+
+# The name of the custom book data in the library in which the tags that were added by the BulkTagger are stored.
+WRITTEN_TAGS_DATA = 'goodreads_more_tags_written'
+
+
+class BookResultQueue(object):
+    """ Acts as the result queue of the Worker for a single book, storing the tags of its result in results. """
+    def __init__(self, results, book_id):
+        self.results = results
+        self.book_id = book_id
+
+    def put(self, meta):
+        self.results[self.book_id] = meta.tags
+
+
+class BulkTagger(object):
+    """
+    Gets tags for all books in a library that have a Goodreads identifier, and writes these to the library.
+
+    The tags that it adds to a book are remembered in the library, and with replace these are the only tags that are
+    removed again once they no longer apply. Other tags of the book (like the ones added by the user) are always kept.
+    """
+    def __init__(self, plugin, db, log, state_path, batch_size = 100, replace = False, dry_run = False, archive = None):
+        self.plugin = plugin
+        self.db = db
+        self.log = log
+        self.state_path = state_path
+        self.batch_size = batch_size
+        self.replace = replace
+        self.dry_run = dry_run
+        self.archive = archive
+        # Set to stop the workers of a run that is interrupted.
+        self.abort = Event()
+
+    def get_books(self):
+        """ Get a sorted list of (book id, Goodreads identifier) for all books that have a Goodreads identifier. """
+        identifiers = self.db.all_field_for('identifiers', self.db.all_book_ids())
+        return sorted(
+            (book_id, ids['goodreads'])
+            for book_id, ids in identifiers.items()
+            if ids.get('goodreads')
+        )
+
+    def load_state(self):
+        """ Get the id of the last book that was processed in a previous run, or 0 if there was no previous run. """
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return 0
+        if state.get('library') != self.db.backend.library_path:
+            return 0
+        return state.get('last_book_id', 0)
+
+    def save_state(self, last_book_id):
+        with open(self.state_path, 'w') as f:
+            json.dump({ 'library': self.db.backend.library_path, 'last_book_id': last_book_id }, f)
+
+    def clear_state(self):
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def run(self, resume = True):
+        from .worker import Worker
+
+        books = self.get_books()
+        last_book_id = 0
+        if resume:
+            last_book_id = self.load_state()
+            if last_book_id:
+                skipped = len(books)
+                books = [book for book in books if book[0] > last_book_id]
+                skipped -= len(books)
+                print('Resuming after book {}, skipping {} books already done'.format(last_book_id, skipped))
+        else:
+            self.clear_state()
+
+        settings = get_settings()
+        self.plugin.apply_settings(settings)
+        for key, error in sorted(settings.mapper.invalid.items()):
+            print('Ignoring the shelf mapping for {}, as it is not a valid pattern: {}'.format(key, error))
+
+        total = len(books)
+        saved_book_id = last_book_id
+        done = tagged = changed = failed = 0
+        timings = Timings()
+        start = time.time()
+        print('Getting tags for {} books'.format(total))
+        futures = []
+        try:
+            for offset in range(0, total, self.batch_size):
+                batch = books[offset:offset + self.batch_size]
+
+                # Run the workers for this batch.
+                results = {}
+                workers = {}
+                futures = []
+                latch = CountDownLatch(len(batch))
+                for book_id, identifier in batch:
+                    workers[book_id] = worker = Worker(
+                        self.plugin,
+                        identifier,
+                        log = self.log,
+                        result_queue = BookResultQueue(results, book_id),
+                        settings = settings,
+                        abort = self.abort,
+                        archive = self.archive,
+                        timings = timings,
+                    )
+                    future = self.plugin.pool.submit(worker.run)
+                    future.add_done_callback(lambda future: latch.count_down())
+                    futures.append(future)
+                latch.wait()
+
+                # A resumed run continues after the last book before the first failure, so that failed books are
+                # retried. The results of failed books may be incomplete, so these are not written.
+                for (book_id, identifier), future in zip(batch, futures):
+                    if future.done() and future.exception() is not None:
+                        self.log.error('[{}] Worker failed: {!r}'.format(identifier, future.exception()))
+                    elif not workers[book_id].failed:
+                        if not failed:
+                            last_book_id = book_id
+                        # Books with shelves but without tags have none of the tags that were added before.
+                        if workers[book_id].found_shelves and book_id not in results:
+                            results[book_id] = []
+                        continue
+                    failed += 1
+                    results.pop(book_id, None)
+                tagged += sum(1 for tags in results.values() if tags)
+
+                # Write all changes of this batch in a single transaction.
+                changed += self.write_tags(results)
+                if not self.dry_run:
+                    self.save_state(last_book_id)
+                    saved_book_id = last_book_id
+
+                done += len(batch)
+                elapsed = time.time() - start
+                rate = done / elapsed if elapsed else 0
+                print('{}/{} books ({:.0%}), {} tagged, {} changed, {:.1f} books/s, ETA {:.0f}s'.format(
+                    done,
+                    total,
+                    done / total,
+                    tagged,
+                    changed,
+                    rate,
+                    (total - done) / rate if rate else 0,
+                ))
+        except KeyboardInterrupt:
+            # Stop the running workers and drop the queued ones, instead of waiting for the rest of the batch. The
+            # state still points at the last batch that was written completely.
+            self.abort.set()
+            for future in futures:
+                future.cancel()
+            if not self.dry_run:
+                self.save_state(saved_book_id)
+            raise
+
+        if not self.dry_run and not failed:
+            self.clear_state()
+        print('Done, {} of {} books tagged, {} changed, in {:.0f}s'.format(tagged, total, changed, time.time() - start))
+        if failed:
+            print('Failed to process {} books, run again to retry these'.format(failed))
+        print('Timings, summed over all books: {}'.format(timings))
+
+    def rescore(self):
+        """
+        Recompute the tags of all books from their cached shelves, using the current mappings and thresholds.
+
+        This does not contact Goodreads at all, so books of which the shelves are not cached are skipped. Returns False
+        if the cache is disabled.
+        """
+        from .worker import get_tags
+
+        settings = get_settings()
+        cache = get_cache(settings)
+        if cache is None:
+            return False
+
+        books = self.get_books()
+        total = len(books)
+        cached = changed = 0
+        timings = Timings()
+        start = time.time()
+        print('Recomputing tags for {} books'.format(total))
+        for offset in range(0, total, self.batch_size):
+            batch = books[offset:offset + self.batch_size]
+            shelves = cache.get_many(identifier for book_id, identifier in batch)
+            results = {}
+            for book_id, identifier in batch:
+                if identifier not in shelves:
+                    continue
+                cached += 1
+                tags = get_tags(shelves[identifier], settings, self.log, identifier, timings)
+                results[book_id] = list(tags.keys())
+            changed += self.write_tags(results)
+
+        print('Done, {} of {} books had cached shelves, {} changed, in {:.1f}s'.format(
+            cached,
+            total,
+            changed,
+            time.time() - start,
+        ))
+        print('Timings, summed over all books: {}'.format(timings))
+        return True
+
+    def write_tags(self, new_tags):
+        """
+        Write the tags to the library, returning the amount of books for which the tags changed.
+
+        The new tags are added to the current tags of each book. With replace, the tags that were added by an earlier
+        run and that are not in the new tags are removed.
+        """
+        if not new_tags:
+            return 0
+        book_ids = list(new_tags.keys())
+        current_tags = self.db.all_field_for('tags', book_ids)
+        written_tags = self.db.get_custom_book_data(WRITTEN_TAGS_DATA, book_ids, default = [])
+        updates = {}
+        written_updates = {}
+        for book_id, tags in new_tags.items():
+            current = list(current_tags.get(book_id) or ())
+            written = set(written_tags.get(book_id) or ())
+            updated = current
+            if self.replace:
+                updated = [tag for tag in current if tag not in written or tag in tags]
+            updated = updated + [tag for tag in tags if tag not in current]
+            # The tags that the book already had are not ours to remove later.
+            written_updated = sorted(tag for tag in updated if tag in written or tag not in current)
+            if sorted(updated) != sorted(current):
+                updates[book_id] = updated
+            if written_updated != sorted(written):
+                written_updates[book_id] = written_updated
+        if not self.dry_run:
+            if updates:
+                self.db.set_field('tags', updates)
+            if written_updates:
+                self.db.add_custom_book_data(WRITTEN_TAGS_DATA, written_updates)
+        return len(updates)
+
+
+def create_parser(prog):
+    parser = argparse.ArgumentParser(
+        prog = 'calibre-debug -r "{}" --'.format(prog),
+        description = 'Get tags from Goodreads for all books in a library that have a Goodreads identifier.',
+    )
+    parser.add_argument(
+        '--library',
+        help = 'The path of the calibre library. Defaults to the current library.',
+    )
+    parser.add_argument(
+        '--batch-size',
+        type = int,
+        default = 100,
+        help = 'The amount of books to write to the library at once. Defaults to %(default)s.',
+    )
+    parser.add_argument(
+        '--replace',
+        action = 'store_true',
+        help = (
+            'Remove the tags that were added by an earlier run once they no longer apply, instead of only adding tags. '
+            'Other tags of the books are always kept.'
+        ),
+    )
+    parser.add_argument(
+        '--restart',
+        action = 'store_true',
+        help = 'Start from the beginning, instead of resuming an interrupted run.',
+    )
+    parser.add_argument(
+        '--dry-run',
+        action = 'store_true',
+        help = 'Do not write anything to the library.',
+    )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        '--rescore',
+        action = 'store_true',
+        help = (
+            'Recompute the tags from the cached shelves with the current mappings and thresholds, without contacting '
+            'Goodreads. Books of which the shelves are not cached are skipped.'
+        ),
+    )
+    mode.add_argument(
+        '--record',
+        metavar = 'FILE',
+        help = 'Store the shelf pages that are retrieved from Goodreads in this archive (a zip file).',
+    )
+    mode.add_argument(
+        '--replay',
+        metavar = 'FILE',
+        help = 'Read the shelf pages from this archive instead of retrieving them from Goodreads.',
+    )
+    parser.add_argument(
+        '--metrics',
+        metavar = 'FILE',
+        help = 'Periodically write metrics (request counts, cache hits, fetch latencies, etc.) to this file.',
+    )
+    parser.add_argument(
+        '--metrics-format',
+        choices = FORMATS,
+        default = FORMAT_JSON,
+        help = 'The format of the metrics file. Defaults to %(default)s.',
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type = float,
+        default = 60,
+        metavar = 'SECONDS',
+        help = 'How often to write the metrics file. Defaults to every %(default)s seconds.',
+    )
+    parser.add_argument(
+        '--verbose',
+        action = 'store_true',
+        help = 'Show the debug output of the workers.',
+    )
+    return parser
+
+
+def main(plugin, argv):
+    from calibre.library import db as get_db
+    from calibre.utils.logging import DEBUG, WARN, ThreadSafeLog
+
+    opts = create_parser(argv[0]).parse_args(argv[1:])
+    if opts.library is None:
+        from calibre.utils.config import prefs
+        opts.library = prefs['library_path']
+    if not opts.library:
+        print('No library found, use --library to specify one', file = sys.stderr)
+        return 1
+
+    archive = None
+    if opts.record:
+        archive = ShelfArchive(opts.record, MODE_RECORD)
+    elif opts.replay:
+        try:
+            archive = ShelfArchive(opts.replay, MODE_REPLAY)
+        except (IOError, OSError) as e:
+            print('Unable to open archive {}: {}'.format(opts.replay, e), file = sys.stderr)
+            return 1
+
+    tagger = BulkTagger(
+        plugin,
+        get_db(opts.library).new_api,
+        ThreadSafeLog(level = DEBUG if opts.verbose else WARN),
+        os.path.join(os.path.dirname(get_cache_path()), 'goodreads-more-tags-bulk.json'),
+        batch_size = max(1, opts.batch_size),
+        replace = opts.replace,
+        dry_run = opts.dry_run,
+        archive = archive,
+    )
+    exporter = None
+    if opts.metrics:
+        exporter = MetricsExporter(metrics, opts.metrics, opts.metrics_format, max(1, opts.metrics_interval))
+        exporter.start()
+    try:
+        if opts.rescore:
+            if not tagger.rescore():
+                print('The cache is disabled, so there are no shelves to recompute the tags from', file = sys.stderr)
+                return 1
+        else:
+            tagger.run(resume = not opts.restart)
+    except KeyboardInterrupt:
+        print('Interrupted, run again to resume', file = sys.stderr)
+        return 1
+    finally:
+        if exporter is not None:
+            exporter.stop()
+        if archive is not None:
+            archive.close()
+    return 0
@@ -0,0 +1,214 @@
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from collections import namedtuple
+import json
+import os.path
+import sqlite3
+import time
+from threading import RLock
+
+from .prefs import CONFIG_LOCATION
+from .settings import get_settings
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# How many writes to do between checks whether the cache has grown beyond its maximum size.
+EVICT_INTERVAL = 100
+# The maximum amount of identifiers to look up in a single query, to stay below the variable limit of sqlite.
+MAX_VARIABLES = 500
+
+# Columns that have been added after the first version of the table, with their definition.
+ADDED_COLUMNS = (
+    ('etag', 'TEXT'),
+    ('last_modified', 'TEXT'),
+)
+
+CacheEntry = namedtuple('CacheEntry', ['shelves', 'expired', 'etag', 'last_modified'])
+
+
+class ShelfCache(object):
+    """
+    A persistent cache of the shelves of Goodreads books, keyed by the Goodreads identifier.
+
+    The shelves are stored as the parsed shelf name -> count dict, so that no network access or parsing is needed for a
+    cached book. Entries expire after the ttl (in seconds), and once there are more than size entries the least recently
+    used ones are evicted.
+
+    Expired entries are kept together with the validators (ETag/Last-Modified) of the response they came from, so that
+    they can be revalidated with a conditional request instead of always being retrieved again.
+
+    This is safe to use from multiple threads at the same time.
+    """
+    def __init__(self, path, ttl, size):
+        self.path = path
+        self.ttl = ttl
+        self.size = size
+
+        self.lock = RLock()
+        self.writes = 0
+        self.stats = { 'hit': 0, 'revalidated': 0, 'miss': 0 }
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, timeout = 30, check_same_thread = False)
+        with self.lock, self.connection:
+            self.connection.execute((
+                'CREATE TABLE IF NOT EXISTS shelves ('
+                'identifier TEXT PRIMARY KEY, '
+                'shelves TEXT NOT NULL, '
+                'fetched REAL NOT NULL, '
+                'accessed REAL NOT NULL'
+                ')'
+            ))
+            self.connection.execute('CREATE INDEX IF NOT EXISTS shelves_accessed ON shelves (accessed)')
+            columns = [row[1] for row in self.connection.execute('PRAGMA table_info(shelves)')]
+            for name, definition in ADDED_COLUMNS:
+                if name not in columns:
+                    self.connection.execute('ALTER TABLE shelves ADD COLUMN {} {}'.format(name, definition))
+
+    def get(self, identifier):
+        """ Get the shelves for the given identifier, or None if these are not cached (or have expired). """
+        entry = self.get_entry(identifier)
+        if entry is None or entry.expired:
+            return None
+        return entry.shelves
+
+    def get_entry(self, identifier):
+        """ Get the CacheEntry for the given identifier, including expired ones, or None if it is not cached. """
+        now = time.time()
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT shelves, fetched, etag, last_modified FROM shelves WHERE identifier = ?',
+                (identifier,),
+            ).fetchone()
+            if row is None:
+                return None
+            self.connection.execute('UPDATE shelves SET accessed = ? WHERE identifier = ?', (now, identifier))
+        return CacheEntry(json.loads(row[0]), row[1] + self.ttl < now, row[2], row[3])
+
+    def get_many(self, identifiers):
+        """
+        Get the shelves for all of the given identifiers that are cached, including expired ones, as an identifier ->
+        shelves dict.
+
+        This does not count as an access for the eviction, as it is meant for going over (large parts of) the cache.
+        """
+        identifiers = list(identifiers)
+        result = {}
+        with self.lock:
+            for offset in range(0, len(identifiers), MAX_VARIABLES):
+                chunk = identifiers[offset:offset + MAX_VARIABLES]
+                placeholders = ', '.join('?' * len(chunk))
+                rows = self.connection.execute(
+                    'SELECT identifier, shelves FROM shelves WHERE identifier IN ({})'.format(placeholders),
+                    chunk,
+                )
+                result.update((identifier, json.loads(shelves)) for identifier, shelves in rows)
+        return result
+
+    def set(self, identifier, shelves, etag = None, last_modified = None):
+        """ Store the shelves for the given identifier, with the validators of the response they came from. """
+        now = time.time()
+        with self.lock:
+            with self.connection:
+                self.connection.execute(
+                    (
+                        'INSERT OR REPLACE INTO shelves (identifier, shelves, fetched, accessed, etag, last_modified) '
+                        'VALUES (?, ?, ?, ?, ?, ?)'
+                    ),
+                    (identifier, json.dumps(shelves), now, now, etag, last_modified),
+                )
+            self.writes += 1
+            if self.writes % EVICT_INTERVAL == 0:
+                self.evict()
+
+    def touch(self, identifier):
+        """ Mark the shelves for the given identifier as fresh, e.g. after Goodreads indicated these did not change. """
+        now = time.time()
+        with self.lock, self.connection:
+            self.connection.execute(
+                'UPDATE shelves SET fetched = ?, accessed = ? WHERE identifier = ?',
+                (now, now, identifier),
+            )
+
+    def record(self, outcome):
+        """ Record the outcome of a lookup (hit, revalidated or miss) for the statistics. """
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def format_stats(self):
+        """
+        Get a description of the ratios of the outcomes of the lookups.
+
+        >>> cache = ShelfCache(':memory:', 0, 0)
+        >>> cache.record('hit'); cache.record('hit'); cache.record('hit'); cache.record('miss')
+        >>> cache.format_stats()
+        'hits 75%, revalidated 0%, misses 25% (of 4 lookups)'
+        """
+        with self.lock:
+            stats = dict(self.stats)
+        total = sum(stats.values())
+        ratios = { outcome: (100 * count // total) if total else 0 for outcome, count in stats.items() }
+        return 'hits {hit}%, revalidated {revalidated}%, misses {miss}% (of {total} lookups)'.format(
+            total = total,
+            **ratios
+        )
+
+    def evict(self):
+        """ Remove the least recently used entries until the cache is no larger than its maximum size. """
+        with self.lock, self.connection:
+            self.connection.execute(
+                'DELETE FROM shelves WHERE identifier IN ('
+                'SELECT identifier FROM shelves ORDER BY accessed DESC LIMIT -1 OFFSET ?'
+                ')',
+                (self.size,),
+            )
+
+    def clear(self):
+        """ Remove all entries from the cache. """
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM shelves')
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute('SELECT COUNT(*) FROM shelves').fetchone()[0]
+
+
+_instances = {}
+_instances_lock = RLock()
+
+
+def get_cache_path():
+    """ Get the location of the cache file, next to the preferences file in the calibre config dir. """
+    # Looked up at call time, as the config dir can be changed after this module has been imported (e.g. in tests).
+    import calibre.constants
+    return os.path.join(calibre.constants.config_dir, CONFIG_LOCATION + '-cache.sqlite')
+
+
+def _get_instance(path, settings):
+    """ Get the ShelfCache for the given path, configured according to the given Settings. """
+    with _instances_lock:
+        if path not in _instances:
+            _instances[path] = ShelfCache(path, settings.cache_ttl, settings.cache_size)
+        cache = _instances[path]
+    cache.ttl = settings.cache_ttl
+    cache.size = settings.cache_size
+    return cache
+
+
+def get_cache(settings):
+    """ Get the shared ShelfCache, or None if the cache is disabled in the given Settings. """
+    if not settings.cache_enabled:
+        return None
+    return _get_instance(get_cache_path(), settings)
+
+
+def clear_cache():
+    """ Clear the shared ShelfCache, regardless of whether it is currently enabled. """
+    path = get_cache_path()
+    if path in _instances or os.path.exists(path):
+        _get_instance(path, get_settings()).clear()
@@ -1,176 +1,32 @@
 from __future__ import print_function
 
-from copy import deepcopy
 from textwrap import dedent
 
 from calibre.ebooks.txt.processor import convert_markdown
-from calibre.gui2 import get_current_db, question_dialog
+from calibre.gui2 import error_dialog, get_current_db, question_dialog
 from calibre.gui2.complete2 import EditWithComplete
 from calibre.gui2.metadata.config import ConfigWidget as DefaultConfigWidget
-from calibre.utils.config import JSONConfig
-try:
-    from PyQt5 import Qt as QtGui, QtCore, QtWidgets
-    import PyQt5.Qt as qt
-except ImportError:
-    from PyQt4 import QtGui, QtCore, QtWidgets
-    import PyQt4.Qt as qt
+from PyQt5 import Qt as QtGui, QtCore, QtWidgets
+import PyQt5.Qt as qt
+
+from .prefs import (
+    plugin_prefs,
+    KEY_CACHE_ENABLED, KEY_CACHE_SIZE, KEY_CACHE_TTL,
+    KEY_INTEGRATION_ENABLED, KEY_INTEGRATION_HOST_LIMIT, KEY_INTEGRATION_POOL_SIZE, KEY_INTEGRATION_STREAMING,
+    KEY_INTEGRATION_TIMEOUT,
+    KEY_RETRIEVAL_ATTEMPTS, KEY_RETRIEVAL_DEADLINE, KEY_RETRIEVAL_KEEP_ALIVE, KEY_RETRIEVAL_PAGES, KEY_RETRIEVAL_RATE,
+    KEY_RETRIEVAL_STREAM, KEY_RETRIEVAL_TIMEOUT,
+    KEY_SHELF_MAPPINGS,
+    KEY_THRESHOLD_ABSOLUTE, KEY_THRESHOLD_PERCENTAGE, KEY_THRESHOLD_PERCENTAGE_OF,
+    DEFAULT_SHELF_MAPPINGS,
+)
+from .mappings import validate_key
 
 __license__ = 'BSD 3-clause'
 __copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
 __docformat__ = 'markdown en'
 
 
-class NestingJSONConfig(JSONConfig):
-    """ A JSONConfig that allows passing keys like ['foo', 'bar'] to mean ['foo']['bar']. """
-    def _get_option_root(self, root, keys, create_as_needed = True):
-        for key in keys[:-1]:
-            if key not in root and create_as_needed:
-                root[key] = {}
-            root = root[key]
-        return root
-
-    def get(self, keys):
-        root = self._get_option_root(self, keys)
-        if keys[-1] not in root:
-            root[keys[-1]] = self.get_default(keys)
-        return root[keys[-1]]
-
-    def set(self, keys, value):
-        root = self._get_option_root(self, keys)
-        root[keys[-1]] = value
-
-    def get_default(self, keys):
-        root = self._get_option_root(self.defaults, keys, False)
-        return root[keys[-1]]
-
-    def set_default(self, keys, value):
-        root = self._get_option_root(self.defaults, keys)
-        root[keys[-1]] = value
-
-    def rename(self, old, new):
-        try:
-            old_root = self._get_option_root(self, old, False)
-            self.set(new, old_root[old[-1]])
-            del old_root[old[-1]]
-        except KeyError:
-            return
-
-        old.pop()
-        old_root = self._get_option_root(self, old, False)
-        while old and len(old_root[old[-1]]) == 0:
-            remove = old.pop()
-            del old_root[remove]
-            old_root = self._get_option_root(self, old, False)
-
-
-CONFIG_LOCATION = 'plugins/goodreads-more-tags'
-
-CATEGORY_THRESHOLD = 'thresholds'
-CATEGORY_INTEGRATION = 'goodreadsPluginIntegration'
-
-KEY_THRESHOLD_ABSOLUTE = [CATEGORY_THRESHOLD, 'absolute']
-KEY_THRESHOLD_PERCENTAGE = [CATEGORY_THRESHOLD, 'percentage']
-KEY_THRESHOLD_PERCENTAGE_OF = [CATEGORY_THRESHOLD, 'percentageOf']
-KEY_INTEGRATION_ENABLED = [CATEGORY_INTEGRATION, 'enabled']
-KEY_INTEGRATION_TIMEOUT = [CATEGORY_INTEGRATION, 'timeout']
-KEY_SHELF_MAPPINGS = ['shelfMappings']
-
-DEFAULT_THRESHOLD_ABSOLUTE = 10
-DEFAULT_THRESHOLD_PERCENTAGE = 30
-DEFAULT_THRESHOLD_PERCENTAGE_OF = [3, 4]
-DEFAULT_INTEGRATION_ENABLED = True
-DEFAULT_INTEGRATION_TIMEOUT = 10
-DEFAULT_SHELF_MAPPINGS = {
-    'adult': ['Adult'],
-    'adult-fiction': ['Adult'],
-    'adventure': ['Adventure'],
-    'anthologies': ['Anthologies'],
-    'art': ['Art'],
-    'biography': ['Biography'],
-    'business': ['Business'],
-    'chick-lit': ['Chick-lit'],
-    'childrens': ['Childrens'],
-    'classics': ['Classics'],
-    'comedy': ['Humour'],
-    'comics': ['Comics'],
-    'comics-manga': ['Comics'],
-    'contemporary': ['Contemporary'],
-    'cookbooks': ['Cookbooks'],
-    'crime': ['Crime'],
-    'essays': ['Writing'],
-    'fantasy': ['Fantasy'],
-    'feminism': ['Feminism'],
-    'gardening': ['Gardening'],
-    'gay': ['Gay'],
-    'graphic-novels': ['Comics'],
-    'graphic-novels-comics': ['Comics'],
-    'graphic-novels-comics-manga': ['Comics'],
-    'health': ['Health'],
-    'historical-fiction': ['Historical', 'Fiction'],
-    'history': ['History'],
-    'horror': ['Horror'],
-    'humor': ['Humour'],
-    'inspirational': ['Inspirational'],
-    'lgbt': ['Gay'],
-    'manga': ['Comics'],
-    'memoir': ['Biography'],
-    'modern': ['Modern'],
-    'music': ['Music'],
-    'mystery': ['Mystery'],
-    'non-fiction': ['Non-Fiction'],
-    'paranormal': ['Paranormal'],
-    'philosophy': ['Philosophy'],
-    'poetry': ['Poetry'],
-    'politics': ['Politics'],
-    'psychology': ['Psychology'],
-    'reference': ['Reference'],
-    'religion': ['Religion'],
-    'romance': ['Romance'],
-    'sci-fi-and-fantasy': ['Science Fiction', 'Fantasy'],
-    'sci-fi-fantasy': ['Science Fiction', 'Fantasy'],
-    'science': ['Science'],
-    'science-fiction': ['Science Fiction'],
-    'science-fiction-fantasy': ['Science Fiction', 'Fantasy'],
-    'self-help': ['Self Help'],
-    'sf-fantasy': ['Science Fiction', 'Fantasy'],
-    'sociology': ['Sociology'],
-    'spirituality': ['Spirituality'],
-    'suspense': ['Suspense'],
-    'thriller': ['Thriller'],
-    'travel': ['Travel'],
-    'vampires': ['Vampires'],
-    'war': ['War'],
-    'western': ['Western'],
-    'writing': ['Writing'],
-    'ya': ['Young Adult'],
-    'young-adult': ['Young Adult'],
-}
-
-# Load/initialize preferences.
-plugin_prefs = NestingJSONConfig(CONFIG_LOCATION)
-plugin_prefs.set_default(KEY_THRESHOLD_ABSOLUTE, DEFAULT_THRESHOLD_ABSOLUTE)
-plugin_prefs.set_default(KEY_THRESHOLD_PERCENTAGE, DEFAULT_THRESHOLD_PERCENTAGE)
-plugin_prefs.set_default(KEY_THRESHOLD_PERCENTAGE_OF, DEFAULT_THRESHOLD_PERCENTAGE_OF)
-plugin_prefs.set_default(KEY_INTEGRATION_ENABLED, DEFAULT_INTEGRATION_ENABLED)
-plugin_prefs.set_default(KEY_INTEGRATION_TIMEOUT, DEFAULT_INTEGRATION_TIMEOUT)
-plugin_prefs.set_default(KEY_SHELF_MAPPINGS, deepcopy(DEFAULT_SHELF_MAPPINGS))
-
-# Migrate settings.
-renamed = (
-    # Old, misspelled options.
-    (['options', 'tresholdAbsolute'], KEY_THRESHOLD_ABSOLUTE),
-    (['options', 'tresholdPercentage'], KEY_THRESHOLD_PERCENTAGE),
-    (['options', 'tresholdPercentageOf'], KEY_THRESHOLD_PERCENTAGE_OF),
-    # Options from when everything was a single category.
-    (['options', 'thresholdAbsolute'], KEY_THRESHOLD_ABSOLUTE),
-    (['options', 'thresholdPercentage'], KEY_THRESHOLD_PERCENTAGE),
-    (['options', 'thresholdPercentageOf'], KEY_THRESHOLD_PERCENTAGE_OF),
-    (['options', 'shelfMappings'], KEY_SHELF_MAPPINGS),
-)
-for old, new in renamed:
-    plugin_prefs.rename(old, new)
-
-
 def docmd2html(text):
     """ Process a docstring with markdown to html. """
     html = convert_markdown(dedent(text))
@@ -298,13 +154,25 @@ class ShelfTagMappingWidget(qt.QWidget):
         shelf, ok = qt.QInputDialog.getText(
             self,
             'Add new mapping',
-            'Enter the Goodreads shelf name to create a mapping for:',
+            (
+                'Enter the Goodreads shelf name to create a mapping for.\n\n'
+                'This can also be a pattern like *-fantasy, or a regular expression like re:sci-?fi-.*'
+            ),
         )
         if not ok:
             return
         shelf = shelf.strip()
         if not shelf:
             return
+        error = validate_key(shelf)
+        if error is not None:
+            error_dialog(
+                self,
+                'Invalid pattern',
+                'The pattern "{}" is not a valid regular expression: {}'.format(shelf, error),
+                show = True,
+            )
+            return
 
         # Add an empty mapping, unless one already exists for this shelf.
         mappings = self.get_mappings()
@@ -466,6 +334,8 @@ class ConfigWidget(DefaultConfigWidget):
         # Add all groupboxes for the various settings.
         self.add_groupbox_thresholds()
         self.add_groupbox_goodreads_plugin_integration()
+        self.add_groupbox_cache()
+        self.add_groupbox_retrieval()
 
         # Finally, we add a custom widget to manage the shelf -> tags mappings.
         self.table = ShelfTagMappingWidget(self, plugin_prefs.get(KEY_SHELF_MAPPINGS))
@@ -603,6 +473,178 @@ class ConfigWidget(DefaultConfigWidget):
             already. If we've not received any ids from it, we will continue as if integration were not enabled.
         '''))
 
+        # A setting to determine how many books to retrieve the shelves for at the same time.
+        self.pool_size = qt.QSpinBox()
+        self.pool_size.setMinimum(1)
+        self.pool_size.setMaximum(64)
+        self.pool_size.setValue(plugin_prefs.get(KEY_INTEGRATION_POOL_SIZE))
+        gb.l.addRow('Workers', self.pool_size, description = docmd2html('''
+            The maximum amount of books to retrieve the shelves for at the same time.
+
+            The Goodreads plugin can return many results for a single book, and when downloading metadata for multiple
+            books several of these can be running at the same time. All of these share this amount of workers, with
+            any remaining books waiting until a worker becomes available.
+        '''))
+
+        # A setting to limit the amount of concurrent requests to Goodreads.
+        self.host_limit = qt.QSpinBox()
+        self.host_limit.setMinimum(1)
+        self.host_limit.setMaximum(64)
+        self.host_limit.setValue(plugin_prefs.get(KEY_INTEGRATION_HOST_LIMIT))
+        gb.l.addRow('Concurrent requests', self.host_limit, description = docmd2html('''
+            The maximum amount of requests to Goodreads that can be running at the same time.
+        '''))
+
+        # A setting to pass on results as soon as they are available.
+        self.streaming = qt.QCheckBox()
+        self.streaming.setChecked(plugin_prefs.get(KEY_INTEGRATION_STREAMING))
+        gb.l.addRow('Stream results', self.streaming, description = docmd2html('''
+            Whether to pass on the tags for a Goodreads result as soon as they are available.
+
+            If this is not enabled, the tags for all results are only passed on once all of them are done, meaning the
+            slowest result holds back all others, and no tags are provided at all if the metadata download is aborted.
+        '''))
+
+    def add_groupbox_cache(self):
+        gb = self.gb_cache = self.add_groupbox('Cache')
+
+        # A setting to enable/disable the cache entirely.
+        self.cache_enabled = qt.QCheckBox()
+        self.cache_enabled.setChecked(plugin_prefs.get(KEY_CACHE_ENABLED))
+        gb.l.addRow('Enabled', self.cache_enabled, description = docmd2html('''
+            Whether to keep a cache of the shelves of the books that have been looked up before.
+
+            If this is enabled, the shelves of a book are only retrieved from Goodreads if they are not in the cache
+            yet, or if the cached shelves have expired. This greatly speeds up downloading metadata for books that have
+            been downloaded before. The thresholds and mappings are still applied every time, so changes to these take
+            effect immediately.
+        '''))
+
+        # A setting to determine how long cached shelves remain valid.
+        self.cache_ttl = qt.QSpinBox()
+        self.cache_ttl.setMinimum(0)
+        self.cache_ttl.setMaximum(3650)
+        self.cache_ttl.setSuffix(' days')
+        self.cache_ttl.setValue(plugin_prefs.get(KEY_CACHE_TTL))
+        gb.l.addRow('Expire after', self.cache_ttl, description = docmd2html('''
+            The amount of time (in days) after which the cached shelves of a book are considered outdated, after which
+            they will be retrieved from Goodreads again.
+        '''))
+
+        # A setting to determine the maximum size of the cache.
+        self.cache_size = qt.QSpinBox()
+        self.cache_size.setMinimum(0)
+        self.cache_size.setMaximum(10000000)
+        self.cache_size.setValue(plugin_prefs.get(KEY_CACHE_SIZE))
+        gb.l.addRow('Maximum size', self.cache_size, description = docmd2html('''
+            The maximum amount of books to keep in the cache. When the cache grows beyond this size, the books that
+            have not been used for the longest time are removed from it.
+        '''))
+
+        # A button to clear the cache.
+        clear_button = qt.QPushButton('Clear cache')
+        clear_button.clicked.connect(self.clear_cache)
+        gb.l.addRow('', clear_button, description = docmd2html('''
+            Remove all cached shelves, forcing them to be retrieved from Goodreads again.
+        '''))
+
+    def clear_cache(self):
+        # Prompt for confirmation.
+        if not question_dialog(
+            self,
+            _('Are you sure?'),
+            'Are you sure you want to remove all cached shelves?',
+        ):
+            return
+
+        from .cache import clear_cache
+        clear_cache()
+
+    def add_groupbox_retrieval(self):
+        gb = self.gb_retrieval = self.add_groupbox('Retrieval')
+
+        # A setting to determine how many pages of shelves to retrieve.
+        self.retrieval_pages = qt.QSpinBox()
+        self.retrieval_pages.setMinimum(1)
+        self.retrieval_pages.setMaximum(100)
+        self.retrieval_pages.setValue(plugin_prefs.get(KEY_RETRIEVAL_PAGES))
+        gb.l.addRow('Pages', self.retrieval_pages, description = docmd2html('''
+            The maximum amount of pages of shelves to retrieve from Goodreads for a book. Each page contains 100
+            shelves, sorted by the amount of people that have put the book on that shelf.
+
+            For popular books the first page may not include less common shelves, even if many people have put the book
+            on those. Retrieving more pages makes it possible to get tags for these as well, at the cost of more
+            requests to Goodreads. The additional pages are retrieved at the same time, and only as far as the book
+            actually has shelves.
+        '''))
+
+        # A setting to process the pages while they are being received.
+        self.retrieval_stream = qt.QCheckBox()
+        self.retrieval_stream.setChecked(plugin_prefs.get(KEY_RETRIEVAL_STREAM))
+        gb.l.addRow('Stream pages', self.retrieval_stream, description = docmd2html('''
+            Whether to request the pages of shelves compressed, and to process them while they are being received.
+
+            This reduces the amount of data transferred, and the amount of memory needed when many books are looked up
+            at the same time. Receiving a page stops as soon as all its shelves have been found. If a page cannot be
+            processed this way, it is retrieved again without streaming.
+        '''))
+
+        # A setting to limit the rate of requests to Goodreads.
+        self.retrieval_rate = qt.QDoubleSpinBox()
+        self.retrieval_rate.setMinimum(0)
+        self.retrieval_rate.setMaximum(100)
+        self.retrieval_rate.setDecimals(1)
+        self.retrieval_rate.setSingleStep(0.5)
+        self.retrieval_rate.setSuffix(' per second')
+        self.retrieval_rate.setSpecialValueText('Unlimited')
+        self.retrieval_rate.setValue(plugin_prefs.get(KEY_RETRIEVAL_RATE))
+        gb.l.addRow('Maximum request rate', self.retrieval_rate, description = docmd2html('''
+            The maximum amount of requests per second to Goodreads, for all downloads together.
+
+            When Goodreads indicates that it is receiving too many requests, the rate is temporarily lowered, and it is
+            then gradually raised back to this value.
+        '''))
+
+        # Settings to determine how failed requests are retried.
+        self.retrieval_attempts = qt.QSpinBox()
+        self.retrieval_attempts.setMinimum(1)
+        self.retrieval_attempts.setMaximum(10)
+        self.retrieval_attempts.setValue(plugin_prefs.get(KEY_RETRIEVAL_ATTEMPTS))
+        gb.l.addRow('Attempts', self.retrieval_attempts, description = docmd2html('''
+            The maximum amount of times to try to retrieve a page of shelves. Only failures that may be temporary (like
+            timeouts, connection problems and server errors) are retried, with an increasing, random delay between the
+            attempts.
+        '''))
+
+        self.retrieval_timeout = qt.QSpinBox()
+        self.retrieval_timeout.setMinimum(1)
+        self.retrieval_timeout.setMaximum(600)
+        self.retrieval_timeout.setSuffix(' seconds')
+        self.retrieval_timeout.setValue(plugin_prefs.get(KEY_RETRIEVAL_TIMEOUT))
+        gb.l.addRow('Timeout per attempt', self.retrieval_timeout, description = docmd2html('''
+            The maximum amount of time to wait for a response from Goodreads in a single attempt.
+        '''))
+
+        self.retrieval_deadline = qt.QSpinBox()
+        self.retrieval_deadline.setMinimum(1)
+        self.retrieval_deadline.setMaximum(3600)
+        self.retrieval_deadline.setSuffix(' seconds')
+        self.retrieval_deadline.setValue(plugin_prefs.get(KEY_RETRIEVAL_DEADLINE))
+        gb.l.addRow('Total timeout', self.retrieval_deadline, description = docmd2html('''
+            The maximum amount of time to spend on all attempts to retrieve a page of shelves together. During a
+            metadata download, the timeout of the download itself is used instead if that is shorter.
+        '''))
+
+        # A setting to reuse connections to Goodreads.
+        self.retrieval_keep_alive = qt.QCheckBox()
+        self.retrieval_keep_alive.setChecked(plugin_prefs.get(KEY_RETRIEVAL_KEEP_ALIVE))
+        gb.l.addRow('Reuse connections', self.retrieval_keep_alive, description = docmd2html('''
+            Whether to keep the connections to Goodreads open between requests, instead of setting up a new connection
+            for every request.
+
+            This is not used if calibre is configured to use a proxy.
+        '''))
+
     def commit(self):
         DefaultConfigWidget.commit(self)
 
@@ -610,8 +652,27 @@ class ConfigWidget(DefaultConfigWidget):
         plugin_prefs.set(KEY_THRESHOLD_ABSOLUTE, self.threshold_abs.value())
         plugin_prefs.set(KEY_THRESHOLD_PERCENTAGE, self.threshold_pct.value())
         plugin_prefs.set(KEY_THRESHOLD_PERCENTAGE_OF, [int(idx.strip()) for idx in self.threshold_pct_of.text().split(',')])
+        plugin_prefs.set(KEY_INTEGRATION_ENABLED, self.goodreads_enabled.isChecked())
+        plugin_prefs.set(KEY_INTEGRATION_TIMEOUT, self.goodreads_timeout.value())
+        plugin_prefs.set(KEY_INTEGRATION_POOL_SIZE, self.pool_size.value())
+        plugin_prefs.set(KEY_INTEGRATION_HOST_LIMIT, self.host_limit.value())
+        plugin_prefs.set(KEY_INTEGRATION_STREAMING, self.streaming.isChecked())
+        plugin_prefs.set(KEY_CACHE_ENABLED, self.cache_enabled.isChecked())
+        plugin_prefs.set(KEY_CACHE_TTL, self.cache_ttl.value())
+        plugin_prefs.set(KEY_CACHE_SIZE, self.cache_size.value())
+        plugin_prefs.set(KEY_RETRIEVAL_PAGES, self.retrieval_pages.value())
+        plugin_prefs.set(KEY_RETRIEVAL_STREAM, self.retrieval_stream.isChecked())
+        plugin_prefs.set(KEY_RETRIEVAL_RATE, self.retrieval_rate.value())
+        plugin_prefs.set(KEY_RETRIEVAL_ATTEMPTS, self.retrieval_attempts.value())
+        plugin_prefs.set(KEY_RETRIEVAL_TIMEOUT, self.retrieval_timeout.value())
+        plugin_prefs.set(KEY_RETRIEVAL_DEADLINE, self.retrieval_deadline.value())
+        plugin_prefs.set(KEY_RETRIEVAL_KEEP_ALIVE, self.retrieval_keep_alive.isChecked())
         plugin_prefs.set(KEY_SHELF_MAPPINGS, self.table.get_mappings())
 
+        # Make sure the new settings are used for the next identify.
+        from .settings import invalidate_settings
+        invalidate_settings()
+
     def resizeEvent(self, event):
         DefaultConfigWidget.resizeEvent(self, event)
 
@@ -0,0 +1,207 @@
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+import socket
+from threading import Lock
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# The maximum amount of redirects to follow for a single request.
+MAX_REDIRECTS = 5
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+# When a response is closed before it has been read completely, the rest of it is still read if it is at most this many
+# bytes, so that the connection can be reused. Otherwise, the connection is closed.
+DRAIN_LIMIT = 16 * 1024
+# The amount of bytes to read at a time while draining a response of which the length is not known (chunked responses).
+DRAIN_CHUNK_SIZE = 4096
+
+
+class ConnectionPool(object):
+    """
+    A pool of persistent (keep-alive) connections to a single host.
+
+    At most size idle connections are kept. If more connections are needed at the same time these are created as needed,
+    and discarded again once they are done.
+    """
+    def __init__(self, scheme, host, size):
+        self.connection_class = HTTPSConnection if scheme == 'https' else HTTPConnection
+        self.host = host
+        self.size = size
+        self.lock = Lock()
+        self.idle = []
+        self.stats = { 'created': 0, 'reused': 0 }
+
+    def acquire(self, timeout):
+        """ Get a connection, which is reused if possible. Returns the connection and whether it was reused. """
+        with self.lock:
+            if self.idle:
+                connection = self.idle.pop()
+                self.stats['reused'] += 1
+                reused = True
+            else:
+                connection = None
+                self.stats['created'] += 1
+                reused = False
+        if connection is None:
+            connection = self.connection_class(self.host, timeout = timeout)
+        else:
+            connection.timeout = timeout
+            if connection.sock is not None:
+                connection.sock.settimeout(timeout)
+        return connection, reused
+
+    def release(self, connection):
+        """ Return a connection to the pool after its response has been read completely. """
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(connection)
+                return
+        connection.close()
+
+    def discard(self, connection):
+        """ Close a connection that cannot be reused. """
+        connection.close()
+
+    def clear(self):
+        """ Close all idle connections. """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+class PooledResponse(object):
+    """
+    A response of a pooled connection, with the parts of the interface of a mechanize response that are used here.
+
+    The connection is returned to the pool once the response has been read completely or is closed.
+    """
+    def __init__(self, pool, connection, response, url):
+        self.pool = pool
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.code = response.status
+
+    def geturl(self):
+        return self.url
+
+    def info(self):
+        return self.response.msg
+
+    def read(self, size = -1):
+        if self.connection is None:
+            return b''
+        data = self.response.read() if size is None or size < 0 else self.response.read(size)
+        if self.response.isclosed():
+            self.finish(True)
+        return data
+
+    def close(self):
+        if self.connection is None:
+            return
+        remaining = getattr(self.response, 'length', None)
+        reusable = False
+        if not self.response.will_close and (remaining is None or remaining <= DRAIN_LIMIT):
+            # Without a length (for a chunked response) it is only known whether the rest is small enough by reading it.
+            try:
+                drained = 0
+                while drained <= DRAIN_LIMIT and not self.response.isclosed():
+                    data = self.response.read(DRAIN_CHUNK_SIZE)
+                    if not data:
+                        break
+                    drained += len(data)
+                reusable = self.response.isclosed()
+            except (EnvironmentError, HTTPException):
+                pass
+        self.finish(reusable)
+
+    def finish(self, reusable):
+        connection, self.connection = self.connection, None
+        if reusable and not self.response.will_close:
+            self.pool.release(connection)
+        else:
+            self.response.close()
+            self.pool.discard(connection)
+
+
+class HTTPClient(object):
+    """
+    A thread safe HTTP client that keeps connections alive between requests, with a ConnectionPool per host.
+
+    This is a lot cheaper than a mechanize browser per request, as there is no browser state to set up, and for HTTPS
+    the TLS handshake is only needed once per connection instead of once per request.
+    """
+    def __init__(self, size, headers = ()):
+        self.lock = Lock()
+        self.size = size
+        self.headers = list(headers)
+        self.pools = {}
+
+    def configure(self, size):
+        """ Change the amount of idle connections to keep per host. """
+        with self.lock:
+            self.size = size
+            for pool in self.pools.values():
+                pool.size = size
+
+    def get_pool(self, scheme, host):
+        with self.lock:
+            key = (scheme, host)
+            if key not in self.pools:
+                self.pools[key] = ConnectionPool(scheme, host, self.size)
+            return self.pools[key]
+
+    def open(self, url, headers = (), timeout = None):
+        """
+        Make a GET request, following redirects, and return the response.
+
+        The given headers are sent in addition to (or instead of) the default headers of the client. Like mechanize,
+        this raises a HTTPError for responses with a status code other than 2xx (including 304).
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self.request(url, headers, timeout)
+            if response.code in REDIRECT_CODES and response.info().get('Location'):
+                response.close()
+                url = urljoin(url, response.info().get('Location'))
+                continue
+            if not 200 <= response.code < 300:
+                response.read()
+                raise HTTPError(url, response.code, response.response.reason, response.info(), None)
+            return response
+        raise HTTPError(url, response.code, 'Too many redirects', response.info(), None)
+
+    def request(self, url, headers, timeout):
+        """ Make a single GET request, retrying on another connection if a reused connection turns out to be closed. """
+        merged = dict(self.headers)
+        merged.update(headers)
+        parts = urlsplit(url)
+        pool = self.get_pool(parts.scheme, parts.netloc)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        while True:
+            connection, reused = pool.acquire(timeout)
+            try:
+                connection.request('GET', path, headers = merged)
+                response = connection.getresponse()
+            except (EnvironmentError, HTTPException) as e:
+                pool.discard(connection)
+                # The server may have closed an idle connection in the meantime, which is not a reason to fail.
+                if reused and not isinstance(e, socket.timeout):
+                    continue
+                raise
+            return PooledResponse(pool, connection, response, url)
+
+    def clear(self):
+        """ Close all idle connections. """
+        with self.lock:
+            pools = list(self.pools.values())
+        for pool in pools:
+            pool.clear()
@@ -1,14 +1,11 @@
 from __future__ import unicode_literals
 from __future__ import with_statement
 
-try:
-    from queue import Queue, Empty
-except:
-    # Python 2.x
-    from Queue import Queue, Empty
+from queue import Queue
 from threading import Condition, Event, RLock
 
-from .config import plugin_prefs, KEY_INTEGRATION_ENABLED
+from .settings import get_settings
+from .sync import Channel, ChannelTimeoutError, wait_for
 
 
 # The goals of is to be able to provide tags for all results of the Goodreads plugin.
@@ -17,7 +14,7 @@ from .config import plugin_prefs, KEY_INTEGRATION_ENABLED
 # plugin.
 
 
-class QueueTimeoutError(Exception):
+class QueueTimeoutError(ChannelTimeoutError):
     pass
 
 
@@ -66,7 +63,7 @@ class QueueHandler(object):
                 self.conditions[abort] = Condition(self.lock)
             condition = self.conditions[abort]
             with condition:
-                if not condition.wait(timeout):
+                if not wait_for(condition, lambda: getattr(condition, 'queue', None) is not None, timeout):
                     raise QueueTimeoutError()
             return condition.queue
 
@@ -80,50 +77,18 @@ class QueueHandler(object):
             del self.queues[abort]
 
 
-class TemporaryQueue(object):
+class TemporaryQueue(Channel):
     """
     Similar to a normal queue, but with a limited lifetime.
 
-    Data can be added and read until the queue is killed, at which point all waiting consumers receive None, and no
-    further data can be added.
+    Data can be added and read until the queue is killed, at which point all waiting consumers receive None (once the
+    remaining data has been read), and no further data can be added. Iterating over it yields the data until then.
     """
-    def __init__(self):
-        self.done = Event()
-        self.condition = Condition()
-        self.queue = Queue()
-
-    def put(self, data):
-        """ Add a piece of data to the queue. """
-        if self.done.is_set():
-            raise Exception('You cannot add data to a dead queue')
-        with self.condition:
-            self.queue.put(data)
-            self.condition.notify()
-
-    def get(self, timeout = None):
-        """
-        Get a piece of data from the queue.
-
-        If no data is available, this will wait until data becomes available, or until the queue is killed, in which case
-        this will return None.
-        """
-        while not self.done.is_set() or not self.queue.empty():
-            with self.condition:
-                try:
-                    result = self.queue.get_nowait()
-                    return result
-                except Empty:
-                    self.condition.wait(timeout = timeout)
-                    if not self.done.is_set() and self.queue.empty():
-                        # This means we hit the timeout, which either means the goodreads plugin is not running, or it
-                        # failed somehow.
-                        raise QueueTimeoutError()
+    timeout_error = QueueTimeoutError
 
     def kill(self):
         """ Indicates that no further data will arrive. """
-        self.done.set()
-        with self.condition:
-            self.condition.notifyAll()
+        self.close()
 
 
 class SharedData(object):
@@ -155,7 +120,7 @@ def intercept_method(instance, method, interceptor):
 def skip_if_disabled(func):
     """ A decorator for interceptor methods that skips the interceptor if the intergation is disabled. """
     def wrapper(*args, **kwargs):
-        if not plugin_prefs.get(KEY_INTEGRATION_ENABLED):
+        if not get_settings().integration_enabled:
             return func._original(*args, **kwargs)
         return func(*args, **kwargs)
     return wrapper
@@ -0,0 +1,153 @@
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from contextlib import contextmanager
+import time
+from threading import Lock
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# The stages of getting tags for a book, in the order in which these are shown. Stages that are not in here are shown
+# after these, in the order in which they were first recorded.
+STAGES = (
+    'integration-wait',
+    'queue-wait',
+    'shared-wait',
+    'rate-limit',
+    'fetch',
+    'decode',
+    'parse',
+    'map',
+    'threshold',
+    'result-wait',
+    'workers-wait',
+)
+
+
+class LazyFormat(object):
+    """
+    A log message that is only formatted when it is actually written.
+
+    The log only converts its arguments to strings if the level of the message is enabled, so passing this instead of a
+    formatted string skips the formatting (which can be expensive for e.g. a dict of all shelves) otherwise.
+
+    >>> str(LazyFormat('[{}] Found shelves: {}', 1, { 'fantasy': 10 }))
+    "[1] Found shelves: {'fantasy': 10}"
+    """
+    __slots__ = ('message', 'args', 'kwargs')
+
+    def __init__(self, message, *args, **kwargs):
+        self.message = message
+        self.args = args
+        self.kwargs = kwargs
+
+    def __str__(self):
+        return self.message.format(*self.args, **self.kwargs)
+
+    __unicode__ = __str__
+
+
+def format_size(size):
+    """
+    Format an amount of bytes in a human readable way.
+
+    >>> format_size(512)
+    '512 B'
+    >>> format_size(45678)
+    '44.6 KiB'
+    """
+    if size < 1024:
+        return '{} B'.format(size)
+    if size < 1024 * 1024:
+        return '{:.1f} KiB'.format(size / 1024)
+    return '{:.1f} MiB'.format(size / 1024 / 1024)
+
+
+def format_duration(seconds):
+    """
+    Format an amount of seconds in a human readable way, with milliseconds for short durations.
+
+    >>> format_duration(0.0123)
+    '12.3ms'
+    >>> format_duration(2.5)
+    '2.50s'
+    """
+    if seconds < 1:
+        return '{:.1f}ms'.format(seconds * 1000)
+    return '{:.2f}s'.format(seconds)
+
+
+class Timings(object):
+    """
+    The time spent in each stage of getting tags, with the amount of bytes processed in that stage (if applicable).
+
+    Each Worker keeps its own Timings, which is merged into the Timings of the session (an identify call or a bulk run)
+    once the worker is done. The times of a session are the sum over all of its workers, not the time that has passed.
+
+    This is safe to use from multiple threads at the same time.
+    """
+    def __init__(self, clock = time.time):
+        self.clock = clock
+        self.lock = Lock()
+        # Stage name -> [seconds, bytes].
+        self.stages = {}
+        self.order = []
+
+    def add(self, stage, seconds, size = 0):
+        """ Add the given amount of time and bytes to a stage. """
+        with self.lock:
+            if stage not in self.stages:
+                self.stages[stage] = [0, 0]
+                self.order.append(stage)
+            self.stages[stage][0] += seconds
+            self.stages[stage][1] += size
+
+    @contextmanager
+    def measure(self, stage):
+        """ Add the time spent in the with block to a stage. """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.add(stage, self.clock() - start)
+
+    def merge(self, other):
+        """ Add all stages of another Timings to this one. """
+        with other.lock:
+            stages = [(stage, tuple(other.stages[stage])) for stage in other.order]
+        for stage, (seconds, size) in stages:
+            self.add(stage, seconds, size)
+
+    def get(self, stage):
+        """ Get the (seconds, bytes) of a stage. """
+        with self.lock:
+            return tuple(self.stages.get(stage, (0, 0)))
+
+    def format(self):
+        """
+        Get a single line summary of all stages.
+
+        >>> timings = Timings()
+        >>> timings.add('parse', 0.25)
+        >>> timings.add('fetch', 1.5, 2048)
+        >>> timings.add('fetch', 0.5, 1024)
+        >>> timings.format()
+        'fetch 2.00s (3.0 KiB), parse 250.0ms'
+        """
+        with self.lock:
+            order = [stage for stage in STAGES if stage in self.stages]
+            order.extend(stage for stage in self.order if stage not in STAGES)
+            stages = [(stage, self.stages[stage]) for stage in order]
+        if not stages:
+            return 'nothing recorded'
+        return ', '.join(
+            '{} {} ({})'.format(stage, format_duration(seconds), format_size(size)) if size else
+            '{} {}'.format(stage, format_duration(seconds))
+            for stage, (seconds, size) in stages
+        )
+
+    __str__ = format
+    __unicode__ = format
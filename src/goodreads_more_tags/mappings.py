@@ -0,0 +1,184 @@
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from fnmatch import translate
+import re
+from threading import Lock
+
+from .prefs import plugin_prefs, KEY_SHELF_MAPPINGS
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# Mapping keys starting with this are regular expressions.
+REGEX_PREFIX = 're:'
+# Mapping keys containing any of these characters are glob patterns.
+GLOB_CHARACTERS = '*?['
+# The maximum amount of shelf names for which the result of the pattern matching is remembered.
+MEMO_SIZE = 100000
+
+SEPARATORS_PATTERN = re.compile(r'[\s_-]+')
+
+
+def normalize(shelf):
+    """
+    Normalize a shelf name, so that differences in case and separators do not matter.
+
+    >>> normalize('Sci-Fi_Fantasy')
+    'sci-fi-fantasy'
+    >>> normalize(' science  fiction ')
+    'science-fiction'
+    """
+    return SEPARATORS_PATTERN.sub('-', shelf.strip().lower())
+
+
+def get_pattern(key):
+    """
+    Get the regular expression for a mapping key, or None if the key is a plain shelf name.
+
+    >>> get_pattern('re:sci-?fi')
+    'sci-?fi'
+    >>> get_pattern('fantasy') is None
+    True
+    """
+    if key.startswith(REGEX_PREFIX):
+        return key[len(REGEX_PREFIX):]
+    if any(c in key for c in GLOB_CHARACTERS):
+        return translate(normalize(key))
+    return None
+
+
+def validate_key(key):
+    """
+    Check whether a mapping key can be used, returning a description of the problem if not, or None if it can.
+
+    >>> validate_key('re:sci-?fi')
+    >>> validate_key('re:(sci-fi')
+    'missing ), unterminated subpattern at position 0'
+    """
+    pattern = get_pattern(key)
+    if pattern is None:
+        return None
+    try:
+        re.compile(pattern)
+    except re.error as e:
+        return str(e)
+    return None
+
+
+class ShelfMapper(object):
+    """
+    A compiled version of the shelf -> tags mappings.
+
+    The keys of the mappings can be:
+
+    - A shelf name, which matches shelves with the same name after normalization.
+    - A glob pattern like `*-fantasy`, which matches the normalized shelf names.
+    - A regular expression prefixed with `re:`, like `re:sci-?fi.*`, which has to match the whole normalized name.
+
+    Shelf names are first looked up in the exact mappings, and only if these contain nothing for the shelf the patterns
+    are tried. The patterns are combined into a single regular expression, so the time this takes does not depend on the
+    amount of patterns. If multiple patterns match a shelf, only the first one (sorted by key) is used.
+
+    Keys that are not valid regular expressions are skipped, with the reason in invalid (key -> description), so that
+    a single broken mapping does not prevent all others from being used.
+
+    >>> mapper = ShelfMapper({
+    ...     'fantasy': ['Fantasy'],
+    ...     'Sci_Fi': ['Science Fiction'],
+    ...     '*-fantasy': ['Fantasy'],
+    ...     're:(sci-?fi|science-fiction)-.*': ['Science Fiction'],
+    ... })
+    >>> mapper.get('Fantasy')
+    ['Fantasy']
+    >>> mapper.get('sci-fi')
+    ['Science Fiction']
+    >>> mapper.get('urban-fantasy')
+    ['Fantasy']
+    >>> mapper.get('scifi-classics')
+    ['Science Fiction']
+    >>> mapper.get('to-read')
+    []
+    """
+    def __init__(self, mappings):
+        self.exact = {}
+        self.pattern_tags = []
+        self.memo = {}
+        self.invalid = {}
+
+        patterns = []
+        for key, tags in sorted(mappings.items()):
+            pattern = get_pattern(key)
+            if pattern is None:
+                existing = self.exact.setdefault(normalize(key), [])
+                existing.extend(tag for tag in tags if tag not in existing)
+                continue
+            error = validate_key(key)
+            if error is not None:
+                self.invalid[key] = error
+                continue
+
+            # Every pattern is wrapped in a named group, which (as it is the outermost group) will always be the
+            # lastgroup of a match, regardless of any groups in the pattern itself.
+            patterns.append('(?P<_{}>{})'.format(len(self.pattern_tags), pattern))
+            self.pattern_tags.append(tags)
+        self.pattern = None
+        self.patterns = None
+        if patterns:
+            try:
+                self.pattern = re.compile('|'.join(patterns))
+            except re.error:
+                # Patterns that are valid on their own can still conflict when combined (e.g. if they use the same
+                # group names), in which case they are tried one by one instead.
+                self.patterns = [re.compile(pattern) for pattern in patterns]
+
+    def get(self, shelf):
+        """ Get the tags that the given shelf maps to. """
+        shelf = normalize(shelf)
+        tags = self.exact.get(shelf)
+        if tags is not None:
+            return tags
+        if self.pattern is None and self.patterns is None:
+            return []
+
+        tags = self.memo.get(shelf)
+        if tags is None:
+            tags = self.match(shelf)
+            if len(self.memo) >= MEMO_SIZE:
+                self.memo.clear()
+            self.memo[shelf] = tags
+        return tags
+
+    def match(self, shelf):
+        """ Get the tags of the first pattern that matches the given normalized shelf name. """
+        if self.pattern is not None:
+            match = self.pattern.fullmatch(shelf)
+            return self.pattern_tags[int(match.lastgroup[1:])] if match else []
+        for index, pattern in enumerate(self.patterns):
+            if pattern.fullmatch(shelf):
+                return self.pattern_tags[index]
+        return []
+
+
+_mapper = None
+_mapper_source = None
+_mapper_lock = Lock()
+
+
+def get_mapper():
+    """ Get the ShelfMapper for the current mappings, building it only if these have changed since the last call. """
+    global _mapper, _mapper_source
+    mappings = plugin_prefs.get(KEY_SHELF_MAPPINGS)
+    with _mapper_lock:
+        if _mapper is None or mappings is not _mapper_source:
+            _mapper = ShelfMapper(mappings)
+            _mapper_source = mappings
+        return _mapper
+
+
+def invalidate_mapper():
+    """ Force the ShelfMapper to be rebuilt on the next call to get_mapper. """
+    global _mapper
+    with _mapper_lock:
+        _mapper = None
@@ -0,0 +1,257 @@
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import io
+import json
+import os
+from threading import Event, Lock, Thread
+import time
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+FORMAT_JSON = 'json'
+FORMAT_PROMETHEUS = 'prometheus'
+FORMATS = (FORMAT_JSON, FORMAT_PROMETHEUS)
+
+# The prefix of the metric names in the Prometheus format.
+PROMETHEUS_PREFIX = 'goodreads_more_tags_'
+
+# The percentiles that are estimated for the histograms in the JSON format.
+PERCENTILES = (50, 90, 99)
+
+# The counters, with their description.
+COUNTERS = (
+    ('requests', 'Requests made to Goodreads, including retries.'),
+    ('request_errors', 'Requests to Goodreads that failed.'),
+    ('throttled', 'Responses with which Goodreads indicated that it received too many requests.'),
+    ('cache_hits', 'Books for which the cached shelves were used.'),
+    ('cache_revalidated', 'Books for which Goodreads indicated that the expired cached shelves were still valid.'),
+    ('cache_misses', 'Books for which the shelves were retrieved from Goodreads.'),
+    ('parse_failures', 'Pages of shelves in which no shelves could be found.'),
+    ('books', 'Books for which tags were requested.'),
+    ('books_tagged', 'Books for which tags were found.'),
+    ('books_without_shelves', 'Books for which no shelves could be retrieved.'),
+    ('books_without_tags', 'Books for which no tags remained after the mapping and the thresholds.'),
+    ('identify_calls', 'Metadata downloads (identify calls) of calibre.'),
+)
+
+# The histograms, with their description and the upper bounds of their buckets.
+HISTOGRAMS = (
+    ('fetch_seconds', 'Duration of a request to Goodreads, including receiving the response.', (
+        0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30,
+    )),
+    ('tags_per_book', 'Amount of tags found for a tagged book.', (1, 2, 3, 5, 8, 13, 21)),
+    ('identify_seconds', 'Duration of a metadata download (identify call).', (1, 2.5, 5, 10, 30, 60, 120)),
+)
+
+
+class Histogram(object):
+    """
+    A distribution of observed values, counted in buckets with fixed upper bounds like a Prometheus histogram.
+
+    This does not keep the values themselves, so it uses constant memory regardless of the amount of observations, but
+    this means percentiles can only be estimated. This is not thread safe by itself.
+    """
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        # The amount of values per bucket, with an extra bucket for values above the largest bound.
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, percentile):
+        """
+        Estimate a percentile by interpolating within the bucket it is in, or None if nothing has been observed.
+
+        Values above the largest bound can only be estimated as that bound.
+
+        >>> histogram = Histogram([1, 2, 4])
+        >>> for value in [0.5, 1.5, 1.5, 3]:
+        ...     histogram.observe(value)
+        >>> histogram.percentile(50)
+        1.5
+        >>> histogram.percentile(100)
+        4.0
+        """
+        if not self.count:
+            return None
+        rank = self.count * percentile / 100
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                if index == len(self.buckets):
+                    return float(self.buckets[-1])
+                lower = self.buckets[index - 1] if index > 0 else 0
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / count
+            cumulative += count
+        return float(self.buckets[-1])
+
+    def cumulative_counts(self):
+        """ Get (upper bound, amount of values at most that bound) pairs, ending with None for all values. """
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (None,), self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+
+class MetricsRegistry(object):
+    """
+    The counters and histograms of the plugin, as defined in COUNTERS and HISTOGRAMS.
+
+    Using a metric that is not defined raises a KeyError, so that a typo does not silently create a new metric.
+
+    This is safe to use from multiple threads at the same time.
+    """
+    def __init__(self, counters = COUNTERS, histograms = HISTOGRAMS, clock = time.time):
+        self.clock = clock
+        self.lock = Lock()
+        self.counter_descriptions = dict(counters)
+        self.counter_names = [name for name, description in counters]
+        self.histogram_definitions = [(name, description, buckets) for name, description, buckets in histograms]
+        self.reset()
+
+    def reset(self):
+        """ Set all metrics back to zero. """
+        with self.lock:
+            self.started = self.clock()
+            self.counters = { name: 0 for name in self.counter_names }
+            self.histograms = { name: Histogram(buckets) for name, description, buckets in self.histogram_definitions }
+
+    def increment(self, name, amount = 1):
+        with self.lock:
+            if name not in self.counters:
+                raise KeyError('Unknown counter {}'.format(name))
+            self.counters[name] += amount
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    @contextmanager
+    def measure(self, name):
+        """ Observe the time spent in the with block (in seconds) in a histogram. """
+        start = self.clock()
+        try:
+            yield
+        finally:
+            self.observe(name, self.clock() - start)
+
+    def get(self, name):
+        """ Get the value of a counter. """
+        with self.lock:
+            return self.counters[name]
+
+    def snapshot(self):
+        """ Get the current values of all metrics as a JSON serializable dict. """
+        with self.lock:
+            now = self.clock()
+            histograms = {}
+            for name, description, buckets in self.histogram_definitions:
+                histogram = self.histograms[name]
+                histograms[name] = {
+                    'count': histogram.count,
+                    'sum': histogram.sum,
+                    'buckets': [[bound, count] for bound, count in histogram.cumulative_counts()],
+                }
+                for percentile in PERCENTILES:
+                    histograms[name]['p{}'.format(percentile)] = histogram.percentile(percentile)
+            return {
+                'time': now,
+                'uptime': now - self.started,
+                'counters': dict(self.counters),
+                'histograms': histograms,
+            }
+
+    def format_json(self):
+        return json.dumps(self.snapshot(), indent = 2, sort_keys = True)
+
+    def format_prometheus(self):
+        """ Get all metrics in the Prometheus text exposition format. """
+        lines = []
+        with self.lock:
+            for name in self.counter_names:
+                full_name = PROMETHEUS_PREFIX + name + '_total'
+                lines.append('# HELP {} {}'.format(full_name, self.counter_descriptions[name]))
+                lines.append('# TYPE {} counter'.format(full_name))
+                lines.append('{} {}'.format(full_name, self.counters[name]))
+            for name, description, buckets in self.histogram_definitions:
+                histogram = self.histograms[name]
+                full_name = PROMETHEUS_PREFIX + name
+                lines.append('# HELP {} {}'.format(full_name, description))
+                lines.append('# TYPE {} histogram'.format(full_name))
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('{}_bucket{{le="{}"}} {}'.format(
+                        full_name,
+                        '+Inf' if bound is None else float(bound),
+                        count,
+                    ))
+                lines.append('{}_sum {}'.format(full_name, float(histogram.sum)))
+                lines.append('{}_count {}'.format(full_name, histogram.count))
+        return '\n'.join(lines) + '\n'
+
+    def format(self, format):
+        if format == FORMAT_PROMETHEUS:
+            return self.format_prometheus()
+        return self.format_json()
+
+
+class MetricsExporter(object):
+    """
+    Writes the metrics to a file every interval seconds in a background thread, and once more when stopped.
+
+    The file is replaced atomically, so a reader never sees a partially written file.
+    """
+    def __init__(self, registry, path, format = FORMAT_JSON, interval = 60):
+        if format not in FORMATS:
+            raise ValueError('Unknown metrics format {}'.format(format))
+        self.registry = registry
+        self.path = path
+        self.format = format
+        self.interval = interval
+        self.stopped = Event()
+        self.thread = None
+
+    def write(self):
+        temp_path = self.path + '.tmp'
+        with io.open(temp_path, 'wb') as f:
+            f.write(self.registry.format(self.format).encode('utf-8'))
+        os.replace(temp_path, self.path)
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def start(self):
+        self.thread = Thread(target = self.run, name = 'GoodreadsMoreTagsMetrics')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.write()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+# The metrics of this process, fed by all workers and identify calls.
+metrics = MetricsRegistry()
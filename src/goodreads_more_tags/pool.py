@@ -0,0 +1,174 @@
+from __future__ import division
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+import time
+from urllib.parse import urlparse
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# The lowest rate (in requests per second) that the RateLimiter backs off to.
+MIN_RATE = 0.1
+# The fraction of the configured rate by which the RateLimiter increases the rate after each successful request.
+RATE_INCREASE = 0.05
+# The longest pause (in seconds) that a Retry-After header can cause, so that a bogus value cannot block all requests.
+MAX_RETRY_AFTER = 120
+
+
+class HostLimiter(object):
+    """
+    Limits the amount of requests that can run concurrently for a single host.
+
+    Use as `with limiter.limit(url): ...`.
+    """
+    def __init__(self, limit):
+        self.lock = Lock()
+        self.limit = limit
+        self.semaphores = {}
+
+    def set_limit(self, limit):
+        """ Change the limit. Requests that are already running are not affected. """
+        with self.lock:
+            if limit != self.limit:
+                self.limit = limit
+                self.semaphores = {}
+
+    def limit_for(self, url):
+        """ Get the semaphore that guards the host of the given url. """
+        host = urlparse(url).netloc
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = BoundedSemaphore(self.limit)
+            return self.semaphores[host]
+
+
+class WorkerPool(object):
+    """
+    A pool of threads to run Workers in, shared between all identify calls of a plugin instance.
+
+    The pool is (re)created lazily, so that changes to its size take effect on the next identify. Work that was already
+    submitted to a pool that is replaced will still finish.
+
+    Multiple pools can share a HostLimiter, in which case the limit applies to the requests of all of them together.
+    """
+    def __init__(self, size, host_limit, host_limiter = None):
+        self.lock = Lock()
+        self.size = size
+        self.executor = None
+        self.host_limiter = host_limiter or HostLimiter(host_limit)
+
+    def configure(self, size, host_limit):
+        """ Update the amount of threads and the maximum amount of concurrent requests per host. """
+        with self.lock:
+            if size != self.size and self.executor is not None:
+                self.executor.shutdown(wait = False)
+                self.executor = None
+            self.size = size
+        self.host_limiter.set_limit(host_limit)
+
+    def submit(self, func, *args, **kwargs):
+        """ Schedule func to be run in the pool, returning a Future for it. """
+        with self.lock:
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers = self.size, thread_name_prefix = 'GoodreadsMoreTags')
+            return self.executor.submit(func, *args, **kwargs)
+
+    def limit(self, url):
+        """ A context manager that limits the amount of concurrent requests to the host of the given url. """
+        return self.host_limiter.limit_for(url)
+
+
+class RateLimiter(object):
+    """
+    A token bucket that limits the rate of requests of all threads together.
+
+    The rate adapts to throttling using additive increase, multiplicative decrease: every time a request is throttled
+    the rate is halved (down to MIN_RATE), and every successful request increases it again by RATE_INCREASE times the
+    configured rate, up to the configured rate. This keeps the throughput as high as possible without repeatedly running
+    into the throttling.
+
+    A rate of 0 disables the limiting.
+    """
+    def __init__(self, rate, clock = time.time, sleep = time.sleep):
+        self.lock = Lock()
+        self.clock = clock
+        self.sleep = sleep
+        self.max_rate = self.rate = rate
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.blocked_until = 0
+
+    @property
+    def capacity(self):
+        """ The maximum amount of requests that can be made in a single burst. """
+        return max(1, self.rate)
+
+    def configure(self, rate):
+        """ Change the configured rate. """
+        with self.lock:
+            if rate != self.max_rate:
+                self.max_rate = self.rate = rate
+                self.tokens = min(self.tokens, self.capacity)
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, abort = None, timeout = None):
+        """
+        Wait until a request may be made. Returns the amount of seconds that was waited.
+
+        This gives up right away if the wait would take timeout seconds or longer, or while waiting if abort (a
+        threading.Event) is set, in which case it returns None and no request may be made.
+        """
+        with self.lock:
+            if not self.max_rate:
+                return 0
+            now = self.clock()
+            self.refill(now)
+            # Take the token right away, even if it is not there yet. The negative balance makes the next threads wait
+            # their turn after this one.
+            self.tokens -= 1
+            delay = max(-self.tokens / self.rate, self.blocked_until - now, 0)
+            if timeout is not None and delay and delay >= timeout:
+                self.tokens += 1
+                return None
+        if abort is not None:
+            if abort.wait(delay):
+                self.release()
+                return None
+        elif delay > 0:
+            self.sleep(delay)
+        return delay
+
+    def release(self):
+        """ Give back a token that was taken by acquire, because no request was made after all. """
+        with self.lock:
+            self.tokens = min(self.capacity, self.tokens + 1)
+
+    def succeeded(self):
+        """ Report that a request was successful. """
+        with self.lock:
+            if self.max_rate:
+                self.refill(self.clock())
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RATE_INCREASE)
+
+    def throttled(self, retry_after = None):
+        """ Report that a request was throttled, optionally with the amount of seconds after which to try again. """
+        with self.lock:
+            if not self.max_rate:
+                return
+            now = self.clock()
+            self.refill(now)
+            self.rate = max(MIN_RATE, self.rate / 2)
+            self.tokens = min(self.tokens, 0)
+            if retry_after:
+                self.blocked_until = max(self.blocked_until, now + min(retry_after, MAX_RETRY_AFTER))
+
+
+# The RateLimiter for all requests to Goodreads, shared between all plugin instances.
+rate_limiter = RateLimiter(0)
@@ -0,0 +1,203 @@
+from __future__ import unicode_literals
+
+from copy import deepcopy
+
+from calibre.utils.config import JSONConfig
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# This module must not import anything GUI related, as it is used by the headless parts of the plugin as well.
+
+
+class NestingJSONConfig(JSONConfig):
+    """ A JSONConfig that allows passing keys like ['foo', 'bar'] to mean ['foo']['bar']. """
+    def _get_option_root(self, root, keys, create_as_needed = True):
+        for key in keys[:-1]:
+            if key not in root and create_as_needed:
+                root[key] = {}
+            root = root[key]
+        return root
+
+    def get(self, keys):
+        root = self._get_option_root(self, keys)
+        if keys[-1] not in root:
+            root[keys[-1]] = self.get_default(keys)
+        return root[keys[-1]]
+
+    def set(self, keys, value):
+        root = self._get_option_root(self, keys)
+        root[keys[-1]] = value
+
+    def get_default(self, keys):
+        root = self._get_option_root(self.defaults, keys, False)
+        return root[keys[-1]]
+
+    def set_default(self, keys, value):
+        root = self._get_option_root(self.defaults, keys)
+        root[keys[-1]] = value
+
+    def rename(self, old, new):
+        try:
+            old_root = self._get_option_root(self, old, False)
+            self.set(new, old_root[old[-1]])
+            del old_root[old[-1]]
+        except KeyError:
+            return
+
+        old.pop()
+        old_root = self._get_option_root(self, old, False)
+        while old and len(old_root[old[-1]]) == 0:
+            remove = old.pop()
+            del old_root[remove]
+            old_root = self._get_option_root(self, old, False)
+
+
+CONFIG_LOCATION = 'plugins/goodreads-more-tags'
+
+CATEGORY_THRESHOLD = 'thresholds'
+CATEGORY_INTEGRATION = 'goodreadsPluginIntegration'
+CATEGORY_CACHE = 'cache'
+CATEGORY_RETRIEVAL = 'retrieval'
+
+KEY_THRESHOLD_ABSOLUTE = [CATEGORY_THRESHOLD, 'absolute']
+KEY_THRESHOLD_PERCENTAGE = [CATEGORY_THRESHOLD, 'percentage']
+KEY_THRESHOLD_PERCENTAGE_OF = [CATEGORY_THRESHOLD, 'percentageOf']
+KEY_INTEGRATION_ENABLED = [CATEGORY_INTEGRATION, 'enabled']
+KEY_INTEGRATION_TIMEOUT = [CATEGORY_INTEGRATION, 'timeout']
+KEY_INTEGRATION_POOL_SIZE = [CATEGORY_INTEGRATION, 'poolSize']
+KEY_INTEGRATION_HOST_LIMIT = [CATEGORY_INTEGRATION, 'hostLimit']
+KEY_INTEGRATION_STREAMING = [CATEGORY_INTEGRATION, 'streaming']
+KEY_CACHE_ENABLED = [CATEGORY_CACHE, 'enabled']
+KEY_CACHE_TTL = [CATEGORY_CACHE, 'ttl']
+KEY_CACHE_SIZE = [CATEGORY_CACHE, 'size']
+KEY_RETRIEVAL_PAGES = [CATEGORY_RETRIEVAL, 'pages']
+KEY_RETRIEVAL_STREAM = [CATEGORY_RETRIEVAL, 'stream']
+KEY_RETRIEVAL_RATE = [CATEGORY_RETRIEVAL, 'rate']
+KEY_RETRIEVAL_ATTEMPTS = [CATEGORY_RETRIEVAL, 'attempts']
+KEY_RETRIEVAL_TIMEOUT = [CATEGORY_RETRIEVAL, 'timeout']
+KEY_RETRIEVAL_DEADLINE = [CATEGORY_RETRIEVAL, 'deadline']
+KEY_RETRIEVAL_KEEP_ALIVE = [CATEGORY_RETRIEVAL, 'keepAlive']
+KEY_SHELF_MAPPINGS = ['shelfMappings']
+
+DEFAULT_THRESHOLD_ABSOLUTE = 10
+DEFAULT_THRESHOLD_PERCENTAGE = 30
+DEFAULT_THRESHOLD_PERCENTAGE_OF = [3, 4]
+DEFAULT_INTEGRATION_ENABLED = True
+DEFAULT_INTEGRATION_TIMEOUT = 10
+DEFAULT_INTEGRATION_POOL_SIZE = 8
+DEFAULT_INTEGRATION_HOST_LIMIT = 4
+DEFAULT_INTEGRATION_STREAMING = True
+DEFAULT_CACHE_ENABLED = True
+DEFAULT_CACHE_TTL = 30
+DEFAULT_CACHE_SIZE = 50000
+DEFAULT_RETRIEVAL_PAGES = 1
+DEFAULT_RETRIEVAL_STREAM = True
+DEFAULT_RETRIEVAL_RATE = 5
+DEFAULT_RETRIEVAL_ATTEMPTS = 3
+DEFAULT_RETRIEVAL_TIMEOUT = 30
+DEFAULT_RETRIEVAL_DEADLINE = 120
+DEFAULT_RETRIEVAL_KEEP_ALIVE = True
+DEFAULT_SHELF_MAPPINGS = {
+    'adult': ['Adult'],
+    'adult-fiction': ['Adult'],
+    'adventure': ['Adventure'],
+    'anthologies': ['Anthologies'],
+    'art': ['Art'],
+    'biography': ['Biography'],
+    'business': ['Business'],
+    'chick-lit': ['Chick-lit'],
+    'childrens': ['Childrens'],
+    'classics': ['Classics'],
+    'comedy': ['Humour'],
+    'comics': ['Comics'],
+    'comics-manga': ['Comics'],
+    'contemporary': ['Contemporary'],
+    'cookbooks': ['Cookbooks'],
+    'crime': ['Crime'],
+    'essays': ['Writing'],
+    'fantasy': ['Fantasy'],
+    'feminism': ['Feminism'],
+    'gardening': ['Gardening'],
+    'gay': ['Gay'],
+    'graphic-novels': ['Comics'],
+    'graphic-novels-comics': ['Comics'],
+    'graphic-novels-comics-manga': ['Comics'],
+    'health': ['Health'],
+    'historical-fiction': ['Historical', 'Fiction'],
+    'history': ['History'],
+    'horror': ['Horror'],
+    'humor': ['Humour'],
+    'inspirational': ['Inspirational'],
+    'lgbt': ['Gay'],
+    'manga': ['Comics'],
+    'memoir': ['Biography'],
+    'modern': ['Modern'],
+    'music': ['Music'],
+    'mystery': ['Mystery'],
+    'non-fiction': ['Non-Fiction'],
+    'paranormal': ['Paranormal'],
+    'philosophy': ['Philosophy'],
+    'poetry': ['Poetry'],
+    'politics': ['Politics'],
+    'psychology': ['Psychology'],
+    'reference': ['Reference'],
+    'religion': ['Religion'],
+    'romance': ['Romance'],
+    'sci-fi-and-fantasy': ['Science Fiction', 'Fantasy'],
+    'sci-fi-fantasy': ['Science Fiction', 'Fantasy'],
+    'science': ['Science'],
+    'science-fiction': ['Science Fiction'],
+    'science-fiction-fantasy': ['Science Fiction', 'Fantasy'],
+    'self-help': ['Self Help'],
+    'sf-fantasy': ['Science Fiction', 'Fantasy'],
+    'sociology': ['Sociology'],
+    'spirituality': ['Spirituality'],
+    'suspense': ['Suspense'],
+    'thriller': ['Thriller'],
+    'travel': ['Travel'],
+    'vampires': ['Vampires'],
+    'war': ['War'],
+    'western': ['Western'],
+    'writing': ['Writing'],
+    'ya': ['Young Adult'],
+    'young-adult': ['Young Adult'],
+}
+
+# Load/initialize preferences.
+plugin_prefs = NestingJSONConfig(CONFIG_LOCATION)
+plugin_prefs.set_default(KEY_THRESHOLD_ABSOLUTE, DEFAULT_THRESHOLD_ABSOLUTE)
+plugin_prefs.set_default(KEY_THRESHOLD_PERCENTAGE, DEFAULT_THRESHOLD_PERCENTAGE)
+plugin_prefs.set_default(KEY_THRESHOLD_PERCENTAGE_OF, DEFAULT_THRESHOLD_PERCENTAGE_OF)
+plugin_prefs.set_default(KEY_INTEGRATION_ENABLED, DEFAULT_INTEGRATION_ENABLED)
+plugin_prefs.set_default(KEY_INTEGRATION_TIMEOUT, DEFAULT_INTEGRATION_TIMEOUT)
+plugin_prefs.set_default(KEY_INTEGRATION_POOL_SIZE, DEFAULT_INTEGRATION_POOL_SIZE)
+plugin_prefs.set_default(KEY_INTEGRATION_HOST_LIMIT, DEFAULT_INTEGRATION_HOST_LIMIT)
+plugin_prefs.set_default(KEY_INTEGRATION_STREAMING, DEFAULT_INTEGRATION_STREAMING)
+plugin_prefs.set_default(KEY_CACHE_ENABLED, DEFAULT_CACHE_ENABLED)
+plugin_prefs.set_default(KEY_CACHE_TTL, DEFAULT_CACHE_TTL)
+plugin_prefs.set_default(KEY_CACHE_SIZE, DEFAULT_CACHE_SIZE)
+plugin_prefs.set_default(KEY_RETRIEVAL_PAGES, DEFAULT_RETRIEVAL_PAGES)
+plugin_prefs.set_default(KEY_RETRIEVAL_STREAM, DEFAULT_RETRIEVAL_STREAM)
+plugin_prefs.set_default(KEY_RETRIEVAL_RATE, DEFAULT_RETRIEVAL_RATE)
+plugin_prefs.set_default(KEY_RETRIEVAL_ATTEMPTS, DEFAULT_RETRIEVAL_ATTEMPTS)
+plugin_prefs.set_default(KEY_RETRIEVAL_TIMEOUT, DEFAULT_RETRIEVAL_TIMEOUT)
+plugin_prefs.set_default(KEY_RETRIEVAL_DEADLINE, DEFAULT_RETRIEVAL_DEADLINE)
+plugin_prefs.set_default(KEY_RETRIEVAL_KEEP_ALIVE, DEFAULT_RETRIEVAL_KEEP_ALIVE)
+plugin_prefs.set_default(KEY_SHELF_MAPPINGS, deepcopy(DEFAULT_SHELF_MAPPINGS))
+
+# Migrate settings.
+renamed = (
+    # Old, misspelled options.
+    (['options', 'tresholdAbsolute'], KEY_THRESHOLD_ABSOLUTE),
+    (['options', 'tresholdPercentage'], KEY_THRESHOLD_PERCENTAGE),
+    (['options', 'tresholdPercentageOf'], KEY_THRESHOLD_PERCENTAGE_OF),
+    # Options from when everything was a single category.
+    (['options', 'thresholdAbsolute'], KEY_THRESHOLD_ABSOLUTE),
+    (['options', 'thresholdPercentage'], KEY_THRESHOLD_PERCENTAGE),
+    (['options', 'thresholdPercentageOf'], KEY_THRESHOLD_PERCENTAGE_OF),
+    (['options', 'shelfMappings'], KEY_SHELF_MAPPINGS),
+)
+for old, new in renamed:
+    plugin_prefs.rename(old, new)
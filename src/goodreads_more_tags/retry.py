@@ -0,0 +1,98 @@
+from __future__ import division
+from __future__ import unicode_literals
+
+from http.client import HTTPException
+import random
+import time
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# The HTTP status codes of responses that may succeed if the request is made again.
+RETRYABLE_CODES = frozenset([408, 425, 429, 500, 502, 503, 504])
+
+
+def is_retryable(error):
+    """
+    Check whether the request that raised the given error may succeed if it is made again.
+
+    HTTP errors are retryable if their status code indicates a temporary problem. Other errors are retryable if they are
+    network errors, like timeouts, refused connections, and connections that are closed halfway through a response.
+
+    >>> import socket
+    >>> is_retryable(socket.timeout('timed out'))
+    True
+    >>> is_retryable(ValueError('invalid literal'))
+    False
+    """
+    code = getattr(error, 'code', None)
+    if code is not None:
+        return code in RETRYABLE_CODES
+    return isinstance(error, (EnvironmentError, HTTPException))
+
+
+class RetryPolicy(object):
+    """
+    Determines how often and when a failed request is attempted again.
+
+    A request is attempted at most `attempts` times, each with a timeout of at most `timeout` seconds, and no new
+    attempt is started if it cannot finish within `deadline` seconds of the first one. Between attempts there is an
+    exponential backoff with full jitter, meaning a random delay between 0 and `base_delay * 2 ** (retry - 1)` seconds
+    (capped at `max_delay`), so that many requests that failed at the same time do not all retry at the same time.
+
+    Use as `for attempt, timeout in policy.attempts(abort): ...`, breaking out of the loop once an attempt succeeds.
+    """
+    def __init__(self, attempts, timeout, deadline, base_delay = 1, max_delay = 30, clock = time.time,
+                 random = random.random):
+        self.max_attempts = max(1, attempts)
+        self.timeout = timeout
+        self.deadline = deadline
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.clock = clock
+        self.random = random
+
+    @classmethod
+    def from_settings(cls, settings, deadline = None):
+        """ Create a RetryPolicy from the given Settings, optionally limiting the deadline to the given one. """
+        if deadline is None or deadline > settings.retry_deadline:
+            deadline = settings.retry_deadline
+        return cls(settings.retry_attempts, settings.request_timeout, deadline)
+
+    def get_delay(self, retry):
+        """
+        Get the delay before the given retry (so 1 for the second attempt).
+
+        >>> policy = RetryPolicy(5, 10, 60, base_delay = 2, max_delay = 5, random = lambda: 1)
+        >>> [policy.get_delay(retry) for retry in range(1, 5)]
+        [2, 4, 5, 5]
+        """
+        return self.random() * min(self.max_delay, self.base_delay * 2 ** (retry - 1))
+
+    def attempts(self, abort = None):
+        """
+        Generate (attempt number, timeout) pairs for the attempts of a request, waiting before each retry.
+
+        This stops once all attempts have been used, if the next attempt would start after the deadline, or if abort
+        (a threading.Event) is set, including while waiting.
+
+        >>> policy = RetryPolicy(3, 10, 60, base_delay = 0)
+        >>> list(policy.attempts())
+        [(1, 10), (2, 10), (3, 10)]
+        """
+        start = self.clock()
+        for attempt in range(1, self.max_attempts + 1):
+            if attempt > 1:
+                delay = self.get_delay(attempt - 1)
+                if self.clock() + delay >= start + self.deadline:
+                    return
+                if abort is not None:
+                    if abort.wait(delay):
+                        return
+                elif delay > 0:
+                    time.sleep(delay)
+            if abort is not None and abort.is_set():
+                return
+            remaining = start + self.deadline - self.clock()
+            yield attempt, min(self.timeout, remaining)
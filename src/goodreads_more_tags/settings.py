@@ -0,0 +1,106 @@
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from threading import Lock
+
+from .mappings import get_mapper, invalidate_mapper
+from .prefs import (
+    plugin_prefs,
+    KEY_CACHE_ENABLED, KEY_CACHE_SIZE, KEY_CACHE_TTL,
+    KEY_INTEGRATION_ENABLED, KEY_INTEGRATION_HOST_LIMIT, KEY_INTEGRATION_POOL_SIZE, KEY_INTEGRATION_STREAMING,
+    KEY_INTEGRATION_TIMEOUT,
+    KEY_RETRIEVAL_ATTEMPTS, KEY_RETRIEVAL_DEADLINE, KEY_RETRIEVAL_KEEP_ALIVE, KEY_RETRIEVAL_PAGES, KEY_RETRIEVAL_RATE,
+    KEY_RETRIEVAL_STREAM, KEY_RETRIEVAL_TIMEOUT,
+    KEY_THRESHOLD_ABSOLUTE, KEY_THRESHOLD_PERCENTAGE, KEY_THRESHOLD_PERCENTAGE_OF,
+    DEFAULT_THRESHOLD_PERCENTAGE_OF,
+)
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+
+class Settings(object):
+    """
+    An immutable snapshot of the preferences, with all values validated.
+
+    Reading the preferences is relatively expensive (and may write defaults back), so this is built once per identify
+    and passed to everything that needs it. Use get_settings to get the current snapshot.
+    """
+    __slots__ = (
+        'threshold_absolute',
+        'threshold_percentage',
+        'threshold_percentage_of',
+        'integration_enabled',
+        'integration_timeout',
+        'pool_size',
+        'host_limit',
+        'streaming',
+        'cache_enabled',
+        'cache_ttl',
+        'cache_size',
+        'pages',
+        'stream_pages',
+        'rate_limit',
+        'retry_attempts',
+        'request_timeout',
+        'retry_deadline',
+        'keep_alive',
+        'mapper',
+    )
+
+    def __init__(self, prefs):
+        values = {
+            'threshold_absolute': max(0, prefs.get(KEY_THRESHOLD_ABSOLUTE)),
+            'threshold_percentage': min(100, max(0, prefs.get(KEY_THRESHOLD_PERCENTAGE))),
+            'threshold_percentage_of': (
+                tuple(p for p in prefs.get(KEY_THRESHOLD_PERCENTAGE_OF) if p > 0) or
+                tuple(DEFAULT_THRESHOLD_PERCENTAGE_OF)
+            ),
+            'integration_enabled': bool(prefs.get(KEY_INTEGRATION_ENABLED)),
+            'integration_timeout': max(0.1, prefs.get(KEY_INTEGRATION_TIMEOUT)),
+            'pool_size': max(1, prefs.get(KEY_INTEGRATION_POOL_SIZE)),
+            'host_limit': max(1, prefs.get(KEY_INTEGRATION_HOST_LIMIT)),
+            'streaming': bool(prefs.get(KEY_INTEGRATION_STREAMING)),
+            'cache_enabled': bool(prefs.get(KEY_CACHE_ENABLED)),
+            # Stored in days, but used in seconds.
+            'cache_ttl': max(0, prefs.get(KEY_CACHE_TTL)) * 24 * 60 * 60,
+            'cache_size': max(0, prefs.get(KEY_CACHE_SIZE)),
+            'pages': max(1, prefs.get(KEY_RETRIEVAL_PAGES)),
+            'stream_pages': bool(prefs.get(KEY_RETRIEVAL_STREAM)),
+            'rate_limit': max(0, prefs.get(KEY_RETRIEVAL_RATE)),
+            'retry_attempts': max(1, prefs.get(KEY_RETRIEVAL_ATTEMPTS)),
+            'request_timeout': max(1, prefs.get(KEY_RETRIEVAL_TIMEOUT)),
+            'retry_deadline': max(1, prefs.get(KEY_RETRIEVAL_DEADLINE)),
+            'keep_alive': bool(prefs.get(KEY_RETRIEVAL_KEEP_ALIVE)),
+            'mapper': get_mapper(),
+        }
+        for name, value in values.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Settings are immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Settings are immutable')
+
+
+_settings = None
+_settings_lock = Lock()
+
+
+def get_settings():
+    """ Get the current Settings, building these only if there are none yet or they have been invalidated. """
+    global _settings
+    with _settings_lock:
+        if _settings is None:
+            _settings = Settings(plugin_prefs)
+        return _settings
+
+
+def invalidate_settings():
+    """ Discard the current Settings, so that the next call to get_settings uses the new preferences. """
+    global _settings
+    with _settings_lock:
+        _settings = None
+    invalidate_mapper()
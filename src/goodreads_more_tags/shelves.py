@@ -0,0 +1,284 @@
+from __future__ import unicode_literals
+
+from codecs import getincrementaldecoder
+from html import unescape
+import re
+from threading import local
+import zlib
+
+from lxml.etree import XPath
+from lxml.html import HTMLParser, fromstring
+
+from calibre.utils.cleantext import clean_ascii_chars
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# Patterns for the fast path of the shelf parsing. SHELF_PATTERN matches a complete shelfStat block, grabbing the name
+# and the count, and SHELF_MARKER_PATTERN matches the start of any shelfStat block, to verify that the first pattern did
+# not miss any.
+SHELF_PATTERN = re.compile(
+    r'<div class="shelfStat">\s*'
+    r'<div[^>]*>\s*<a class="[^"]*\bactionLinkLite\b[^"]*"[^>]*>([^<]*)</a>\s*</div>\s*'
+    r'<div class="[^"]*\bsmallText\b[^"]*"[^>]*>\s*<a[^>]*>\s*([0-9,]+)\b[^<]*</a>'
+)
+SHELF_MARKER_PATTERN = re.compile(r'<div class="[^"]*\bshelfStat\b')
+# Matches the summary above the shelfStat blocks (e.g. 'Showing 1-100 of 4,572'), to know when all blocks of the page
+# have been seen while streaming, and how many shelves (and so pages) the book has in total. The total must be followed
+# by something else, so that a total that is split over two chunks is not mistaken for a smaller one.
+SHOWING_PATTERN = re.compile(r'Showing\s+([0-9,]+)\s*-\s*([0-9,]+)\s+of\s+([0-9,]+)(?=[^0-9,])')
+SHOWING_BYTES_PATTERN = re.compile(SHOWING_PATTERN.pattern.encode('ascii'))
+
+# XPaths for the DOM based shelf parsing.
+SHELF_XPATH = XPath('//div[contains(@class, "shelfStat")]')
+SHELF_NAME_XPATH = XPath('string(.//a[contains(@class, "actionLinkLite")])')
+SHELF_COUNT_XPATH = XPath('string(.//div[contains(@class, "smallText")]/a)')
+
+# Parsers are not thread safe, so there is one per thread.
+_local = local()
+
+# The amount of characters at the end of the received data that is kept while streaming, so that a shelfStat marker that
+# is split over two chunks is still found.
+MARKER_LOOKBEHIND = 256
+# The maximum size of a single shelfStat block. If a block that is larger than this does not match SHELF_PATTERN, it is
+# assumed to not be in the expected format, rather than incomplete.
+MAX_BLOCK_SIZE = 4096
+
+
+def parse_shelves_fast(text):
+    """
+    Get the shelf name -> count dict from the html of a shelves page using regular expressions.
+
+    This is a lot faster than building a DOM, but it depends on the exact markup of the page. If any shelfStat block
+    does not match the expected markup this returns None, in which case parse_shelves_tree should be used instead.
+
+    >>> parse_shelves_fast('''
+    ...   <div class="shelfStat">
+    ...     <div style="float: left;"><a class="mediumText actionLinkLite" href="/genres/fantasy">fantasy</a></div>
+    ...     <div class="smallText" style="float: right;"><a rel="nofollow" href="#">5,426 people</a></div>
+    ...   </div>
+    ... ''')
+    {'fantasy': 5426}
+    >>> parse_shelves_fast('<div class="shelfStat"><span>fantasy</span></div>') is None
+    True
+    """
+    shelves = {}
+    matches = 0
+    for match in SHELF_PATTERN.finditer(text):
+        name = match.group(1).strip()
+        if '&' in name:
+            name = unescape(name)
+        shelves[name] = int(match.group(2).replace(',', ''))
+        matches += 1
+    if matches == 0 or matches != len(SHELF_MARKER_PATTERN.findall(text)):
+        return None
+    return shelves
+
+
+def get_parser():
+    """ Get the HTMLParser for the current thread. Parsers are not thread safe, but reusing them is cheaper. """
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        parser = _local.parser = HTMLParser(remove_blank_text = True, remove_comments = True)
+    return parser
+
+
+def parse_shelves_tree(text):
+    """
+    Get the shelf name -> count dict from the html of a shelves page by building a DOM.
+
+    >>> parse_shelves_tree('''
+    ...   <div class="shelfStat">
+    ...     <div style="float: left;"><a class="mediumText actionLinkLite" href="/genres/fantasy">fantasy</a></div>
+    ...     <div class="smallText" style="float: right;"><a rel="nofollow" href="#">5,426 people</a></div>
+    ...   </div>
+    ... ''')
+    {'fantasy': 5426}
+    """
+    root = fromstring(clean_ascii_chars(text), parser = get_parser())
+    shelves = {}
+    for shelf in SHELF_XPATH(root):
+        name = SHELF_NAME_XPATH(shelf).strip()
+        count = SHELF_COUNT_XPATH(shelf).strip()
+        shelves[name] = int(count.split()[0].replace(',', ''))
+    return shelves
+
+
+def decode_page(data):
+    """
+    Get the html from the raw contents of a shelves page.
+
+    >>> decode_page(b'  <div>caf\\xc3\\xa9</div>\\n')
+    '<div>caf\xe9</div>'
+    """
+    return data.decode('utf-8', errors = 'replace').strip()
+
+
+def parse_shelves(data):
+    """ Get the shelf name -> count dict from the raw contents of a shelves page, see parse_shelves_text. """
+    return parse_shelves_text(decode_page(data))
+
+
+def parse_shelves_text(text):
+    """
+    Get the shelf name -> count dict from the html of a shelves page.
+
+    This uses the fast path where possible, and falls back to building a DOM where needed.
+    """
+    shelves = parse_shelves_fast(text)
+    if shelves is None:
+        shelves = parse_shelves_tree(text)
+    return shelves
+
+
+def parse_total(data):
+    """
+    Get the total amount of shelves of the book from the summary on the raw contents of a shelves page, or None if the
+    page has no summary.
+
+    >>> parse_total(b'<span>Showing 1-100 of 4,572</span>')
+    4572
+    """
+    showing = SHOWING_BYTES_PATTERN.search(data)
+    if showing is None:
+        return None
+    return int(showing.group(3).replace(b',', b''))
+
+
+class ChunkDecoder(object):
+    """
+    Incrementally decompresses and decodes the chunks of the body of a response.
+
+    Only the data of the current chunk is held at any time, so the full (compressed or decompressed) body is never in
+    memory at once.
+
+    >>> import zlib
+    >>> data = zlib.compress('<div>caf\xe9</div>'.encode('utf-8'))
+    >>> decoder = ChunkDecoder('deflate')
+    >>> ''.join([decoder.decode(data[i:i + 3]) for i in range(0, len(data), 3)] + [decoder.decode(b'', final = True)])
+    '<div>caf\xe9</div>'
+    """
+    def __init__(self, content_encoding = None, charset = 'utf-8'):
+        content_encoding = (content_encoding or 'identity').strip().lower()
+        if content_encoding in ('gzip', 'x-gzip', 'deflate'):
+            # This makes zlib detect whether there is a gzip or zlib header.
+            self.decompressor = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        elif content_encoding == 'identity':
+            self.decompressor = None
+        else:
+            raise ValueError('Unsupported content encoding {}'.format(content_encoding))
+        self.decoder = getincrementaldecoder(charset)(errors = 'replace')
+
+    def decode(self, data, final = False):
+        """ Get the text for the next chunk of the body. Raises zlib.error if the data cannot be decompressed. """
+        if self.decompressor is not None:
+            data = self.decompressor.decompress(data)
+            if final:
+                data += self.decompressor.flush()
+        return self.decoder.decode(data, final)
+
+
+class ShelfStreamParser(object):
+    """
+    Incrementally parses the shelves from the html of a shelves page, using the same patterns as parse_shelves_fast.
+
+    Feed it the text of the page in chunks of any size, and call close once all text has been fed or once done is set.
+    Only the part of the text that may still contain (the start of) a shelfStat block is kept between calls to feed.
+
+    The parser is done (meaning the rest of the page does not matter) once all shelves that the summary above the list
+    announces have been found. The total amount of shelves of the book from that summary is available as total. It does
+    not stop at shelves with low counts, as several of those can add up to a tag that passes the thresholds.
+
+    >>> parser = ShelfStreamParser()
+    >>> text = '''
+    ...   Showing 1-1 of 1
+    ...   <div class="shelfStat">
+    ...     <div style="float: left;"><a class="mediumText actionLinkLite" href="/genres/fantasy">fantasy</a></div>
+    ...     <div class="smallText" style="float: right;"><a rel="nofollow" href="#">5,426 people</a></div>
+    ...   </div>
+    ... '''
+    >>> for i in range(0, len(text), 7):
+    ...     parser.feed(text[i:i + 7])
+    >>> parser.done
+    True
+    >>> parser.close()
+    {'fantasy': 5426}
+    """
+    def __init__(self):
+        self.shelves = {}
+        self.matches = 0
+        self.expected = None
+        self.total = None
+        self.failed = False
+        self.done = False
+        self.buffer = ''
+
+    def feed(self, text):
+        """ Process the next chunk of text. """
+        if self.failed or self.done:
+            return
+        self.buffer += text
+        self.process(final = False)
+
+    def close(self):
+        """
+        Process the remaining text, and get the shelf name -> count dict.
+
+        This returns None if any shelfStat block did not match the expected markup, in which case the page should be
+        parsed using parse_shelves instead. A page without any blocks results in an empty dict, like parse_shelves.
+        """
+        if not self.failed and not self.done:
+            self.process(final = True)
+        self.buffer = ''
+        if self.failed:
+            return None
+        return self.shelves
+
+    def process(self, final):
+        buffer = self.buffer
+
+        # The summary comes before the first block, so there is no need to look for it after that.
+        if self.expected is None and self.matches == 0:
+            showing = SHOWING_PATTERN.search(buffer)
+            if showing:
+                first, last, total = (int(group.replace(',', '')) for group in showing.groups())
+                self.expected = last - first + 1
+                self.total = total
+
+        pos = 0
+        while True:
+            marker = SHELF_MARKER_PATTERN.search(buffer, pos)
+            if marker is None:
+                pos = max(pos, len(buffer) - MARKER_LOOKBEHIND)
+                break
+
+            match = SHELF_PATTERN.match(buffer, marker.start())
+            if match is None:
+                # The block may just be incomplete, in which case it will be retried once more text has been received.
+                # If it cannot be incomplete, it is not in the expected format.
+                if (
+                    final or
+                    len(buffer) - marker.start() > MAX_BLOCK_SIZE or
+                    SHELF_MARKER_PATTERN.search(buffer, marker.end())
+                ):
+                    self.failed = True
+                    pos = len(buffer)
+                else:
+                    pos = marker.start()
+                break
+
+            self.add(match)
+            pos = match.end()
+            if self.matches == self.expected:
+                self.done = True
+                break
+        self.buffer = buffer[pos:]
+
+    def add(self, match):
+        """ Add the shelf of a match of SHELF_PATTERN. """
+        name = match.group(1).strip()
+        if '&' in name:
+            name = unescape(name)
+        self.shelves[name] = int(match.group(2).replace(',', ''))
+        self.matches += 1
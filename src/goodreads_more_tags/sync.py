@@ -0,0 +1,226 @@
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Event, Lock, Thread
+from time import monotonic
+
+__license__ = 'BSD 3-clause'
+__copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
+__docformat__ = 'markdown en'
+
+# How often (in seconds) the watcher of a wait that can be aborted checks whether the wait is still going on.
+WATCH_INTERVAL = 0.1
+
+
+class CountDownLatch(object):
+    """
+    A latch that opens once count_down has been called count times, or once it is released.
+
+    >>> latch = CountDownLatch(2)
+    >>> latch.count_down()
+    >>> latch.wait(0)
+    False
+    >>> latch.count_down()
+    >>> latch.wait(0)
+    True
+    """
+    def __init__(self, count):
+        self.condition = Condition()
+        self.count = count
+
+    def count_down(self):
+        """ Decrease the count, opening the latch if it reaches zero. """
+        with self.condition:
+            self.count -= 1
+            if self.count <= 0:
+                self.condition.notify_all()
+
+    def release(self):
+        """ Open the latch, regardless of the count. """
+        with self.condition:
+            self.count = 0
+            self.condition.notify_all()
+
+    def wait(self, timeout = None, abort = None):
+        """
+        Wait until the latch opens, or until abort (a threading.Event) is set. Returns whether it is open, which is only
+        False if the timeout was hit or if it was aborted.
+
+        There is no way to wait for an Event and a Condition at the same time, so a watcher thread waits for abort and
+        wakes this wait up as soon as it is set. The watcher checks every WATCH_INTERVAL seconds whether the wait is
+        done, so it may outlive the wait by that long.
+        """
+        if abort is None:
+            with self.condition:
+                return wait_for(self.condition, lambda: self.count <= 0, timeout)
+
+        done = Event()
+
+        def watch():
+            while not done.is_set():
+                if abort.wait(WATCH_INTERVAL):
+                    with self.condition:
+                        self.condition.notify_all()
+                    return
+
+        watcher = Thread(target = watch, name = 'CountDownLatch-abort-watcher')
+        watcher.daemon = True
+        watcher.start()
+        try:
+            with self.condition:
+                wait_for(self.condition, lambda: self.count <= 0 or abort.is_set(), timeout)
+                return self.count <= 0
+        finally:
+            done.set()
+
+
+class InFlight(object):
+    """
+    Makes concurrent calls with the same key share a single execution.
+
+    The first call for a key executes the function, and any calls for the same key that are made while it is running
+    wait for it and get the same result (or exception). Once it is done, the key is removed, so the next call executes
+    the function again.
+
+    >>> in_flight = InFlight()
+    >>> in_flight.do('key', lambda: 42)
+    (42, False)
+    """
+    def __init__(self):
+        self.lock = Lock()
+        self.calls = {}
+
+    def do(self, key, func, *args, **kwargs):
+        """ Call func, unless a call for key is already running. Returns the result and whether it was shared. """
+        with self.lock:
+            future = self.calls.get(key)
+            shared = future is not None
+            if not shared:
+                future = self.calls[key] = Future()
+        if shared:
+            return future.result(), True
+
+        try:
+            result = func(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result, False
+        finally:
+            with self.lock:
+                del self.calls[key]
+
+    def __len__(self):
+        with self.lock:
+            return len(self.calls)
+
+
+def wait_for(condition, predicate, timeout = None, clock = monotonic):
+    """
+    Wait on a condition until the predicate is true, or until the timeout (in seconds) has passed. The lock of the
+    condition must be held. Returns the last result of the predicate, which is only false if the timeout was hit.
+
+    Unlike a single Condition.wait, this keeps waiting after a spurious wakeup, and the timeout is a deadline for the
+    whole wait rather than for each wakeup.
+    """
+    result = predicate()
+    deadline = None if timeout is None else clock() + timeout
+    while not result:
+        if deadline is None:
+            condition.wait()
+        else:
+            remaining = deadline - clock()
+            if remaining <= 0:
+                break
+            condition.wait(remaining)
+        result = predicate()
+    return result
+
+
+class ChannelClosedError(Exception):
+    pass
+
+
+class ChannelTimeoutError(Exception):
+    pass
+
+
+class Channel(object):
+    """
+    A queue that producers close once they are done, after which the consumers get the remaining items and then None.
+
+    All state is guarded by a single lock, so putting or getting an item takes one lock (unlike a Queue wrapped in a
+    Condition, which takes two).
+
+    >>> channel = Channel()
+    >>> channel.put(1)
+    >>> channel.put(2)
+    >>> channel.close()
+    >>> list(channel)
+    [1, 2]
+    >>> channel.get() is None
+    True
+    """
+    # The exception raised when a get times out. Subclasses can change this to one that suits their callers.
+    timeout_error = ChannelTimeoutError
+
+    def __init__(self):
+        self.lock = Lock()
+        self.not_empty = Condition(self.lock)
+        self.items = deque()
+        self.closed = False
+
+    def put(self, item):
+        """ Add an item. Raises ChannelClosedError if the channel has been closed. """
+        with self.lock:
+            if self.closed:
+                raise ChannelClosedError('Cannot add items to a closed channel')
+            self.items.append(item)
+            self.not_empty.notify()
+
+    def get(self, timeout = None):
+        """
+        Get the next item, waiting until there is one.
+
+        Returns None once the channel has been closed and all items have been consumed. If no item arrives (and the
+        channel is not closed) within the timeout, this raises timeout_error.
+        """
+        return self.take(timeout)[1]
+
+    def take(self, timeout = None):
+        """ Like get, but returns a (found, item) tuple, so that None can be told apart from the end of the channel. """
+        with self.lock:
+            if not wait_for(self.not_empty, lambda: self.items or self.closed, timeout):
+                raise self.timeout_error()
+            if self.items:
+                return True, self.items.popleft()
+            return False, None
+
+    def close(self):
+        """ Indicate that no further items will be added, waking up all waiting consumers. """
+        with self.lock:
+            self.closed = True
+            self.not_empty.notify_all()
+
+    def iterate(self, timeout = None):
+        """
+        Iterate over the items until the channel is closed and all items have been consumed.
+
+        The timeout applies to the wait for each item, see get.
+        """
+        while True:
+            found, item = self.take(timeout)
+            if not found:
+                return
+            yield item
+
+    def __iter__(self):
+        return self.iterate()
+
+    def __len__(self):
+        with self.lock:
+            return len(self.items)
@@ -2,14 +2,18 @@ from __future__ import division
 from __future__ import unicode_literals
 
 from collections import Counter
-from threading import Thread
-
-from lxml.html import fromstring
+import zlib
 
 from calibre.ebooks.metadata.book.base import Metadata
-from calibre.utils.cleantext import clean_ascii_chars
 
-from .config import plugin_prefs, KEY_THRESHOLD_ABSOLUTE, KEY_THRESHOLD_PERCENTAGE, KEY_THRESHOLD_PERCENTAGE_OF, KEY_SHELF_MAPPINGS
+from .cache import get_cache
+from .instrumentation import LazyFormat, Timings
+from .monitoring import metrics
+from .pool import rate_limiter
+from .retry import RetryPolicy, is_retryable
+from .settings import get_settings
+from .shelves import ChunkDecoder, ShelfStreamParser, decode_page, parse_shelves_text, parse_total
+from .sync import InFlight
 
 
 __license__ = 'BSD 3-clause'
@@ -17,6 +21,39 @@ __copyright__ = '2019, Michon van Dooren <michon1992@gmail.com>'
 __docformat__ = 'markdown en'
 
 URL_TEMPLATE = 'https://www.goodreads.com/book/shelves/{identifier}'
+PAGE_URL_TEMPLATE = URL_TEMPLATE + '?page={page}'
+
+# Returned instead of shelves when a conditional request indicates that the cached shelves are still valid.
+NOT_MODIFIED = object()
+# The headers that are set per request, and thus have to be removed from a cloned browser before each request.
+REQUEST_HEADERS = ('If-None-Match', 'If-Modified-Since', 'Accept-Encoding')
+# The size of the chunks in which a streamed response is read.
+CHUNK_SIZE = 4 * 1024
+# The HTTP status codes with which Goodreads indicates that it is receiving too many requests.
+THROTTLED_CODES = (429, 503)
+
+# The identifiers for which shelves are currently being retrieved, shared between all workers (even of different
+# identify calls) with the same settings and archive, so that concurrent workers for the same book only retrieve and
+# parse its shelves once. The workers share the same shelves dict, so it must not be modified after it has been
+# returned.
+in_flight = InFlight()
+
+
+def is_captcha_page(data):
+    """ Check whether the raw contents of a page are a captcha, which Goodreads serves when it wants fewer requests. """
+    return b'captcha' in data.lower()
+
+
+def get_retry_after(error):
+    """
+    Get the amount of seconds from the Retry-After header of an HTTP error, or None if there is no such header.
+
+    Only the form with an amount of seconds is supported, as that is what Goodreads uses.
+    """
+    try:
+        return float(error.info().get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
 
 
 class TagList(Counter):
@@ -60,113 +97,128 @@ class TagList(Counter):
         return [items[p - 1] if p <= len(items) else None for p in places]
 
 
-class Worker(Thread):
-    """ Get shelves that a Goodreads book belongs to, and convert these to tags. """
+def get_tags(shelves, settings, log, identifier, timings = None):
+    """
+    Convert a shelf name -> count dict to a TagList, using the mappings and thresholds of the given Settings.
+
+    This only depends on the shelves and the settings, so it can also be used to recompute the tags of cached shelves.
+    The time spent on the mapping and the thresholds is added to timings, if given.
+    """
+    if timings is None:
+        timings = Timings()
+
+    # Map the shelves to the corresponding tags.
+    with timings.measure('map'):
+        tags = TagList()
+        mapper = settings.mapper
+        for name, count in shelves.items():
+            for tag in mapper.get(name):
+                tags[tag] += count
+    log.debug(LazyFormat('[{}] Tags after mapping: {}', identifier, tags))
+
+    with timings.measure('threshold'):
+        apply_thresholds(tags, settings, log, identifier)
+    return tags
+
+
+def apply_thresholds(tags, settings, log, identifier):
+    """ Apply the absolute and percentage thresholds of the given Settings to a TagList. """
+    # Apply the absolute threshold.
+    threshold_abs = settings.threshold_absolute
+    tags.apply_threshold(threshold_abs)
+    log.debug(LazyFormat('[{}] Tags after applying absolute threshold ({}): {}', identifier, threshold_abs, tags))
+
+    # Calculate the percentage threshold.
+    threshold_pct_places = list(settings.threshold_percentage_of)
+    threshold_pct_items = list(filter(bool, tags.get_places(threshold_pct_places)))
+    log.debug(LazyFormat(
+        '[{}] Percentage threshold will be based on the following tags ({}): {}',
+        identifier,
+        threshold_pct_places,
+        threshold_pct_items,
+    ))
+    if threshold_pct_items:
+        threshold_pct_base = sum([item[1] for item in threshold_pct_items]) / len(threshold_pct_items)
+    else:
+        threshold_pct_base = 0
+    threshold_pct = threshold_pct_base * settings.threshold_percentage / 100
+    log.debug(LazyFormat(
+        '[{}] Percentage threshold is {}% of {}',
+        identifier,
+        settings.threshold_percentage,
+        threshold_pct_base,
+    ))
+
+    # Apply the percentage threshold.
+    tags.apply_threshold(threshold_pct)
+    log.debug(LazyFormat('[{}] Tags after applying percentage threshold ({}): {}', identifier, threshold_pct, tags))
+
+
+class Worker(object):
+    """
+    Get shelves that a Goodreads book belongs to, and convert these to tags.
 
-    def __init__(self, plugin, identifier, log = None, result_queue = None, timeout = 30, **data):
-        Thread.__init__(self)
-        self.daemon = True
+    This is meant to be run in the WorkerPool of the plugin.
+    """
 
+    def __init__(self, plugin, identifier, log = None, result_queue = None, timeout = None, settings = None,
+                 abort = None, archive = None, timings = None, **data):
         self.plugin = plugin
         self.identifier = identifier
         self.log = log
         self.result_queue = result_queue
-        self.timeout = timeout
+        self.settings = settings or get_settings()
+        self.abort = abort
+        self.archive = archive
         self.data = data
 
-        self.browser = plugin.browser.clone_browser()
+        # The time spent in each stage is kept per worker, and added to the Timings of the session (if any) when done.
+        self.timings = Timings()
+        self.session_timings = timings
+        self.created = self.timings.clock()
+
+        # The timeout is the one given to identify by calibre, which limits the time spent on retries.
+        self.retry_policy = RetryPolicy.from_settings(self.settings, timeout)
+
         self.url = URL_TEMPLATE.format(identifier = identifier)
+        self.validators = (None, None)
+        # The total amount of shelves of the book, from the summary on the first page (if any).
+        self.total = None
+        # Whether any shelves were found, to tell a book without tags from a book of which the shelves are unknown.
+        self.found_shelves = False
+        # Whether retrieving (a page of) the shelves failed, as opposed to the book having no (more) shelves.
+        self.failed = False
 
         self.log.debug('[{}] Created worker {}'.format(self.identifier, self.url))
 
     def run(self):
-        # Try to grab the page contents.
-        try:
-            self.log.info('[{}] Retrieving shelves from {}'.format(self.identifier, self.url))
-            data = self.browser.open_novisit(self.url, timeout = self.timeout).read()
-        except Exception as e:
-            self.log.error('[{identifier}] Failed to retrieve {url}: {error}'.format(
-                identifier = self.identifier,
-                url = self.url,
-                error = e.message,
-            ))
-            return
-
-        # Try to parse the page contents.
+        self.timings.add('queue-wait', self.timings.clock() - self.created)
         try:
-            data = data.decode('utf-8', errors = 'replace').strip()
-            root = fromstring(clean_ascii_chars(data))
-        except Exception as e:
-            self.log.error('[{identifier}] Failed to parse result of {url}: {error}'.format(
-                identifier = self.identifier,
-                url = self.url,
-                error = e.message,
-            ))
-            return
+            self.process()
+        finally:
+            self.log.debug(LazyFormat('[{}] Timings: {}', self.identifier, self.timings))
+            if self.session_timings is not None:
+                self.session_timings.merge(self.timings)
 
-        # Grab the shelves counters.
-        shelves = {}
-        for shelf in root.xpath('//div[contains(@class, "shelfStat")]'):
-            name = shelf.xpath('.//a[contains(@class, "actionLinkLite")]')[0].text_content().strip()
-            count = shelf.xpath('.//div[contains(@class, "smallText")]/a')[0].text_content().strip()
-            count = int(count.split()[0].replace(',', ''))
-            shelves[name] = count
+    def process(self):
+        metrics.increment('books')
+        shelves = self.get_shared_shelves()
         if not shelves:
-            self.log.error('[{}] Failed to find any shelf info on {}'.format(self.identifier, self.url))
+            metrics.increment('books_without_shelves')
             return
-        self.log.debug('[{}] Found shelves: {}'.format(self.identifier, shelves))
+        self.found_shelves = True
+        self.log.debug(LazyFormat('[{}] Found shelves: {}', self.identifier, shelves))
 
-        # Map the shelves to the corresponding tags.
-        tags = TagList()
-        mapping = plugin_prefs.get(KEY_SHELF_MAPPINGS)
-        for name, count in shelves.items():
-            if name not in mapping:
-                continue
-            for tag in mapping[name]:
-                tags[tag] += count
-        self.log.debug('[{}] Tags after mapping: {}'.format(self.identifier, tags))
-
-        # Apply the absolute threshold.
-        threshold_abs = plugin_prefs.get(KEY_THRESHOLD_ABSOLUTE)
-        tags.apply_threshold(threshold_abs)
-        self.log.debug('[{}] Tags after applying absolute threshold ({}): {}'.format(
-            self.identifier,
-            threshold_abs,
-            tags,
-        ))
-
-        # Calculate the percentage threshold.
-        threshold_pct_places = plugin_prefs.get(KEY_THRESHOLD_PERCENTAGE_OF)
-        threshold_pct_items = list(filter(bool, tags.get_places(threshold_pct_places)))
-        self.log.debug('[{}] Percentage threshold will be based on the following tags ({}): {}'.format(
-            self.identifier,
-            threshold_pct_places,
-            threshold_pct_items,
-        ))
-        if threshold_pct_items:
-            threshold_pct_base = sum([item[1] for item in threshold_pct_items]) / len(threshold_pct_items)
-        else:
-            threshold_pct_base = 0
-        threshold_pct = threshold_pct_base * plugin_prefs.get(KEY_THRESHOLD_PERCENTAGE) / 100
-        self.log.debug('[{}] Percentage threshold is {}% of {}'.format(
-            self.identifier,
-            plugin_prefs.get(KEY_THRESHOLD_PERCENTAGE),
-            threshold_pct_base,
-        ))
-
-        # Apply the percentage threshold.
-        tags.apply_threshold(threshold_pct)
-        self.log.debug('[{}] Tags after applying percentage threshold ({}): {}'.format(
-            self.identifier,
-            threshold_pct,
-            tags,
-        ))
+        tags = get_tags(shelves, self.settings, self.log, self.identifier, self.timings)
 
         if len(tags) == 0:
+            metrics.increment('books_without_tags')
             self.log.debug('[{}] No tags remain after mapping + filtering, skipping this one'.format(
                 self.identifier,
             ))
             return
+        metrics.increment('books_tagged')
+        metrics.observe('tags_per_book', len(tags))
 
         # Store the results
         meta = Metadata(None)
@@ -174,5 +226,430 @@ class Worker(Thread):
             meta.set(k, v)
         meta.set_identifier('goodreads', self.identifier)
         meta.tags = list(tags.keys())
-        self.result_queue.put(meta)
+        with self.timings.measure('result-wait'):
+            self.result_queue.put(meta)
+
+    def get_shared_shelves(self):
+        """
+        Get the shelves (see get_shelves), sharing the retrieval with concurrent workers for the same book.
+
+        If the worker that did the retrieval was aborted its result may be incomplete, so in that case the shelves are
+        retrieved again, unless this worker was aborted as well.
+        """
+        def retrieve():
+            return self.get_shelves(), self.aborted, self.failed
+
+        key = (self.identifier, self.settings, self.archive)
+        while True:
+            start = self.timings.clock()
+            (shelves, aborted, failed), shared = in_flight.do(key, retrieve)
+            if not shared:
+                return shelves
+            self.timings.add('shared-wait', self.timings.clock() - start)
+            if not aborted or self.aborted:
+                self.log.debug('[{}] Used the shelves retrieved by a concurrent worker'.format(self.identifier))
+                self.failed = failed
+                return shelves
+            self.log.debug('[{}] The concurrent worker retrieving the shelves was aborted, retrying'.format(
+                self.identifier,
+            ))
+
+    @property
+    def aborted(self):
+        """ Whether the abort event of this worker is set. """
+        return self.abort is not None and self.abort.is_set()
+
+    def get_shelves(self):
+        """ Get the shelves, either from the cache or from Goodreads, returning a shelf name -> count dict or None. """
+        cache = get_cache(self.settings)
+        if cache is None or self.archive is not None:
+            # When recording the pages have to be retrieved, and when replaying they should only come from the archive.
+            return self.fetch_shelves()
+
+        entry = cache.get_entry(self.identifier)
+        if entry is not None and not entry.expired:
+            cache.record('hit')
+            metrics.increment('cache_hits')
+            self.log.debug('[{}] Using cached shelves ({})'.format(self.identifier, cache.format_stats()))
+            return entry.shelves
+
+        # If there are expired shelves, ask Goodreads to only send the page if it has changed since.
+        shelves = self.fetch_shelves(entry)
+        if shelves is NOT_MODIFIED:
+            cache.record('revalidated')
+            metrics.increment('cache_revalidated')
+            cache.touch(self.identifier)
+            self.log.debug('[{}] Cached shelves are still valid ({})'.format(self.identifier, cache.format_stats()))
+            return entry.shelves
+        if not shelves:
+            return None
+        if self.failed:
+            # Some of the pages are missing, so these shelves should be retrieved again next time.
+            self.log.debug('[{}] Not caching the incomplete shelves'.format(self.identifier))
+            return shelves
+
+        cache.record('miss')
+        metrics.increment('cache_misses')
+        cache.set(self.identifier, shelves, *self.validators)
+        self.log.debug('[{}] Cached retrieved shelves ({})'.format(self.identifier, cache.format_stats()))
+        return shelves
+
+    def fetch_shelves(self, entry = None):
+        """
+        Retrieve the shelves from Goodreads, returning a shelf name -> count dict, or None on failure.
+
+        If a CacheEntry is given, its validators are used to make a conditional request, and if the shelves have not
+        changed since NOT_MODIFIED is returned.
+        """
+        shelves = self.fetch_page(1, entry)
+        if shelves is NOT_MODIFIED or not shelves:
+            return shelves
 
+        pages = self.get_page_count(len(shelves))
+        if pages > 1:
+            self.fetch_more_pages(shelves, pages)
+        return shelves
+
+    def get_page_count(self, page_size):
+        """
+        Get the amount of pages to retrieve, given the amount of shelves on the first page.
+
+        This is the setting, limited to the amount of pages the book has according to the total on the first page. Any
+        page after those would be empty.
+        """
+        pages = self.settings.pages
+        if self.total is not None:
+            pages = min(pages, max(1, (self.total + page_size - 1) // page_size))
+        return pages
+
+    def fetch_more_pages(self, shelves, pages):
+        """ Retrieve pages 2 up to and including the given page in parallel, merging their shelves into shelves. """
+        page_size = len(shelves)
+        futures = [(page, self.plugin.page_pool.submit(self.fetch_page, page)) for page in range(2, pages + 1)]
+        try:
+            for page, future in futures:
+                page_shelves = future.result()
+                if not page_shelves:
+                    break
+                for name, count in page_shelves.items():
+                    shelves[name] = max(count, shelves.get(name, 0))
+                if len(page_shelves) < page_size:
+                    self.log.debug('[{}] Page {} is the last page of shelves'.format(self.identifier, page))
+                    break
+        finally:
+            for page, future in futures:
+                future.cancel()
+
+    def fetch_page(self, page, entry = None, stream = None):
+        """
+        Retrieve a single page of shelves from Goodreads, returning a shelf name -> count dict, or None on failure.
+
+        For the first page, a conditional request is made if a CacheEntry is given, returning NOT_MODIFIED if the page
+        has not changed since. The validators of the response are stored in self.validators.
+
+        If stream is True (which defaults to the setting), the page is requested compressed and parsed while it is being
+        received. If that fails, the next attempt retrieves the page without streaming.
+
+        Failed requests are retried according to the retry policy, as long as the failure may be temporary.
+
+        If there is a ShelfArchive, the page is either read from it (when replaying) or added to it (when recording).
+        """
+        if self.archive is not None and self.archive.replaying:
+            return self.replay_page(page)
+        if stream is None:
+            # The raw contents are needed to record the page, and these are not available when streaming.
+            stream = self.settings.stream_pages and self.archive is None
+        if page == 1:
+            url = self.url
+        else:
+            url = PAGE_URL_TEMPLATE.format(identifier = self.identifier, page = page)
+
+        headers = []
+        if entry is not None and entry.etag:
+            headers.append(('If-None-Match', entry.etag))
+        if entry is not None and entry.last_modified:
+            headers.append(('If-Modified-Since', entry.last_modified))
+        if stream:
+            headers.append(('Accept-Encoding', 'gzip, deflate'))
+
+        attempt = 0
+        for attempt, timeout in self.retry_policy.attempts(self.abort):
+            if attempt > 1:
+                self.log.info('[{}] Retrying {} (attempt {} of {})'.format(
+                    self.identifier,
+                    url,
+                    attempt,
+                    self.retry_policy.max_attempts,
+                ))
+
+            # Wait for the rate limit, which counts towards the timeout of the attempt.
+            delay = rate_limiter.acquire(self.abort, timeout)
+            if delay is None:
+                if not self.aborted:
+                    self.log.warn('[{}] The rate limit does not allow retrieving {} in time'.format(
+                        self.identifier,
+                        url,
+                    ))
+                break
+            if delay:
+                self.timings.add('rate-limit', delay)
+                self.log.debug('[{}] Waited {:.2f}s for the rate limit'.format(self.identifier, delay))
+
+            # Try to grab the page contents.
+            try:
+                response, result = self.request_page(url, headers, stream, timeout - delay)
+            except Exception as e:
+                code = getattr(e, 'code', None)
+                if entry is not None and code == 304:
+                    rate_limiter.succeeded()
+                    return NOT_MODIFIED
+                metrics.increment('request_errors')
+                if code in THROTTLED_CODES:
+                    metrics.increment('throttled')
+                    retry_after = get_retry_after(e)
+                    rate_limiter.throttled(retry_after)
+                    self.log.warn('[{}] Throttled by Goodreads ({}), lowering the request rate{}'.format(
+                        self.identifier,
+                        code,
+                        ' and pausing for {}s'.format(retry_after) if retry_after else '',
+                    ))
+                if not is_retryable(e):
+                    self.log.error('[{identifier}] Failed to retrieve {url}: {error}'.format(
+                        identifier = self.identifier,
+                        url = url,
+                        error = e,
+                    ))
+                    self.failed = True
+                    return None
+                self.log.warn('[{identifier}] Failed to retrieve {url} (attempt {attempt}): {error}'.format(
+                    identifier = self.identifier,
+                    url = url,
+                    attempt = attempt,
+                    error = e,
+                ))
+                continue
+
+            if stream:
+                shelves = result
+                # Without shelves on the first page it may be an error page, which can only be recognized from the raw
+                # contents, so in that case the page is retrieved without streaming as well.
+                if shelves is None or (not shelves and page == 1):
+                    metrics.increment('parse_failures')
+                    self.log.warn('[{}] Failed to parse {} while streaming it, retrieving it without streaming'.format(
+                        self.identifier,
+                        url,
+                    ))
+                    stream = False
+                    headers = [header for header in headers if header[0] != 'Accept-Encoding']
+                    continue
+            else:
+                # Try to parse the page contents.
+                try:
+                    shelves = self.parse(result)
+                except Exception as e:
+                    metrics.increment('parse_failures')
+                    self.log.error('[{identifier}] Failed to parse result of {url}: {error}'.format(
+                        identifier = self.identifier,
+                        url = url,
+                        error = e,
+                    ))
+                    self.failed = True
+                    return None
+
+            if not shelves and page > 1 and (stream or not is_captcha_page(result)):
+                # The list of shelves ended on an earlier page, which is not an error.
+                self.log.debug('[{}] No shelves on {}, this is past the last page'.format(self.identifier, url))
+                rate_limiter.succeeded()
+                return shelves
+
+            if not shelves:
+                # Goodreads sometimes serves an error page instead of the shelves, so this is worth retrying.
+                metrics.increment('parse_failures')
+                if is_captcha_page(result):
+                    # This is how Goodreads throttles without saying so.
+                    metrics.increment('throttled')
+                    rate_limiter.throttled()
+                    self.log.warn('[{}] Got a captcha instead of {}, lowering the request rate'.format(
+                        self.identifier,
+                        url,
+                    ))
+                elif parse_total(result) is None or (page == 1 and entry is not None and entry.shelves):
+                    # Goodreads also throttles by serving an empty list of shelves. A book without shelves still has
+                    # the summary with the total, so only an empty list without it (or one for a book that is known to
+                    # have shelves) is treated as such.
+                    metrics.increment('throttled')
+                    rate_limiter.throttled()
+                    self.log.warn('[{}] Got no shelves on {} (attempt {}), lowering the request rate'.format(
+                        self.identifier,
+                        url,
+                        attempt,
+                    ))
+                else:
+                    self.log.warn('[{}] Failed to find any shelf info on {} (attempt {})'.format(
+                        self.identifier,
+                        url,
+                        attempt,
+                    ))
+                continue
+
+            rate_limiter.succeeded()
+            if self.archive is not None and not stream:
+                self.archive.write(self.identifier, page, result)
+            if page == 1:
+                info = response.info()
+                self.validators = (info.get('ETag'), info.get('Last-Modified'))
+                if not stream:
+                    self.total = parse_total(result)
+            return shelves
+
+        if self.aborted:
+            self.log.info('[{}] Aborted retrieving {}'.format(self.identifier, url))
+        else:
+            self.log.error('[{}] Giving up on {} after {} attempts'.format(self.identifier, url, attempt))
+        self.failed = True
+        return None
+
+    def replay_page(self, page):
+        """ Read a single page of shelves from the archive, returning a shelf name -> count dict or None on failure. """
+        data = self.archive.read(self.identifier, page)
+        if data is None and page > 1:
+            # Only the pages that had shelves are recorded, so the list of shelves ended on an earlier page.
+            self.log.debug('[{}] Page {} is not in the archive {}, this is past the last page'.format(
+                self.identifier,
+                page,
+                self.archive.path,
+            ))
+            return {}
+        if data is None:
+            self.log.error('[{}] Page {} is not in the archive {}'.format(self.identifier, page, self.archive.path))
+            self.failed = True
+            return None
+        if page == 1:
+            self.total = parse_total(data)
+        try:
+            shelves = self.parse(data)
+        except Exception as e:
+            self.log.error('[{}] Failed to parse page {} from the archive: {}'.format(self.identifier, page, e))
+            self.failed = True
+            return None
+        if not shelves:
+            self.log.error('[{}] Failed to find any shelf info in page {} from the archive'.format(
+                self.identifier,
+                page,
+            ))
+            self.failed = True
+            return None
+        return shelves
+
+    def parse(self, data):
+        """ Parse the raw contents of a page of shelves, see parse_shelves. """
+        with self.timings.measure('decode'):
+            text = decode_page(data)
+        with self.timings.measure('parse'):
+            shelves = parse_shelves_text(text)
+        self.timings.add('parse', 0, len(text))
+        return shelves
+
+    def request_page(self, url, headers, stream, timeout):
+        """
+        Make a single request for a page of shelves, returning the response and either the parsed shelves (if streaming,
+        see stream_shelves) or the raw contents.
+        """
+        self.log.info('[{}] Retrieving shelves from {}'.format(self.identifier, url))
+        metrics.increment('requests')
+        with self.plugin.pool.limit(url), metrics.measure('fetch_seconds'):
+            with self.timings.measure('fetch'):
+                response = self.open(url, headers, timeout)
+            try:
+                if stream:
+                    return response, self.stream_shelves(response, url)
+                with self.timings.measure('fetch'):
+                    data = response.read()
+                self.timings.add('fetch', 0, len(data))
+                return response, data
+            finally:
+                response.close()
+
+    def open(self, url, headers, timeout):
+        """ Open the url with the given additional headers, using the shared HTTPClient if possible. """
+        client = self.plugin.get_http_client() if self.settings.keep_alive else None
+        if client is not None:
+            return client.open(url, headers = headers, timeout = timeout)
+
+        # Browsers are not thread safe, and the pages of a book are retrieved in parallel, so each request gets a clone.
+        browser = self.plugin.browser.clone_browser()
+        browser.addheaders = [h for h in browser.addheaders if h[0] not in REQUEST_HEADERS] + headers
+        return browser.open_novisit(url, timeout = timeout)
+
+    def stream_shelves(self, response, url):
+        """
+        Parse the shelves from a response while it is being received, stopping as soon as the rest cannot matter.
+
+        Returns None if the response could not be processed this way, in which case it should be retrieved again without
+        streaming.
+        """
+        info = response.info()
+        try:
+            decoder = ChunkDecoder(info.get('Content-Encoding'))
+        except ValueError as e:
+            self.log.warn('[{}] {}'.format(self.identifier, e))
+            return None
+
+        parser = ShelfStreamParser()
+        received = decoded = 0
+        measure = self.timings.measure
+        try:
+            while not parser.done:
+                with measure('fetch'):
+                    chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                received += len(chunk)
+                with measure('decode'):
+                    text = decoder.decode(chunk)
+                decoded += len(text)
+                with measure('parse'):
+                    parser.feed(text)
+            if not parser.done:
+                with measure('decode'):
+                    text = decoder.decode(b'', final = True)
+                with measure('parse'):
+                    parser.feed(text)
+        except zlib.error as e:
+            self.log.warn('[{}] Failed to decompress {}: {}'.format(self.identifier, url, e))
+            return None
+        finally:
+            self.timings.add('fetch', 0, received)
+            self.timings.add('parse', 0, decoded)
+
+        if parser.done:
+            try:
+                length = int(info.get('Content-Length'))
+            except (TypeError, ValueError):
+                length = None
+            if length is not None:
+                self.log.debug('[{}] Stopped after {} of {} bytes ({}) of {}, skipping {} bytes'.format(
+                    self.identifier,
+                    received,
+                    length,
+                    info.get('Content-Encoding') or 'identity',
+                    url,
+                    length - received,
+                ))
+            else:
+                self.log.debug('[{}] Stopped after {} bytes ({}) of {}'.format(
+                    self.identifier,
+                    received,
+                    info.get('Content-Encoding') or 'identity',
+                    url,
+                ))
+        else:
+            self.log.debug('[{}] Received all {} bytes ({}) of {}'.format(
+                self.identifier,
+                received,
+                info.get('Content-Encoding') or 'identity',
+                url,
+            ))
+        self.total = parser.total if self.total is None else self.total
+        with measure('parse'):
+            return parser.close()
@@ -42,16 +42,21 @@ class MockResponse(object):
     def read(self, size=-1):
         return self.data.read(size)
 
+    def close(self):
+        self.data.close()
+
 
 @pytest.fixture
 def browser(monkeypatch):
     """
-    A fixture that will mock the browser instance of all plugins, making it possible to return static answers to the
-    requests.
+    A fixture that will mock the browser instance of all plugins (as well as the HTTPClient of this plugin), making it
+    possible to return static answers to the requests.
     """
     from calibre.utils.browser import Browser
+    from calibre_plugins.goodreads_more_tags.connections import HTTPClient
 
     browser = MockBrowser()
     monkeypatch.setattr(Browser, 'open_novisit', browser.open_novisit)
+    monkeypatch.setattr(HTTPClient, 'open', lambda self, url, headers = (), timeout = None: browser.open_novisit(url))
 
     return browser
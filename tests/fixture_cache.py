@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.fixture(autouse = True)
+def clear_shelf_cache(config_dir):
+    """
+    Start every test with an empty shelf cache.
+
+    Without this, shelves cached by one test would be used by later tests, meaning these would never hit the (mocked)
+    network.
+    """
+    from calibre_plugins.goodreads_more_tags.cache import clear_cache
+    clear_cache()
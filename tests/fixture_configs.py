@@ -33,7 +33,11 @@ class ConfigWrapper(object):
         return lambda s: s.get(key)
 
     def setter(self, key):
-        return lambda s, v: s.prefs.set(key, v)
+        def set(s, v):
+            from calibre_plugins.goodreads_more_tags.settings import invalidate_settings
+            s.prefs.set(key, v)
+            invalidate_settings()
+        return set
 
 
 @pytest.fixture(autouse = True, scope = 'session')
@@ -100,8 +104,10 @@ def config_instances():
 @pytest.fixture(autouse = True)
 def reset_config_instances(config_instances):
     def reset():
+        from calibre_plugins.goodreads_more_tags.settings import invalidate_settings
         for instance in config_instances:
             instance.clear()
+        invalidate_settings()
     reset()
     return reset
 
@@ -115,14 +121,18 @@ def configs(monkeypatch, tmpdir):
     Any changes made to the configs in this time will be reset after the tests finish.
     """
     # Wrap the config to make it easier to change.
-    import calibre_plugins.goodreads_more_tags.config as gmt_configmodule
+    import calibre_plugins.goodreads_more_tags.prefs as gmt_prefsmodule
     gmt_config = ConfigWrapper(
-        gmt_configmodule.plugin_prefs,
-        treshold_absolute = gmt_configmodule.KEY_THRESHOLD_ABSOLUTE,
-        treshold_percentage = gmt_configmodule.KEY_THRESHOLD_PERCENTAGE,
-        treshold_percentage_of = gmt_configmodule.KEY_THRESHOLD_PERCENTAGE_OF,
-        integration_enabled = gmt_configmodule.KEY_INTEGRATION_ENABLED,
-        integration_timeout = gmt_configmodule.KEY_INTEGRATION_TIMEOUT,
+        gmt_prefsmodule.plugin_prefs,
+        treshold_absolute = gmt_prefsmodule.KEY_THRESHOLD_ABSOLUTE,
+        treshold_percentage = gmt_prefsmodule.KEY_THRESHOLD_PERCENTAGE,
+        treshold_percentage_of = gmt_prefsmodule.KEY_THRESHOLD_PERCENTAGE_OF,
+        integration_enabled = gmt_prefsmodule.KEY_INTEGRATION_ENABLED,
+        integration_timeout = gmt_prefsmodule.KEY_INTEGRATION_TIMEOUT,
+        integration_streaming = gmt_prefsmodule.KEY_INTEGRATION_STREAMING,
+        retrieval_attempts = gmt_prefsmodule.KEY_RETRIEVAL_ATTEMPTS,
+        retrieval_pages = gmt_prefsmodule.KEY_RETRIEVAL_PAGES,
+        retrieval_stream = gmt_prefsmodule.KEY_RETRIEVAL_STREAM,
     )
 
     return Configs(goodreads_more_tags = gmt_config)
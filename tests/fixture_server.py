@@ -0,0 +1,103 @@
+from __future__ import unicode_literals
+from __future__ import with_statement
+
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from threading import Lock, Thread
+
+import pytest
+
+# The size of the chunks of a response with chunked transfer encoding.
+CHUNK_SIZE = 4096
+
+
+class LocalServer(ThreadingMixIn, HTTPServer):
+    """
+    A local HTTP/1.1 server that stands in for Goodreads, serving static responses and counting the connections made to
+    it.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), LocalRequestHandler)
+        self.lock = Lock()
+        self.routes = {}
+        self.connections = 0
+        self.requests = []
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def add_route(self, path, body = b'', code = 200, headers = None, drop = False, chunked = False):
+        """
+        Serve the given response for the given path.
+
+        If drop is set, the connection is closed after the response without telling the client, like a server that
+        closes an idle keep-alive connection. If chunked is set, the body is sent with chunked transfer encoding instead
+        of with a Content-Length.
+        """
+        self.routes[path] = (code, headers or {}, body, drop, chunked)
+
+    def get_route(self, path):
+        """ Get the (code, headers, body, drop, chunked) response for the given path. """
+        return self.routes.get(path, (404, {}, b'Not found', False, False))
+
+    def handle_error(self, request, client_address):
+        # Clients closing the connection halfway through a response is expected, so do not print these.
+        pass
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        return ThreadingMixIn.process_request(self, request, client_address)
+
+
+class LocalRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append((self.path, dict(self.headers)))
+        code, headers, body, drop, chunked = self.server.get_route(self.path)
+        self.send_response(code)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if chunked:
+            for start in range(0, len(body), CHUNK_SIZE):
+                chunk = body[start:start + CHUNK_SIZE]
+                self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('ascii') + chunk + b'\r\n')
+            self.wfile.write(b'0\r\n\r\n')
+        else:
+            self.wfile.write(body)
+        if drop:
+            self.close_connection = True
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serving(server):
+    """ Run the given server in a background thread for the duration of the with block. """
+    thread = Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def server():
+    """ A fixture that runs a LocalServer for the duration of a test. """
+    with serving(LocalServer()) as server:
+        yield server
@@ -0,0 +1,249 @@
+from __future__ import division
+from __future__ import unicode_literals
+
+from html import escape
+import math
+from random import Random
+import re
+import time
+
+import pytest
+
+from tests.fixture_server import LocalServer, serving
+
+DISTRIBUTION_ZIPF = 'zipf'
+DISTRIBUTION_EXPONENTIAL = 'exponential'
+DISTRIBUTION_UNIFORM = 'uniform'
+DISTRIBUTIONS = (DISTRIBUTION_ZIPF, DISTRIBUTION_EXPONENTIAL, DISTRIBUTION_UNIFORM)
+
+# Shelves that are common on real pages, which are used before any generated names so that the mappings have something
+# to work with.
+COMMON_SHELVES = (
+    'to-read', 'fantasy', 'currently-reading', 'favorites', 'fiction', 'epic-fantasy', 'owned', 'series', 'books-i-own',
+    'science-fiction', 'sci-fi', 'adventure', 'high-fantasy', 'grimdark', 'ebook', 'audiobook', 'dark-fantasy', 'magic',
+    'adult', 'kindle', 'war', 'sf', 'library', 'british', 'adult-fiction', 'young-adult', 'romance', 'mystery',
+    'thriller', 'horror', 'historical-fiction', 'classics', 'humor', 'dystopia', 'non-fiction', 'history',
+)
+
+# The real pages have about this much markup before and after the list of shelves.
+PADDING_BEFORE = 48 * 1024
+PADDING_AFTER = 10 * 1024
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html class="desktop">
+<head>
+  <title>Top shelves for Synthetic Book {identifier}</title>
+  <script type="text/javascript">
+{padding_before}
+  </script>
+</head>
+<body>
+<h1>
+  <a href="/book/show/{identifier}.Synthetic_Book">Synthetic Book {identifier}</a> &gt;
+  Top Shelves
+</h1>
+
+<div class="leftContainer">
+
+  Top shelves for Synthetic Book {identifier}   <span class="smallText">
+Showing {first:,}-{last:,} of {total:,}
+</span>
+
+ 	<br class="clear"/><br/>
+
+    <div class="left" style="width: 200px;">
+      {shelves}
+    </div>
+  <br class="clear"/>
+	<div style="float: right;">
+		<div>{pagination}</div>
+	</div>
+</div>
+
+<div class="rightContainer">
+  <script type="text/javascript">
+{padding_after}
+  </script>
+</div>
+</body>
+</html>
+'''
+EMPTY_PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html class="desktop">
+<head>
+  <title>Top shelves for Synthetic Book {identifier}</title>
+</head>
+<body>
+<div class="leftContainer">
+  No shelves found.
+</div>
+</body>
+</html>
+'''
+SHELF_TEMPLATE = '''<div class="shelfStat">
+  <div style="float: left; width: 100px;">
+    <a class="mediumText actionLinkLite" href="/genres/{name}">{name}</a>
+  </div>
+  <div class="smallText" style="text-align: right; width: 80px; float: right; margin-top: 4px;">
+    <a rel="nofollow" href="/shelf/users/{identifier}.Synthetic_Book?shelf={name}">{count:,} {people}</a>
+  </div>
+  <div class="clear"></div>
+</div>
+'''
+PAGE_LINK_TEMPLATE = '<a href="/work/shelves/{identifier}?page={page}">{page}</a>'
+
+
+def generate_shelves(count, distribution = DISTRIBUTION_ZIPF, top = 20000, seed = None):
+    """
+    Generate count shelves with a realistic distribution of the amount of people per shelf, as a list of (name, count)
+    sorted by count (like on the real pages).
+
+    The counts start at about top, and then drop off following the given distribution:
+
+    - zipf: the count of the nth shelf is about top / n, so there is a long tail of shelves with few people, like on
+      the real pages.
+    - exponential: the counts drop off evenly from top to 1 on a log scale, so there are more shelves with high counts.
+    - uniform: the counts are spread evenly between 1 and top, which is unrealistic but a worst case for thresholds.
+
+    >>> shelves = generate_shelves(1000, seed = 1)
+    >>> len(shelves), len(set(name for name, count in shelves))
+    (1000, 1000)
+    >>> shelves[0][0], shelves[0][1] >= shelves[-1][1] >= 1
+    ('to-read', True)
+    """
+    if distribution not in DISTRIBUTIONS:
+        raise ValueError('Unknown distribution {!r}, expected one of {}'.format(distribution, ', '.join(DISTRIBUTIONS)))
+    random = Random(seed)
+    counts = []
+    for rank in range(1, count + 1):
+        if distribution == DISTRIBUTION_ZIPF:
+            value = top / rank
+        elif distribution == DISTRIBUTION_EXPONENTIAL:
+            value = top * math.exp(-math.log(top) * (rank - 1) / max(1, count - 1))
+        else:
+            value = random.uniform(1, top)
+        # Some noise, so that the counts are not all perfectly regular.
+        counts.append(max(1, int(value * random.uniform(0.9, 1.1))))
+    counts.sort(reverse = True)
+
+    names = list(COMMON_SHELVES[:count])
+    names.extend('generated-shelf-{}'.format(i) for i in range(len(names) + 1, count + 1))
+    return list(zip(names, counts))
+
+
+def render_page(identifier, shelves, page = 1, page_size = 100, padding = True):
+    """
+    Render a page of shelves in the same markup as the real shelves pages, as utf-8 encoded bytes.
+
+    The shelves are a list of (name, count) as returned by generate_shelves, of which only the shelves that are on the
+    given page are included. If padding is set, the page is padded to the size of a real page.
+    """
+    pages = max(1, int(math.ceil(len(shelves) / page_size)))
+    start = (page - 1) * page_size
+    page_shelves = shelves[start:start + page_size]
+    if not page_shelves:
+        return EMPTY_PAGE_TEMPLATE.format(identifier = identifier).encode('utf-8')
+
+    pagination = []
+    if page > 1:
+        pagination.append('<a class="previous_page" rel="prev" href="/work/shelves/{}?page={}">« previous</a>'.format(
+            identifier,
+            page - 1,
+        ))
+    else:
+        pagination.append('<span class="previous_page disabled">« previous</span>')
+    for i in range(1, pages + 1):
+        if i == page:
+            pagination.append('<em class="current">{}</em>'.format(i))
+        else:
+            pagination.append(PAGE_LINK_TEMPLATE.format(identifier = identifier, page = i))
+    if page < pages:
+        pagination.append('<a class="next_page" rel="next" href="/work/shelves/{}?page={}">next »</a>'.format(
+            identifier,
+            page + 1,
+        ))
+    else:
+        pagination.append('<span class="next_page disabled">next »</span>')
+
+    return PAGE_TEMPLATE.format(
+        identifier = identifier,
+        first = start + 1,
+        last = start + len(page_shelves),
+        total = len(shelves),
+        shelves = ''.join(
+            SHELF_TEMPLATE.format(
+                identifier = identifier,
+                name = escape(name),
+                count = count,
+                people = 'person' if count == 1 else 'people',
+            )
+            for name, count in page_shelves
+        ),
+        pagination = ' '.join(pagination),
+        padding_before = get_padding(PADDING_BEFORE if padding else 0),
+        padding_after = get_padding(PADDING_AFTER if padding else 0),
+    ).encode('utf-8')
+
+
+def get_padding(size):
+    """ Get about size characters of javascript that does nothing. """
+    line = '  // Padding to make the page as large as the real pages.\n'
+    return line * (size // len(line))
+
+
+class ShelfServer(LocalServer):
+    """
+    A LocalServer that stands in for the shelves pages of Goodreads, serving generated pages for any book.
+
+    The shelves of a book are generated once (using the identifier as seed, so the same book always has the same
+    shelves) and can be retrieved with get_shelves to compare with what was parsed. Every response is delayed by the
+    latency (in seconds), to simulate the network.
+    """
+    # Allow many workers to connect at the same time.
+    request_queue_size = 1024
+    path_pattern = re.compile(r'^/book/shelves/(?P<identifier>\d+)(\?page=(?P<page>\d+))?$')
+
+    def __init__(self, shelves = 100, distribution = DISTRIBUTION_ZIPF, page_size = 100, latency = 0, padding = True):
+        LocalServer.__init__(self)
+        self.shelves = shelves
+        self.distribution = distribution
+        self.page_size = page_size
+        self.latency = latency
+        self.padding = padding
+        self.books = {}
+
+    @property
+    def url_template(self):
+        """ The url of the first page of the shelves of a book, like worker.URL_TEMPLATE. """
+        return self.url + '/book/shelves/{identifier}'
+
+    def get_shelves(self, identifier):
+        """ Get the shelves of a book, as a list of (name, count). """
+        identifier = str(identifier)
+        with self.lock:
+            if identifier not in self.books:
+                self.books[identifier] = generate_shelves(self.shelves, self.distribution, seed = int(identifier))
+            return self.books[identifier]
+
+    def get_route(self, path):
+        match = self.path_pattern.match(path)
+        if match is None:
+            return LocalServer.get_route(self, path)
+        if self.latency:
+            time.sleep(self.latency)
+        identifier = match.group('identifier')
+        body = render_page(
+            identifier,
+            self.get_shelves(identifier),
+            page = int(match.group('page') or 1),
+            page_size = self.page_size,
+            padding = self.padding,
+        )
+        return (200, { 'Content-Type': 'text/html; charset=utf-8' }, body, False, False)
+
+
+@pytest.fixture
+def shelf_server():
+    """ A fixture that runs a ShelfServer for the duration of a test, configurable through its attributes. """
+    with serving(ShelfServer()) as server:
+        yield server
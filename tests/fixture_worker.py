@@ -0,0 +1,27 @@
+from __future__ import unicode_literals
+
+from queue import Queue
+
+import pytest
+
+
+@pytest.fixture
+def create_worker():
+    """
+    A fixture to create Workers for a book, with a debug log and a new result queue unless these are given. Any other
+    keyword arguments are passed on to the Worker.
+    """
+    from calibre.customize.ui import find_plugin
+    from calibre.utils.logging import DEBUG, ThreadSafeLog
+    from calibre_plugins.goodreads_more_tags import GoodreadsMoreTags
+    from calibre_plugins.goodreads_more_tags.worker import Worker
+
+    def create_worker(identifier = '1', result_queue = None, log = None, **kwargs):
+        return Worker(
+            find_plugin(GoodreadsMoreTags.name),
+            identifier,
+            log = ThreadSafeLog(level = DEBUG) if log is None else log,
+            result_queue = Queue() if result_queue is None else result_queue,
+            **kwargs
+        )
+    return create_worker
@@ -0,0 +1,101 @@
+import os.path
+
+import pytest
+
+RESPONSES = os.path.join(os.path.dirname(__file__), '_responses')
+with open(os.path.join(RESPONSES, 'goodreads-shelves-902715.html'), 'rb') as f:
+    SHELVES_PAGE = f.read()
+
+
+class TestShelfArchive(object):
+    @pytest.fixture
+    def path(self, tmpdir):
+        return str(tmpdir.join('archive.zip'))
+
+    def test_roundtrip(self, path):
+        from calibre_plugins.goodreads_more_tags.archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+        with ShelfArchive(path, MODE_RECORD) as archive:
+            archive.write('1', 1, b'first page')
+            archive.write('1', 2, b'second page')
+        with ShelfArchive(path, MODE_REPLAY) as archive:
+            assert len(archive) == 2
+            assert archive.read('1', 1) == b'first page'
+            assert archive.read('1', 2) == b'second page'
+
+    def test_read__missing(self, path):
+        from calibre_plugins.goodreads_more_tags.archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+        with ShelfArchive(path, MODE_RECORD) as archive:
+            archive.write('1', 1, b'first page')
+        with ShelfArchive(path, MODE_REPLAY) as archive:
+            assert archive.read('1', 2) is None
+            assert archive.read('2', 1) is None
+
+    def test_write__keeps_existing(self, path):
+        from calibre_plugins.goodreads_more_tags.archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+        with ShelfArchive(path, MODE_RECORD) as archive:
+            archive.write('1', 1, b'old')
+        with ShelfArchive(path, MODE_RECORD) as archive:
+            archive.write('1', 1, b'new')
+            archive.write('2', 1, b'other')
+        with ShelfArchive(path, MODE_REPLAY) as archive:
+            assert len(archive) == 2
+            assert archive.read('1', 1) == b'old'
+
+    def test_invalid_mode(self, path):
+        from calibre_plugins.goodreads_more_tags.archive import ShelfArchive
+        with pytest.raises(ValueError):
+            ShelfArchive(path, 'delete')
+
+
+class TestWorkerArchive(object):
+    def test_record(self, browser, create_worker, tmpdir):
+        from calibre_plugins.goodreads_more_tags.archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+        browser.add_response(r'.*/book/shelves/902715$', SHELVES_PAGE)
+        path = str(tmpdir.join('archive.zip'))
+        with ShelfArchive(path, MODE_RECORD) as archive:
+            shelves = create_worker('902715', archive = archive).fetch_page(1)
+        assert shelves['fantasy'] == 5426
+        with ShelfArchive(path, MODE_REPLAY) as archive:
+            assert archive.read('902715', 1) == SHELVES_PAGE
+
+    @pytest.fixture
+    def requests(self, browser):
+        """ The urls that are requested from the (mocked) browser. """
+        requests = []
+
+        def respond(match):
+            requests.append(match.group(0))
+            return SHELVES_PAGE
+        browser.add_response(r'.*/book/shelves/902715$', respond)
+        return requests
+
+    def test_replay(self, requests, create_worker, tmpdir):
+        from calibre_plugins.goodreads_more_tags.archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+        path = str(tmpdir.join('archive.zip'))
+        with ShelfArchive(path, MODE_RECORD) as archive:
+            archive.write('902715', 1, SHELVES_PAGE)
+        with ShelfArchive(path, MODE_REPLAY) as archive:
+            shelves = create_worker('902715', archive = archive).fetch_page(1)
+        assert shelves['fantasy'] == 5426
+        assert requests == []
+
+    def test_replay__missing(self, requests, create_worker, tmpdir):
+        from calibre_plugins.goodreads_more_tags.archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+        path = str(tmpdir.join('archive.zip'))
+        ShelfArchive(path, MODE_RECORD).close()
+        with ShelfArchive(path, MODE_REPLAY) as archive:
+            worker = create_worker('902715', archive = archive)
+            assert worker.fetch_page(1) is None
+        assert worker.failed
+        assert requests == []
+
+    def test_replay__missing_later_page(self, requests, create_worker, tmpdir):
+        from calibre_plugins.goodreads_more_tags.archive import MODE_RECORD, MODE_REPLAY, ShelfArchive
+        path = str(tmpdir.join('archive.zip'))
+        with ShelfArchive(path, MODE_RECORD) as archive:
+            archive.write('902715', 1, SHELVES_PAGE)
+        with ShelfArchive(path, MODE_REPLAY) as archive:
+            worker = create_worker('902715', archive = archive)
+            assert worker.fetch_page(2) == {}
+        assert not worker.failed
+        assert requests == []
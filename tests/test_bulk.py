@@ -0,0 +1,192 @@
+from __future__ import unicode_literals
+
+import os.path
+from urllib.error import HTTPError
+
+import pytest
+
+from calibre.customize.ui import find_plugin
+from calibre_plugins.goodreads_more_tags import GoodreadsMoreTags
+
+
+@pytest.fixture(autouse = True)
+def setup_browser_mock(browser):
+    """ Serve the recorded shelves pages, returning a set of identifiers for which the server fails instead. """
+    basedir = os.path.join(os.path.dirname(__file__), '_responses')
+    failing = set()
+
+    def read_file(match):
+        if match.group('id') in failing:
+            raise HTTPError(match.group(0), 500, 'Internal Server Error', {}, None)
+        with open(os.path.join(basedir, 'goodreads-shelves-{}.html'.format(match.group('id'))), 'rb') as file:
+            return file.read()
+
+    browser.add_response(r'^https?://(www\.)?goodreads\.com/book/shelves/(?P<id>\d+)\D*$', read_file)
+    return failing
+
+
+@pytest.fixture
+def library(tmpdir):
+    """ Create a library with a book with a Goodreads identifier, one with just an isbn, and return its db. """
+    from calibre.ebooks.metadata.book.base import Metadata
+    from calibre.library import db
+
+    cache = db(str(tmpdir.join('library'))).new_api
+    book = Metadata('Before They Are Hanged', ['Joe Abercrombie'])
+    book.set_identifier('goodreads', '902715')
+    book.tags = ['Existing']
+    cache.create_book_entry(book)
+    book = Metadata('Something Else', ['Someone'])
+    book.set_identifier('isbn', '9780575077881')
+    cache.create_book_entry(book)
+    return cache
+
+
+@pytest.fixture
+def tagger(library, tmpdir):
+    from calibre.utils.logging import DEBUG, ThreadSafeLog
+    from calibre_plugins.goodreads_more_tags.bulk import BulkTagger
+
+    def tagger(**kwargs):
+        plugin = find_plugin(GoodreadsMoreTags.name)
+        state_path = str(tmpdir.join('state.json'))
+        return BulkTagger(plugin, library, ThreadSafeLog(level = DEBUG), state_path, **kwargs)
+    return tagger
+
+
+def get_tags(library):
+    return { book_id: sorted(tags) for book_id, tags in library.all_field_for('tags', library.all_book_ids()).items() }
+
+
+class TestBulkTagger(object):
+    def test_get_books(self, library, tagger):
+        assert [identifier for book_id, identifier in tagger().get_books()] == ['902715']
+
+    def test_run__adds_tags(self, library, tagger):
+        tagger().run()
+        assert list(get_tags(library).values()) == [
+            ['Adult', 'Adventure', 'Existing', 'Fantasy', 'Science Fiction', 'War'],
+            [],
+        ]
+
+    def test_run__replace(self, library, tagger):
+        tagger(replace = True).run()
+        assert list(get_tags(library).values()) == [
+            ['Adult', 'Adventure', 'Existing', 'Fantasy', 'Science Fiction', 'War'],
+            [],
+        ]
+
+    def test_run__replace_keeps_own_tags(self, library, tagger, configs):
+        book_id = tagger().get_books()[0][0]
+        library.set_field('tags', { book_id: ['Existing', 'War'] })
+        tagger().run()
+        configs.goodreads_more_tags.treshold_percentage = 100
+        tagger(replace = True).run(resume = False)
+        # Adult was added by the first run and no longer applies, but War was there before.
+        assert list(get_tags(library).values()) == [
+            ['Adventure', 'Existing', 'Fantasy', 'Science Fiction', 'War'],
+            [],
+        ]
+
+    def test_run__replace_without_tags(self, library, tagger, configs):
+        tagger().run()
+        configs.goodreads_more_tags.treshold_absolute = 10 ** 9
+        tagger(replace = True).run(resume = False)
+        assert list(get_tags(library).values()) == [['Existing'], []]
+
+    def test_run__dry_run(self, library, tagger):
+        tagger(dry_run = True).run()
+        assert list(get_tags(library).values()) == [['Existing'], []]
+
+    def test_run__resume(self, library, tagger):
+        book_id = tagger().get_books()[0][0]
+        tagger().save_state(book_id)
+        tagger().run()
+        assert list(get_tags(library).values()) == [['Existing'], []]
+
+    def test_run__failed_book_retried(self, library, tagger, tmpdir, monkeypatch):
+        from calibre_plugins.goodreads_more_tags.worker import Worker
+
+        def fail(self):
+            raise RuntimeError('Worker failed')
+        monkeypatch.setattr(Worker, 'process', fail)
+        tagger().run()
+        assert list(get_tags(library).values()) == [['Existing'], []]
+        assert tmpdir.join('state.json').check()
+
+        monkeypatch.undo()
+        tagger().run()
+        assert 'Fantasy' in list(get_tags(library).values())[0]
+        assert not tmpdir.join('state.json').check()
+
+    def test_run__retrieval_failed_retried(self, library, tagger, tmpdir, configs, setup_browser_mock):
+        configs.goodreads_more_tags.retrieval_attempts = 1
+        setup_browser_mock.add('902715')
+        tagger(replace = True).run()
+        assert list(get_tags(library).values()) == [['Existing'], []]
+        assert tmpdir.join('state.json').check()
+        assert tagger().load_state() == 0
+
+        setup_browser_mock.clear()
+        tagger().run()
+        assert 'Fantasy' in list(get_tags(library).values())[0]
+        assert not tmpdir.join('state.json').check()
+
+    def test_run__interrupted(self, library, tagger, tmpdir, monkeypatch):
+        from calibre_plugins.goodreads_more_tags import bulk
+
+        def interrupt(self, timeout = None, abort = None):
+            raise KeyboardInterrupt()
+        monkeypatch.setattr(bulk.CountDownLatch, 'wait', interrupt)
+        bulk_tagger = tagger()
+        with pytest.raises(KeyboardInterrupt):
+            bulk_tagger.run()
+        assert bulk_tagger.abort.is_set()
+        assert tmpdir.join('state.json').check()
+        assert bulk_tagger.load_state() == 0
+
+        monkeypatch.undo()
+        tagger().run()
+        assert 'Fantasy' in list(get_tags(library).values())[0]
+
+    def test_run__restart(self, library, tagger):
+        book_id = tagger().get_books()[0][0]
+        tagger().save_state(book_id)
+        tagger().run(resume = False)
+        assert 'Fantasy' in list(get_tags(library).values())[0]
+
+
+class TestBulkTaggerRescore(object):
+    def test_rescore(self, library, tagger, configs):
+        tagger(replace = True).run()
+        configs.goodreads_more_tags.treshold_percentage = 100
+        assert tagger(replace = True).rescore()
+        assert list(get_tags(library).values()) == [['Adventure', 'Existing', 'Fantasy', 'Science Fiction'], []]
+
+    def test_rescore__without_tags(self, library, tagger, configs):
+        tagger().run()
+        configs.goodreads_more_tags.treshold_absolute = 10 ** 9
+        assert tagger(replace = True).rescore()
+        assert list(get_tags(library).values()) == [['Existing'], []]
+
+    def test_rescore__add_only(self, library, tagger, configs):
+        tagger().run()
+        configs.goodreads_more_tags.treshold_percentage = 100
+        assert tagger().rescore()
+        assert list(get_tags(library).values()) == [
+            ['Adult', 'Adventure', 'Existing', 'Fantasy', 'Science Fiction', 'War'],
+            [],
+        ]
+
+    def test_rescore__not_cached(self, library, tagger):
+        assert tagger(replace = True).rescore()
+        assert list(get_tags(library).values()) == [['Existing'], []]
+
+    def test_rescore__dry_run(self, library, tagger, configs):
+        tagger(replace = True).run()
+        configs.goodreads_more_tags.treshold_percentage = 100
+        tagger(replace = True, dry_run = True).rescore()
+        assert list(get_tags(library).values()) == [
+            ['Adult', 'Adventure', 'Existing', 'Fantasy', 'Science Fiction', 'War'],
+            [],
+        ]
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+
+
+class TestShelfCache(object):
+    @pytest.fixture
+    def create(self, tmpdir):
+        from calibre_plugins.goodreads_more_tags.cache import ShelfCache
+
+        def create(ttl = 60, size = 10):
+            return ShelfCache(str(tmpdir.join('cache.sqlite')), ttl, size)
+        return create
+
+    def test_get__missing(self, create):
+        cache = create()
+        assert cache.get('1') is None
+
+    def test_set_get__roundtrip(self, create):
+        cache = create()
+        cache.set('1', { 'fantasy': 10, 'to-read': 20 })
+        assert cache.get('1') == { 'fantasy': 10, 'to-read': 20 }
+
+    def test_set__overwrite(self, create):
+        cache = create()
+        cache.set('1', { 'fantasy': 10 })
+        cache.set('1', { 'fantasy': 12 })
+        assert cache.get('1') == { 'fantasy': 12 }
+        assert len(cache) == 1
+
+    def test_get__expired(self, create):
+        cache = create(ttl = 0)
+        cache.set('1', { 'fantasy': 10 })
+        time.sleep(0.01)
+        assert cache.get('1') is None
+
+    def test_get_many(self, create):
+        cache = create(ttl = 0)
+        cache.set('1', { 'fantasy': 10 })
+        cache.set('2', { 'fantasy': 12 })
+        assert cache.get_many(['1', '2', '3']) == { '1': { 'fantasy': 10 }, '2': { 'fantasy': 12 } }
+
+    def test_persistent(self, create):
+        create().set('1', { 'fantasy': 10 })
+        assert create().get('1') == { 'fantasy': 10 }
+
+    def test_evict__least_recently_used(self, create):
+        cache = create(size = 2)
+        cache.set('1', { 'fantasy': 1 })
+        cache.set('2', { 'fantasy': 2 })
+        cache.set('3', { 'fantasy': 3 })
+        time.sleep(0.01)
+        cache.get('1')
+        cache.evict()
+        assert len(cache) == 2
+        assert cache.get('1') is not None
+        assert cache.get('2') is None
+        assert cache.get('3') is not None
+
+    def test_clear(self, create):
+        cache = create()
+        cache.set('1', { 'fantasy': 10 })
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_get_entry__expired(self, create):
+        cache = create(ttl = 0)
+        cache.set('1', { 'fantasy': 10 }, etag = '"abc"', last_modified = 'Sat, 01 Jun 2019 00:00:00 GMT')
+        time.sleep(0.01)
+        entry = cache.get_entry('1')
+        assert entry.shelves == { 'fantasy': 10 }
+        assert entry.expired
+        assert entry.etag == '"abc"'
+        assert entry.last_modified == 'Sat, 01 Jun 2019 00:00:00 GMT'
+
+    def test_touch(self, create):
+        cache = create(ttl = 0.05)
+        cache.set('1', { 'fantasy': 10 })
+        time.sleep(0.1)
+        assert cache.get('1') is None
+        cache.touch('1')
+        assert cache.get('1') == { 'fantasy': 10 }
+
+    def test_migrate__added_columns(self, create, tmpdir):
+        import sqlite3
+        connection = sqlite3.connect(str(tmpdir.join('cache.sqlite')))
+        with connection:
+            connection.execute(
+                'CREATE TABLE shelves (identifier TEXT PRIMARY KEY, shelves TEXT, fetched REAL, accessed REAL)',
+            )
+            now = time.time()
+            connection.execute("INSERT INTO shelves VALUES ('1', '{\"fantasy\": 10}', ?, ?)", (now, now))
+        connection.close()
+
+        entry = create().get_entry('1')
+        assert entry.shelves == { 'fantasy': 10 }
+        assert entry.etag is None
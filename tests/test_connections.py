@@ -0,0 +1,141 @@
+import os.path
+from threading import Thread
+from urllib.error import HTTPError
+
+import pytest
+
+RESPONSES = os.path.join(os.path.dirname(__file__), '_responses')
+with open(os.path.join(RESPONSES, 'goodreads-shelves-902715.html'), 'rb') as f:
+    SHELVES_PAGE = f.read()
+
+
+@pytest.fixture
+def client():
+    from calibre_plugins.goodreads_more_tags.connections import HTTPClient
+    client = HTTPClient(4, [('User-Agent', 'test')])
+    yield client
+    client.clear()
+
+
+def get_stats(client):
+    """ Get the sum of the stats of all pools of the client. """
+    stats = { 'created': 0, 'reused': 0 }
+    for pool in client.pools.values():
+        for name, count in pool.stats.items():
+            stats[name] += count
+    return stats
+
+
+class TestHTTPClient(object):
+    def test_open(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE)
+        response = client.open(server.url + '/book/shelves/1', timeout = 5)
+        assert response.read() == SHELVES_PAGE
+        assert response.info().get('Content-Length') == str(len(SHELVES_PAGE))
+
+    def test_headers(self, server, client):
+        server.add_route('/', b'ok')
+        client.open(server.url + '/', headers = [('If-None-Match', '"abc"')], timeout = 5).read()
+        path, headers = server.requests[0]
+        assert headers['User-Agent'] == 'test'
+        assert headers['If-None-Match'] == '"abc"'
+
+    def test_reuses_connection(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE)
+        for _ in range(10):
+            assert client.open(server.url + '/book/shelves/1', timeout = 5).read() == SHELVES_PAGE
+        assert server.connections == 1
+        assert get_stats(client) == { 'created': 1, 'reused': 9 }
+
+    def test_reuses_connection__chunks(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE)
+        for _ in range(3):
+            response = client.open(server.url + '/book/shelves/1', timeout = 5)
+            while response.read(4096):
+                pass
+        assert server.connections == 1
+
+    def test_reuses_connection__concurrent(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE)
+        results = []
+
+        def fetch():
+            for _ in range(10):
+                results.append(client.open(server.url + '/book/shelves/1', timeout = 5).read() == SHELVES_PAGE)
+
+        threads = [Thread(target = fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(10)
+        assert results == [True] * 40
+        assert server.connections <= 4
+
+    def test_close__small_remainder_reuses(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE)
+        response = client.open(server.url + '/book/shelves/1', timeout = 5)
+        response.read(len(SHELVES_PAGE) - 1000)
+        response.close()
+        client.open(server.url + '/book/shelves/1', timeout = 5).read()
+        assert server.connections == 1
+
+    def test_close__large_remainder_discards(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE)
+        response = client.open(server.url + '/book/shelves/1', timeout = 5)
+        response.read(1000)
+        response.close()
+        client.open(server.url + '/book/shelves/1', timeout = 5).read()
+        assert server.connections == 2
+
+    def test_reuses_connection__chunked(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE, chunked = True)
+        for _ in range(3):
+            response = client.open(server.url + '/book/shelves/1', timeout = 5)
+            assert response.info().get('Transfer-Encoding') == 'chunked'
+            assert response.read() == SHELVES_PAGE
+        assert server.connections == 1
+        assert get_stats(client) == { 'created': 1, 'reused': 2 }
+
+    def test_close__chunked_small_remainder_reuses(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE, chunked = True)
+        response = client.open(server.url + '/book/shelves/1', timeout = 5)
+        response.read(len(SHELVES_PAGE) - 1000)
+        response.close()
+        client.open(server.url + '/book/shelves/1', timeout = 5).read()
+        assert server.connections == 1
+
+    def test_close__chunked_large_remainder_discards(self, server, client):
+        server.add_route('/book/shelves/1', SHELVES_PAGE, chunked = True)
+        response = client.open(server.url + '/book/shelves/1', timeout = 5)
+        response.read(1000)
+        response.close()
+        client.open(server.url + '/book/shelves/1', timeout = 5).read()
+        assert server.connections == 2
+
+    def test_http_error(self, server, client):
+        server.add_route('/', b'ok')
+        with pytest.raises(HTTPError) as excinfo:
+            client.open(server.url + '/missing', timeout = 5)
+        assert excinfo.value.code == 404
+        client.open(server.url + '/', timeout = 5).read()
+        assert server.connections == 1
+
+    def test_not_modified(self, server, client):
+        server.add_route('/', code = 304, headers = { 'ETag': '"abc"' })
+        with pytest.raises(HTTPError) as excinfo:
+            client.open(server.url + '/', timeout = 5)
+        assert excinfo.value.code == 304
+
+    def test_redirect(self, server, client):
+        server.add_route('/book/shelves/1', code = 301, headers = { 'Location': '/work/shelves/2' })
+        server.add_route('/work/shelves/2', SHELVES_PAGE)
+        response = client.open(server.url + '/book/shelves/1', timeout = 5)
+        assert response.read() == SHELVES_PAGE
+        assert response.geturl() == server.url + '/work/shelves/2'
+
+    def test_dropped_connection(self, server, client):
+        server.add_route('/drop', b'ok', drop = True)
+        server.add_route('/', b'ok')
+        assert client.open(server.url + '/drop', timeout = 5).read() == b'ok'
+        assert client.open(server.url + '/', timeout = 5).read() == b'ok'
+        assert server.connections == 2
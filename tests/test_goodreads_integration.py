@@ -5,14 +5,10 @@ import os.path
 import re
 import time
 from threading import Event, Thread
+from unittest.mock import Mock
 
 import pytest
 
-try:
-    from unittest.mock import Mock
-except ImportError:
-    from mock import Mock
-
 from calibre.customize.ui import find_plugin
 from calibre.ebooks.metadata.sources.amazon import Amazon
 from calibre_plugins.goodreads import Goodreads
@@ -145,6 +141,18 @@ class TestTemporaryQueue(object):
 
         assert queue.get() is None
 
+    def test_get__timeout(self):
+        queue = tm.TemporaryQueue()
+        with pytest.raises(tm.QueueTimeoutError):
+            queue.get(0.1)
+
+    def test_kill__iterate_remaining(self):
+        queue = tm.TemporaryQueue()
+        queue.put(15)
+        queue.put(16)
+        queue.kill()
+        assert list(queue) == [15, 16]
+
 
 class TestInterceptMethod(object):
     def sum(self, a, b):
@@ -1,9 +1,14 @@
 from __future__ import unicode_literals
 
+import os
+from queue import Queue
+from threading import Event, Thread
+
 import pytest
 
 from calibre.customize.ui import find_plugin
 from calibre_plugins.goodreads_more_tags import GoodreadsMoreTags
+from calibre_plugins.goodreads_more_tags.goodreads_integration import QueueHandler, SharedData
 
 
 @pytest.fixture(autouse = True)
@@ -11,6 +16,21 @@ def disable_integration(configs):
     configs.goodreads_more_tags.integration_enabled = False
 
 
+def simulate_goodreads(abort, identifiers):
+    """ Do what the integration does when the Goodreads plugin finds the given books. """
+    from calibre.ebooks.metadata.book.base import Metadata
+    queue = QueueHandler.get_instance().create_queue(abort)
+    shared_data = [SharedData(identifier) for identifier in identifiers]
+    for shared_datum in shared_data:
+        queue.put(shared_datum)
+    queue.kill()
+    for shared_datum in shared_data:
+        result = Metadata('Title {}'.format(shared_datum.identifier), ['Author {}'.format(shared_datum.identifier)])
+        result.set_identifier('goodreads', shared_datum.identifier)
+        shared_datum.results.put(result)
+        shared_datum.is_done.set()
+
+
 class TestIdentify(object):
     def test_goodreads_id(self, identify):
         results = identify(plugins = [GoodreadsMoreTags], identifiers = { 'goodreads': '902715' })
@@ -38,3 +58,75 @@ class TestIdentify(object):
     def test_isbn(self, identify):
         results = identify(plugins = [GoodreadsMoreTags], identifiers = { 'isbn': '9780575077881' })
         assert len(results) == 0
+
+
+class TestIdentifyStreaming(object):
+    @pytest.fixture
+    def plugin(self, configs, monkeypatch):
+        from calibre.customize.ui import find_plugin
+        configs.goodreads_more_tags.integration_enabled = True
+        configs.goodreads_more_tags.integration_streaming = True
+        plugin = find_plugin(GoodreadsMoreTags.name)
+        monkeypatch.setattr(plugin, 'is_integrated', True, raising = False)
+        return plugin
+
+    @pytest.fixture
+    def release(self, browser):
+        """ Serve the shelves of both books, holding back the shelves of 2591661 until the returned event is set. """
+        release = Event()
+
+        def respond(match):
+            if match.group(1) == '2591661':
+                release.wait(5)
+            with open(os.path.join(os.path.dirname(__file__), '_responses', 'goodreads-shelves-{}.html'.format(
+                match.group(1),
+            )), 'rb') as f:
+                return f.read()
+        browser.add_response(r'.*/book/shelves/(\d+)$', respond)
+        yield release
+        release.set()
+
+    def start(self, plugin, abort, results):
+        """ Start an identify with a simulated Goodreads plugin that found both books, and return its thread. """
+        from calibre.utils.logging import DEBUG, ThreadSafeLog
+        simulate_goodreads(abort, ['902715', '2591661'])
+        thread = Thread(target = plugin.identify, args = (ThreadSafeLog(level = DEBUG), results, abort))
+        thread.start()
+        return thread
+
+    def test_results_before_all_workers_done(self, plugin, release):
+        abort = Event()
+        results = Queue()
+        thread = self.start(plugin, abort, results)
+        assert results.get(timeout = 5).identifiers['goodreads'] == '902715'
+        assert thread.is_alive()
+        release.set()
+        thread.join(5)
+        assert results.get_nowait().identifiers['goodreads'] == '2591661'
+
+    def test_results_kept_on_abort(self, plugin, release):
+        abort = Event()
+        results = Queue()
+        thread = self.start(plugin, abort, results)
+        first = results.get(timeout = 5)
+        abort.set()
+        thread.join(5)
+        assert not thread.is_alive()
+        assert results.empty()
+        assert first.identifiers['goodreads'] == '902715'
+        assert sorted(first.tags) == ['Adult', 'Adventure', 'Fantasy', 'Science Fiction', 'War']
+
+    def test_same_results_as_batched(self, configs, plugin, release):
+        release.set()
+        copies = []
+        for streaming in [True, False]:
+            configs.goodreads_more_tags.integration_streaming = streaming
+            results = Queue()
+            self.start(plugin, Event(), results).join(5)
+            copies.append(sorted(
+                (result.title, result.authors, result.identifiers, sorted(result.tags))
+                for result in [results.get_nowait() for _ in range(results.qsize())]
+            ))
+        assert len(copies[0]) == 2
+        assert copies[0][0][:3] == ('Title 2591661', ['Author 2591661'], { 'goodreads': '2591661' })
+        assert copies[0] == copies[1]
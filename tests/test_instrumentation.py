@@ -0,0 +1,98 @@
+import os.path
+
+import pytest
+
+RESPONSES = os.path.join(os.path.dirname(__file__), '_responses')
+with open(os.path.join(RESPONSES, 'goodreads-shelves-902715.html'), 'rb') as f:
+    SHELVES_PAGE = f.read()
+
+
+class TestLazyFormat(object):
+    def test_not_formatted_until_used(self):
+        from calibre_plugins.goodreads_more_tags.instrumentation import LazyFormat
+
+        class Value(object):
+            formatted = 0
+
+            def __format__(self, spec):
+                Value.formatted += 1
+                return 'value'
+
+        message = LazyFormat('[{}] {}', 1, Value())
+        assert Value.formatted == 0
+        assert str(message) == '[1] value'
+        assert Value.formatted == 1
+
+    def test_skipped_by_log(self):
+        from calibre.utils.logging import WARN, ThreadSafeLog
+        from calibre_plugins.goodreads_more_tags.instrumentation import LazyFormat
+
+        class Value(object):
+            def __format__(self, spec):
+                raise AssertionError('Should not be formatted')
+
+        ThreadSafeLog(level = WARN).debug(LazyFormat('{}', Value()))
+
+
+class TestTimings(object):
+    @pytest.fixture
+    def timings(self):
+        from calibre_plugins.goodreads_more_tags.instrumentation import Timings
+        now = [0]
+        timings = Timings(clock = lambda: now[0])
+        timings.now = now
+        return timings
+
+    def test_measure(self, timings):
+        with timings.measure('fetch'):
+            timings.now[0] += 2
+        with timings.measure('fetch'):
+            timings.now[0] += 1
+        assert timings.get('fetch') == (3, 0)
+
+    def test_measure__exception(self, timings):
+        with pytest.raises(ValueError):
+            with timings.measure('parse'):
+                timings.now[0] += 1
+                raise ValueError()
+        assert timings.get('parse') == (1, 0)
+
+    def test_merge(self, timings):
+        from calibre_plugins.goodreads_more_tags.instrumentation import Timings
+        other = Timings()
+        other.add('fetch', 1.5, 1024)
+        other.add('custom', 1)
+        timings.add('fetch', 0.5, 1024)
+        timings.merge(other)
+        assert timings.get('fetch') == (2, 2048)
+        assert timings.get('custom') == (1, 0)
+
+    def test_format__order(self, timings):
+        timings.add('custom', 1)
+        timings.add('threshold', 0.5)
+        timings.add('fetch', 1, 512)
+        assert timings.format() == 'fetch 1.00s (512 B), threshold 500.0ms, custom 1.00s'
+
+    def test_format__empty(self, timings):
+        assert timings.format() == 'nothing recorded'
+
+
+class TestWorkerTimings(object):
+    @pytest.fixture(autouse = True)
+    def unlimited_rate(self, monkeypatch):
+        from calibre_plugins.goodreads_more_tags import worker
+        from calibre_plugins.goodreads_more_tags.pool import RateLimiter
+        monkeypatch.setattr(worker, 'rate_limiter', RateLimiter(0))
+
+    @pytest.mark.parametrize('stream', [True, False])
+    def test_stages(self, configs, browser, create_worker, stream):
+        from calibre_plugins.goodreads_more_tags.instrumentation import Timings
+
+        configs.goodreads_more_tags.retrieval_stream = stream
+        browser.add_response(r'.*/book/shelves/902715$', SHELVES_PAGE)
+        timings = Timings()
+        create_worker('902715', timings = timings).run()
+
+        assert 0 < timings.get('fetch')[1] <= len(SHELVES_PAGE)
+        for stage in ('queue-wait', 'fetch', 'decode', 'parse', 'map', 'threshold', 'result-wait'):
+            assert stage in timings.stages
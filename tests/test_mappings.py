@@ -0,0 +1,100 @@
+import pytest
+
+
+class TestShelfMapper(object):
+    @pytest.fixture
+    def create(self):
+        from calibre_plugins.goodreads_more_tags.mappings import ShelfMapper
+        return ShelfMapper
+
+    def test_get__exact(self, create):
+        mapper = create({ 'fantasy': ['Fantasy'] })
+        assert mapper.get('fantasy') == ['Fantasy']
+
+    def test_get__normalized(self, create):
+        mapper = create({ 'young-adult': ['Young Adult'] })
+        assert mapper.get('Young_Adult') == ['Young Adult']
+        assert mapper.get('young adult') == ['Young Adult']
+
+    def test_get__normalized_duplicates_merged(self, create):
+        mapper = create({ 'sci-fi': ['Science Fiction'], 'Sci_Fi': ['Science Fiction', 'Fiction'] })
+        assert sorted(mapper.get('sci-fi')) == ['Fiction', 'Science Fiction']
+
+    def test_get__glob(self, create):
+        mapper = create({ '*-fantasy': ['Fantasy'] })
+        assert mapper.get('urban-fantasy') == ['Fantasy']
+        assert mapper.get('fantasy') == []
+
+    def test_get__regex(self, create):
+        mapper = create({ 're:graphic-novels(-.*)?': ['Comics'] })
+        assert mapper.get('graphic-novels') == ['Comics']
+        assert mapper.get('graphic-novels-comics-manga') == ['Comics']
+        assert mapper.get('graphic') == []
+
+    def test_get__regex_must_match_entirely(self, create):
+        mapper = create({ 're:fantasy': ['Fantasy'] })
+        assert mapper.get('urban-fantasy') == []
+
+    def test_get__exact_before_pattern(self, create):
+        mapper = create({ 'dark-fantasy': ['Horror'], '*-fantasy': ['Fantasy'] })
+        assert mapper.get('dark-fantasy') == ['Horror']
+        assert mapper.get('epic-fantasy') == ['Fantasy']
+
+    def test_get__first_pattern_wins(self, create):
+        mapper = create({ '*-fantasy': ['Fantasy'], 're:(.*)-fantasy': ['Other'] })
+        assert mapper.get('epic-fantasy') == ['Fantasy']
+
+    def test_get__unmapped(self, create):
+        mapper = create({ 'fantasy': ['Fantasy'], '*-fantasy': ['Fantasy'] })
+        assert mapper.get('to-read') == []
+
+    def test_get__invalid_regex_skipped(self, create):
+        mapper = create({ 're:(fantasy': ['Other'], 'fantasy': ['Fantasy'], '*-fantasy': ['Fantasy'] })
+        assert mapper.get('fantasy') == ['Fantasy']
+        assert mapper.get('epic-fantasy') == ['Fantasy']
+        assert list(mapper.invalid) == ['re:(fantasy']
+
+    def test_get__conflicting_groups(self, create):
+        mapper = create({ 're:(?P<x>sci)-fi': ['Science Fiction'], 're:(?P<x>epic)-fantasy': ['Fantasy'] })
+        assert mapper.get('sci-fi') == ['Science Fiction']
+        assert mapper.get('epic-fantasy') == ['Fantasy']
+        assert mapper.invalid == {}
+
+
+class TestValidateKey(object):
+    def test_valid(self):
+        from calibre_plugins.goodreads_more_tags.mappings import validate_key
+        assert validate_key('fantasy') is None
+        assert validate_key('*-fantasy') is None
+        assert validate_key('re:sci-?fi-.*') is None
+
+    def test_invalid(self):
+        from calibre_plugins.goodreads_more_tags.mappings import validate_key
+        assert validate_key('re:(sci-fi') is not None
+
+
+class TestGetMapper(object):
+    def test_reused(self):
+        from calibre_plugins.goodreads_more_tags.mappings import get_mapper
+        assert get_mapper() is get_mapper()
+
+    def test_rebuilt_on_change(self):
+        from calibre_plugins.goodreads_more_tags.mappings import get_mapper
+        from calibre_plugins.goodreads_more_tags.prefs import plugin_prefs, KEY_SHELF_MAPPINGS
+        mapper = get_mapper()
+        plugin_prefs.set(KEY_SHELF_MAPPINGS, { 'to-read': ['Unread'] })
+        assert get_mapper() is not mapper
+        assert get_mapper().get('to-read') == ['Unread']
+
+    def test_invalid_regex(self):
+        from calibre_plugins.goodreads_more_tags.mappings import get_mapper
+        from calibre_plugins.goodreads_more_tags.prefs import plugin_prefs, KEY_SHELF_MAPPINGS
+        plugin_prefs.set(KEY_SHELF_MAPPINGS, { 're:(to-read': ['Unread'], 'fantasy': ['Fantasy'] })
+        assert get_mapper().get('fantasy') == ['Fantasy']
+        assert 're:(to-read' in get_mapper().invalid
+
+    def test_invalidate(self):
+        from calibre_plugins.goodreads_more_tags.mappings import get_mapper, invalidate_mapper
+        mapper = get_mapper()
+        invalidate_mapper()
+        assert get_mapper() is not mapper
@@ -0,0 +1,96 @@
+import json
+
+import pytest
+
+
+class TestHistogram(object):
+    def test_percentile__empty(self):
+        from calibre_plugins.goodreads_more_tags.monitoring import Histogram
+        assert Histogram([1, 2]).percentile(50) is None
+
+    @pytest.mark.parametrize('percentile,expected', [
+        (10, 1),
+        (50, 5.5),
+        (90, 10),
+    ])
+    def test_percentile__interpolated(self, percentile, expected):
+        from calibre_plugins.goodreads_more_tags.monitoring import Histogram
+        histogram = Histogram([1, 10, 100])
+        for value in [0.5] + [5] * 8 + [50]:
+            histogram.observe(value)
+        assert histogram.percentile(percentile) == pytest.approx(expected)
+
+    def test_percentile__above_largest_bucket(self):
+        from calibre_plugins.goodreads_more_tags.monitoring import Histogram
+        histogram = Histogram([1, 2])
+        histogram.observe(100)
+        assert histogram.percentile(99) == 2
+
+    def test_cumulative_counts(self):
+        from calibre_plugins.goodreads_more_tags.monitoring import Histogram
+        histogram = Histogram([1, 2])
+        for value in [0.5, 1, 1.5, 3]:
+            histogram.observe(value)
+        assert histogram.cumulative_counts() == [(1, 2), (2, 3), (None, 4)]
+
+
+class TestMetricsRegistry(object):
+    @pytest.fixture
+    def registry(self):
+        from calibre_plugins.goodreads_more_tags.monitoring import MetricsRegistry
+        return MetricsRegistry(
+            counters = [('requests', 'Requests made.')],
+            histograms = [('fetch_seconds', 'Request duration.', (1, 5))],
+            clock = lambda: 100,
+        )
+
+    def test_increment(self, registry):
+        registry.increment('requests')
+        registry.increment('requests', 2)
+        assert registry.get('requests') == 3
+
+    def test_increment__unknown(self, registry):
+        with pytest.raises(KeyError):
+            registry.increment('typo')
+
+    def test_reset(self, registry):
+        registry.increment('requests')
+        registry.observe('fetch_seconds', 2)
+        registry.reset()
+        assert registry.get('requests') == 0
+        assert registry.snapshot()['histograms']['fetch_seconds']['count'] == 0
+
+    def test_format_json(self, registry):
+        registry.increment('requests')
+        registry.observe('fetch_seconds', 2)
+        data = json.loads(registry.format_json())
+        assert data['counters'] == { 'requests': 1 }
+        assert data['histograms']['fetch_seconds']['count'] == 1
+        assert data['histograms']['fetch_seconds']['buckets'] == [[1, 0], [5, 1], [None, 1]]
+        assert data['histograms']['fetch_seconds']['p50'] == 3
+
+    def test_format_prometheus(self, registry):
+        registry.increment('requests')
+        registry.observe('fetch_seconds', 2)
+        lines = registry.format_prometheus().splitlines()
+        assert '# TYPE goodreads_more_tags_requests_total counter' in lines
+        assert 'goodreads_more_tags_requests_total 1' in lines
+        assert 'goodreads_more_tags_fetch_seconds_bucket{le="1.0"} 0' in lines
+        assert 'goodreads_more_tags_fetch_seconds_bucket{le="+Inf"} 1' in lines
+        assert 'goodreads_more_tags_fetch_seconds_count 1' in lines
+
+
+class TestMetricsExporter(object):
+    def test_write_on_stop(self, tmpdir):
+        from calibre_plugins.goodreads_more_tags.monitoring import MetricsExporter, MetricsRegistry
+        registry = MetricsRegistry()
+        path = tmpdir.join('metrics.prom')
+        with MetricsExporter(registry, str(path), 'prometheus', interval = 3600):
+            registry.increment('books')
+        assert 'goodreads_more_tags_books_total 1' in path.read().splitlines()
+        assert not tmpdir.join('metrics.prom.tmp').exists()
+
+    def test_invalid_format(self, tmpdir):
+        from calibre_plugins.goodreads_more_tags.monitoring import MetricsExporter, MetricsRegistry
+        with pytest.raises(ValueError):
+            MetricsExporter(MetricsRegistry(), str(tmpdir.join('metrics')), 'xml')
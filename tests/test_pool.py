@@ -0,0 +1,177 @@
+import time
+from threading import Event, Lock
+
+import pytest
+
+
+class TestHostLimiter(object):
+    def test_limit_for__same_host(self):
+        from calibre_plugins.goodreads_more_tags.pool import HostLimiter
+        limiter = HostLimiter(2)
+        assert limiter.limit_for('https://www.goodreads.com/a') is limiter.limit_for('https://www.goodreads.com/b')
+
+    def test_limit_for__different_host(self):
+        from calibre_plugins.goodreads_more_tags.pool import HostLimiter
+        limiter = HostLimiter(2)
+        assert limiter.limit_for('https://www.goodreads.com/a') is not limiter.limit_for('https://example.com/a')
+
+    def test_limit_for__limits(self):
+        from calibre_plugins.goodreads_more_tags.pool import HostLimiter
+        limiter = HostLimiter(2)
+        semaphore = limiter.limit_for('https://www.goodreads.com/')
+        assert semaphore.acquire(False)
+        assert semaphore.acquire(False)
+        assert not semaphore.acquire(False)
+
+
+class TestWorkerPool(object):
+    def test_submit__result(self):
+        from calibre_plugins.goodreads_more_tags.pool import WorkerPool
+        pool = WorkerPool(2, 2)
+        assert pool.submit(lambda a, b: a + b, 1, 2).result(1) == 3
+
+    def test_submit__reuses_executor(self):
+        from calibre_plugins.goodreads_more_tags.pool import WorkerPool
+        pool = WorkerPool(2, 2)
+        pool.submit(lambda: None).result(1)
+        executor = pool.executor
+        pool.configure(2, 2)
+        pool.submit(lambda: None).result(1)
+        assert pool.executor is executor
+
+    def test_configure__resize(self):
+        from calibre_plugins.goodreads_more_tags.pool import WorkerPool
+        pool = WorkerPool(2, 2)
+        pool.submit(lambda: None).result(1)
+        executor = pool.executor
+        pool.configure(3, 2)
+        pool.submit(lambda: None).result(1)
+        assert pool.executor is not executor
+
+    def test_submit__bounded(self):
+        from calibre_plugins.goodreads_more_tags.pool import WorkerPool
+        pool = WorkerPool(2, 2)
+        lock = Lock()
+        release = Event()
+        running = [0, 0]
+
+        def work():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            release.wait(1)
+            with lock:
+                running[0] -= 1
+
+        futures = [pool.submit(work) for _ in range(6)]
+        time.sleep(0.2)
+        release.set()
+        for future in futures:
+            future.result(2)
+        assert running[1] == 2
+
+
+class FakeClock(object):
+    """ A clock that only advances when sleeping. """
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestRateLimiter(object):
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def create(self, clock):
+        from calibre_plugins.goodreads_more_tags.pool import RateLimiter
+
+        def create(rate):
+            return RateLimiter(rate, clock = clock, sleep = clock.sleep)
+        return create
+
+    def test_acquire__burst(self, create):
+        limiter = create(5)
+        assert [limiter.acquire() for _ in range(5)] == [0] * 5
+
+    def test_acquire__rate(self, create, clock):
+        limiter = create(5)
+        start = clock()
+        for _ in range(15):
+            limiter.acquire()
+        # The first 5 are a burst, the other 10 are spread out over 2 seconds.
+        assert clock() - start == pytest.approx(2)
+
+    def test_acquire__unlimited(self, create):
+        limiter = create(0)
+        assert all(limiter.acquire() == 0 for _ in range(100))
+
+    def test_throttled__halves_rate(self, create):
+        limiter = create(4)
+        limiter.throttled()
+        assert limiter.rate == 2
+        limiter.throttled()
+        assert limiter.rate == 1
+
+    def test_throttled__minimum(self, create):
+        from calibre_plugins.goodreads_more_tags.pool import MIN_RATE
+        limiter = create(4)
+        for _ in range(100):
+            limiter.throttled()
+        assert limiter.rate == MIN_RATE
+
+    def test_throttled__retry_after(self, create):
+        limiter = create(4)
+        limiter.throttled(retry_after = 30)
+        assert limiter.acquire() >= 30
+
+    def test_throttled__retry_after_capped(self, create):
+        from calibre_plugins.goodreads_more_tags.pool import MAX_RETRY_AFTER
+        limiter = create(4)
+        limiter.throttled(retry_after = 10 ** 9)
+        assert limiter.acquire() <= MAX_RETRY_AFTER
+
+    def test_acquire__timeout(self, create, clock):
+        limiter = create(1)
+        limiter.throttled(retry_after = 30)
+        start = clock()
+        assert limiter.acquire(timeout = 10) is None
+        assert clock() == start
+        # Giving up does not take a turn from later requests.
+        assert limiter.acquire(timeout = 60) == pytest.approx(30)
+
+    def test_acquire__aborted(self, create):
+        limiter = create(1)
+        limiter.throttled(retry_after = 30)
+        abort = Event()
+        abort.set()
+        assert limiter.acquire(abort) is None
+
+    def test_acquire__abort_waits(self, create):
+        limiter = create(1)
+        limiter.acquire()
+        abort = Event()
+        start = time.time()
+        # The first request used the burst, so this waits (for real, as abort is used) for about a second.
+        assert limiter.acquire(abort) == pytest.approx(1)
+        assert time.time() - start >= 0.9
+
+    def test_succeeded__recovers(self, create):
+        limiter = create(4)
+        limiter.throttled()
+        limiter.throttled()
+        for _ in range(100):
+            limiter.succeeded()
+        assert limiter.rate == 4
+
+    def test_configure(self, create):
+        limiter = create(4)
+        limiter.throttled()
+        limiter.configure(10)
+        assert limiter.rate == 10
@@ -5,7 +5,7 @@ class TestNestingJSONConfig(object):
     @pytest.fixture
     def create(self, tmpdir):
         import json
-        from calibre_plugins.goodreads_more_tags.config import NestingJSONConfig
+        from calibre_plugins.goodreads_more_tags.prefs import NestingJSONConfig
 
         def create(data):
             tmpdir.join('config.json').write(json.dumps(data))
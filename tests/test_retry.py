@@ -0,0 +1,193 @@
+import os.path
+import socket
+from threading import Event
+from urllib.error import HTTPError
+
+import pytest
+
+RESPONSES = os.path.join(os.path.dirname(__file__), '_responses')
+with open(os.path.join(RESPONSES, 'goodreads-shelves-902715.html'), 'rb') as f:
+    SHELVES_PAGE = f.read()
+ERROR_PAGE = b'<html><body>Something went wrong</body></html>'
+NO_SHELVES_PAGE = b'<html><body><div class="leftContainer">Showing 0-0 of 0</div></body></html>'
+CAPTCHA_PAGE = b'<html><body><form action="/errors/validateCaptcha">Enter the characters</form></body></html>'
+
+
+def http_error(code):
+    return HTTPError('https://www.goodreads.com/', code, 'Error', {}, None)
+
+
+class TestIsRetryable(object):
+    @pytest.mark.parametrize('error', [
+        socket.timeout('timed out'),
+        socket.error('connection refused'),
+        http_error(429),
+        http_error(500),
+        http_error(503),
+    ])
+    def test_retryable(self, error):
+        from calibre_plugins.goodreads_more_tags.retry import is_retryable
+        assert is_retryable(error)
+
+    @pytest.mark.parametrize('error', [
+        http_error(403),
+        http_error(404),
+        ValueError('invalid literal'),
+    ])
+    def test_not_retryable(self, error):
+        from calibre_plugins.goodreads_more_tags.retry import is_retryable
+        assert not is_retryable(error)
+
+
+class TestRetryPolicy(object):
+    def test_attempts(self):
+        from calibre_plugins.goodreads_more_tags.retry import RetryPolicy
+        policy = RetryPolicy(4, 10, 60, base_delay = 0)
+        assert [attempt for attempt, timeout in policy.attempts()] == [1, 2, 3, 4]
+
+    def test_attempts__deadline(self):
+        from calibre_plugins.goodreads_more_tags.retry import RetryPolicy
+        now = [0]
+        policy = RetryPolicy(10, 10, 25, base_delay = 1, clock = lambda: now[0], random = lambda: 0)
+        attempts = []
+        for attempt, timeout in policy.attempts():
+            attempts.append((attempt, timeout))
+            now[0] += 10
+        assert attempts == [(1, 10), (2, 10), (3, 5)]
+
+    def test_attempts__abort(self):
+        from calibre_plugins.goodreads_more_tags.retry import RetryPolicy
+        policy = RetryPolicy(10, 10, 60, base_delay = 0)
+        abort = Event()
+        attempts = []
+        for attempt, timeout in policy.attempts(abort):
+            attempts.append(attempt)
+            if attempt == 2:
+                abort.set()
+        assert attempts == [1, 2]
+
+    def test_attempts__abort_while_waiting(self):
+        from calibre_plugins.goodreads_more_tags.retry import RetryPolicy
+        policy = RetryPolicy(3, 10, 60, base_delay = 30, random = lambda: 1)
+        abort = Event()
+        attempts = policy.attempts(abort)
+        next(attempts)
+        abort.set()
+        assert list(attempts) == []
+
+    def test_get_delay__jitter(self):
+        from calibre_plugins.goodreads_more_tags.retry import RetryPolicy
+        policy = RetryPolicy(10, 10, 60, base_delay = 1, max_delay = 8)
+        delays = [policy.get_delay(retry) for retry in range(1, 10) for _ in range(20)]
+        assert all(0 <= delay <= 8 for delay in delays)
+        assert len(set(delays)) > 1
+
+
+class TestWorkerRetries(object):
+    @pytest.fixture(autouse = True)
+    def throttled(self, monkeypatch):
+        """ Use an unlimited rate, keeping track of the times the requests were throttled. """
+        from calibre_plugins.goodreads_more_tags import worker
+        from calibre_plugins.goodreads_more_tags.pool import RateLimiter
+        rate_limiter = RateLimiter(0)
+        throttled = []
+        monkeypatch.setattr(rate_limiter, 'throttled', lambda retry_after = None: throttled.append(retry_after))
+        monkeypatch.setattr(worker, 'rate_limiter', rate_limiter)
+        return throttled
+
+    @pytest.fixture
+    def fetch(self, browser, create_worker):
+        from calibre_plugins.goodreads_more_tags.retry import RetryPolicy
+
+        def fetch(responses, abort = None, entry = None):
+            """ Fetch the shelves, with the given responses (either the data or an error to raise) for the attempts. """
+            requests = []
+
+            def respond(match):
+                response = responses[len(requests)]
+                requests.append(match.group(0))
+                if isinstance(response, Exception):
+                    raise response
+                return response
+            browser.add_response(r'.*/book/shelves/902715$', respond)
+
+            worker = create_worker('902715', abort = abort)
+            worker.retry_policy = RetryPolicy(3, 10, 60, base_delay = 0)
+            return worker.fetch_page(1, entry), len(requests)
+        return fetch
+
+    def test_success(self, fetch):
+        shelves, requests = fetch([SHELVES_PAGE])
+        assert shelves['fantasy'] == 5426
+        assert requests == 1
+
+    def test_retry__timeout(self, fetch):
+        shelves, requests = fetch([socket.timeout('timed out'), SHELVES_PAGE])
+        assert shelves['fantasy'] == 5426
+        assert requests == 2
+
+    def test_retry__server_error(self, fetch):
+        shelves, requests = fetch([http_error(503), http_error(500), SHELVES_PAGE])
+        assert shelves['fantasy'] == 5426
+        assert requests == 3
+
+    def test_retry__error_page(self, fetch):
+        shelves, requests = fetch([ERROR_PAGE, SHELVES_PAGE])
+        assert shelves['fantasy'] == 5426
+        assert requests == 2
+
+    def test_retry__error_page_throttled(self, fetch, throttled):
+        shelves, requests = fetch([ERROR_PAGE] * 4)
+        assert shelves is None
+        # The first attempt is streamed, and the others are not, all within the same attempts. Only the pages that are
+        # not streamed can be recognized as throttling.
+        assert requests == 3
+        assert throttled == [None, None]
+
+    def test_retry__no_shelves_not_throttled(self, fetch, throttled):
+        shelves, requests = fetch([NO_SHELVES_PAGE] * 4)
+        assert shelves is None
+        assert requests == 3
+        assert throttled == []
+
+    def test_retry__no_shelves_known_book_throttled(self, fetch, throttled):
+        from calibre_plugins.goodreads_more_tags.cache import CacheEntry
+        entry = CacheEntry({ 'fantasy': 5000 }, True, None, None)
+        shelves, requests = fetch([NO_SHELVES_PAGE, NO_SHELVES_PAGE, SHELVES_PAGE], entry = entry)
+        assert shelves['fantasy'] == 5426
+        assert requests == 3
+        assert throttled == [None]
+
+    def test_retry__captcha_throttled(self, fetch, throttled):
+        shelves, requests = fetch([CAPTCHA_PAGE, CAPTCHA_PAGE, SHELVES_PAGE])
+        assert shelves['fantasy'] == 5426
+        assert requests == 3
+        # The first attempt is streamed, after which the captcha can only be recognized once.
+        assert throttled == [None]
+
+    def test_retry__gives_up(self, fetch):
+        shelves, requests = fetch([socket.timeout('timed out')] * 3)
+        assert shelves is None
+        assert requests == 3
+
+    def test_rate_limit__past_timeout(self, fetch, monkeypatch):
+        from calibre_plugins.goodreads_more_tags import worker
+        from calibre_plugins.goodreads_more_tags.pool import RateLimiter
+        rate_limiter = RateLimiter(1)
+        rate_limiter.throttled(retry_after = 30)
+        monkeypatch.setattr(worker, 'rate_limiter', rate_limiter)
+        shelves, requests = fetch([SHELVES_PAGE])
+        assert shelves is None
+        assert requests == 0
+
+    def test_no_retry__not_found(self, fetch):
+        shelves, requests = fetch([http_error(404), SHELVES_PAGE])
+        assert shelves is None
+        assert requests == 1
+
+    def test_no_retry__aborted(self, fetch):
+        abort = Event()
+        abort.set()
+        shelves, requests = fetch([SHELVES_PAGE], abort = abort)
+        assert shelves is None
+        assert requests == 0
@@ -0,0 +1,56 @@
+from queue import Queue
+from threading import Thread
+
+import pytest
+
+from tests.fixture_shelves import DISTRIBUTIONS, generate_shelves, render_page
+
+
+class TestGeneratedPages(object):
+    @pytest.mark.parametrize('distribution', DISTRIBUTIONS)
+    def test_parse_shelves(self, distribution):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        shelves = generate_shelves(5000, distribution, seed = 1)
+        assert parse_shelves(render_page('1', shelves, page_size = 5000)) == dict(shelves)
+
+    def test_parse_shelves__page(self):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        shelves = generate_shelves(250, seed = 1)
+        assert parse_shelves(render_page('1', shelves, page = 3)) == dict(shelves[200:])
+
+    def test_stream_shelves(self):
+        from calibre_plugins.goodreads_more_tags.shelves import ShelfStreamParser
+        shelves = generate_shelves(5000, seed = 1)
+        text = render_page('1', shelves, page = 2).decode('utf-8')
+        parser = ShelfStreamParser()
+        parser.feed(text)
+        assert parser.done
+        assert parser.close() == dict(shelves[100:200])
+
+
+class TestShelfServer(object):
+    @pytest.fixture(autouse = True)
+    def goodreads(self, monkeypatch, shelf_server):
+        """ Send all requests of the workers to the ShelfServer, without a rate limit. """
+        from calibre_plugins.goodreads_more_tags import worker
+        from calibre_plugins.goodreads_more_tags.pool import RateLimiter
+        monkeypatch.setattr(worker, 'rate_limiter', RateLimiter(0))
+        monkeypatch.setattr(worker, 'URL_TEMPLATE', shelf_server.url_template)
+        monkeypatch.setattr(worker, 'PAGE_URL_TEMPLATE', shelf_server.url_template + '?page={page}')
+
+    def test_pages(self, configs, shelf_server, create_worker):
+        configs.goodreads_more_tags.retrieval_pages = 3
+        shelf_server.shelves = 250
+        assert create_worker('1').get_shelves() == dict(shelf_server.get_shelves('1'))
+        assert len(shelf_server.requests) == 3
+
+    def test_concurrent_workers(self, shelf_server, create_worker):
+        from calibre.utils.logging import ThreadSafeLog
+        shelf_server.shelves = 1000
+        results = Queue()
+        threads = [Thread(target = create_worker(str(i), results, log = ThreadSafeLog()).run) for i in range(1, 51)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results.qsize() == 50
@@ -0,0 +1,40 @@
+import pytest
+
+
+class TestSettings(object):
+    def test_immutable(self):
+        from calibre_plugins.goodreads_more_tags.settings import get_settings
+        settings = get_settings()
+        with pytest.raises(AttributeError):
+            settings.threshold_absolute = 5
+
+    def test_no_dict(self):
+        from calibre_plugins.goodreads_more_tags.settings import get_settings
+        assert not hasattr(get_settings(), '__dict__')
+
+    def test_validated(self, configs):
+        from calibre_plugins.goodreads_more_tags.settings import get_settings
+        configs.goodreads_more_tags.treshold_absolute = -5
+        configs.goodreads_more_tags.treshold_percentage = 150
+        configs.goodreads_more_tags.treshold_percentage_of = []
+        settings = get_settings()
+        assert settings.threshold_absolute == 0
+        assert settings.threshold_percentage == 100
+        assert settings.threshold_percentage_of == (3, 4)
+
+    def test_snapshot(self):
+        from calibre_plugins.goodreads_more_tags.prefs import plugin_prefs, KEY_THRESHOLD_ABSOLUTE
+        from calibre_plugins.goodreads_more_tags.settings import get_settings
+        settings = get_settings()
+        plugin_prefs.set(KEY_THRESHOLD_ABSOLUTE, 1234)
+        assert get_settings() is settings
+        assert get_settings().threshold_absolute != 1234
+
+    def test_invalidate(self):
+        from calibre_plugins.goodreads_more_tags.prefs import plugin_prefs, KEY_THRESHOLD_ABSOLUTE
+        from calibre_plugins.goodreads_more_tags.settings import get_settings, invalidate_settings
+        settings = get_settings()
+        plugin_prefs.set(KEY_THRESHOLD_ABSOLUTE, 1234)
+        invalidate_settings()
+        assert get_settings() is not settings
+        assert get_settings().threshold_absolute == 1234
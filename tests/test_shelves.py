@@ -0,0 +1,138 @@
+import glob
+import os.path
+
+import pytest
+
+RESPONSES = os.path.join(os.path.dirname(__file__), '_responses')
+SHELVES_PAGES = sorted(glob.glob(os.path.join(RESPONSES, 'goodreads-shelves-*.html')))
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class TestParseShelves(object):
+    @pytest.mark.parametrize('path', SHELVES_PAGES)
+    def test_parse_shelves(self, path):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        shelves = parse_shelves(read(path))
+        assert len(shelves) == 100
+        assert all(count > 0 for count in shelves.values())
+
+    def test_parse_shelves__values(self):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        shelves = parse_shelves(read(os.path.join(RESPONSES, 'goodreads-shelves-902715.html')))
+        assert shelves['to-read'] == 20910
+        assert shelves['fantasy'] == 5426
+        assert shelves['abercrombie-joe'] == 15
+
+    @pytest.mark.parametrize('path', SHELVES_PAGES)
+    def test_fast_matches_tree(self, path):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves_fast, parse_shelves_tree
+        text = read(path).decode('utf-8')
+        assert parse_shelves_fast(text) == parse_shelves_tree(text)
+
+    def test_fallback(self):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        data = b'''
+            <div class="shelfStat other">
+                <a class="actionLinkLite">fantasy</a>
+                <div class="smallText"><a>1,234 people</a></div>
+            </div>
+        '''
+        assert parse_shelves(data) == { 'fantasy': 1234 }
+
+    def test_empty(self):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        assert parse_shelves(b'<html><body></body></html>') == {}
+
+
+def compress_gzip(data):
+    import gzip
+    import io
+    out = io.BytesIO()
+    with gzip.GzipFile(fileobj = out, mode = 'wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def stream(data, chunk_size, content_encoding = None):
+    from calibre_plugins.goodreads_more_tags.shelves import ChunkDecoder, ShelfStreamParser
+    decoder = ChunkDecoder(content_encoding)
+    parser = ShelfStreamParser()
+    for i in range(0, len(data), chunk_size):
+        parser.feed(decoder.decode(data[i:i + chunk_size]))
+    parser.feed(decoder.decode(b'', final = True))
+    return parser.close()
+
+
+class TestStreamShelves(object):
+    @pytest.mark.parametrize('path', SHELVES_PAGES)
+    @pytest.mark.parametrize('chunk_size', [1, 100, 16 * 1024])
+    def test_matches_parse_shelves(self, path, chunk_size):
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        data = read(path)
+        assert stream(data, chunk_size) == parse_shelves(data)
+
+    @pytest.mark.parametrize('content_encoding', ['gzip', 'deflate'])
+    def test_compressed(self, content_encoding):
+        import zlib
+        from calibre_plugins.goodreads_more_tags.shelves import parse_shelves
+        data = read(os.path.join(RESPONSES, 'goodreads-shelves-902715.html'))
+        compressed = compress_gzip(data) if content_encoding == 'gzip' else zlib.compress(data)
+        assert stream(compressed, 1000, content_encoding) == parse_shelves(data)
+
+    def test_unsupported_encoding(self):
+        from calibre_plugins.goodreads_more_tags.shelves import ChunkDecoder
+        with pytest.raises(ValueError):
+            ChunkDecoder('br')
+
+    def test_unexpected_markup(self):
+        data = b'''
+            <div class="shelfStat other">
+                <a class="actionLinkLite">fantasy</a>
+                <div class="smallText"><a>1,234 people</a></div>
+            </div>
+        '''
+        assert stream(data, 10) is None
+
+    def test_empty(self):
+        assert stream(b'<html><body></body></html>', 10) == {}
+
+
+class TestStreamShelvesEarlyStop(object):
+    def feed_until_done(self, parser, text, chunk_size = 100):
+        """ Feed the text to the parser until it is done, returning the amount of characters that were fed. """
+        for i in range(0, len(text), chunk_size):
+            parser.feed(text[i:i + chunk_size])
+            if parser.done:
+                return i + chunk_size
+        return len(text)
+
+    @pytest.mark.parametrize('path', SHELVES_PAGES)
+    def test_all_shelves(self, path):
+        from calibre_plugins.goodreads_more_tags.shelves import ShelfStreamParser, parse_shelves
+        data = read(path)
+        parser = ShelfStreamParser()
+        fed = self.feed_until_done(parser, data.decode('utf-8'))
+        assert parser.done
+        assert fed < len(data)
+        assert parser.close() == parse_shelves(data)
+
+    def test_low_counts(self):
+        from calibre_plugins.goodreads_more_tags.shelves import ShelfStreamParser
+        text = read(os.path.join(RESPONSES, 'goodreads-shelves-902715.html')).decode('utf-8')
+        parser = ShelfStreamParser()
+        self.feed_until_done(parser, text)
+        shelves = parser.close()
+        assert len(shelves) == 100
+        assert min(shelves.values()) < 100
+
+    def test_no_summary(self):
+        from calibre_plugins.goodreads_more_tags.shelves import ShelfStreamParser
+        text = read(os.path.join(RESPONSES, 'goodreads-shelves-902715.html')).decode('utf-8')
+        parser = ShelfStreamParser()
+        self.feed_until_done(parser, text.replace('Showing', 'Displaying'))
+        assert not parser.done
+        assert len(parser.close()) == 100
@@ -0,0 +1,317 @@
+import threading
+import time
+from threading import Event, Thread
+
+import pytest
+
+
+class TestCountDownLatch(object):
+    def test_wait__timeout(self):
+        from calibre_plugins.goodreads_more_tags.sync import CountDownLatch
+        latch = CountDownLatch(1)
+        assert not latch.wait(0.1)
+
+    def test_wait__wakes_on_last_count_down(self):
+        from calibre_plugins.goodreads_more_tags.sync import CountDownLatch
+        latch = CountDownLatch(2)
+
+        def count_down_delayed():
+            time.sleep(0.1)
+            latch.count_down()
+            time.sleep(0.1)
+            latch.count_down()
+
+        Thread(target = count_down_delayed).start()
+        start = time.time()
+        assert latch.wait(5)
+        assert time.time() - start < 1
+
+    def test_release(self):
+        from calibre_plugins.goodreads_more_tags.sync import CountDownLatch
+        latch = CountDownLatch(5)
+        latch.release()
+        assert latch.wait(0)
+
+    def test_wait__aborted(self):
+        from calibre_plugins.goodreads_more_tags.sync import CountDownLatch
+        abort = Event()
+        latch = CountDownLatch(1)
+
+        def set_delayed():
+            time.sleep(0.1)
+            abort.set()
+
+        Thread(target = set_delayed).start()
+        start = time.time()
+        assert not latch.wait(5, abort = abort)
+        assert time.time() - start < 1
+
+    def test_wait__aborted_without_polling(self, monkeypatch):
+        from calibre_plugins.goodreads_more_tags import sync
+        monkeypatch.setattr(sync, 'WATCH_INTERVAL', 30)
+        abort = Event()
+        latch = sync.CountDownLatch(1)
+
+        def set_delayed():
+            time.sleep(0.1)
+            abort.set()
+
+        Thread(target = set_delayed).start()
+        start = time.time()
+        assert not latch.wait(5, abort = abort)
+        assert time.time() - start < 1
+
+    def test_wait__watcher_stops(self):
+        from calibre_plugins.goodreads_more_tags.sync import CountDownLatch, WATCH_INTERVAL
+        latch = CountDownLatch(1)
+        latch.count_down()
+        assert latch.wait(abort = Event())
+        time.sleep(WATCH_INTERVAL * 3)
+        assert not any(thread.name == 'CountDownLatch-abort-watcher' for thread in threading.enumerate())
+
+    def test_wait__not_aborted(self):
+        from calibre_plugins.goodreads_more_tags.sync import CountDownLatch
+        abort = Event()
+        latch = CountDownLatch(1)
+
+        def count_down_delayed():
+            time.sleep(0.3)
+            latch.count_down()
+
+        Thread(target = count_down_delayed).start()
+        assert latch.wait(abort = abort)
+        assert not abort.is_set()
+
+    def test_wait__abort_timeout(self):
+        from calibre_plugins.goodreads_more_tags.sync import CountDownLatch
+        latch = CountDownLatch(1)
+        start = time.time()
+        assert not latch.wait(0.25, abort = Event())
+        assert 0.2 < time.time() - start < 1
+
+
+class TestInFlight(object):
+    def test_do__concurrent_calls_share(self):
+        from calibre_plugins.goodreads_more_tags.sync import InFlight
+        in_flight = InFlight()
+        release = Event()
+        calls = []
+        results = []
+
+        def work():
+            calls.append(True)
+            release.wait(5)
+            return { 'fantasy': 10 }
+
+        threads = [Thread(target = lambda: results.append(in_flight.do('1', work))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+
+        assert len(calls) == 1
+        assert len(results) == 5
+        assert all(result is results[0][0] for result, shared in results)
+        assert sorted(shared for result, shared in results) == [False, True, True, True, True]
+
+    def test_do__different_keys(self):
+        from calibre_plugins.goodreads_more_tags.sync import InFlight
+        in_flight = InFlight()
+        assert in_flight.do('1', lambda: 1) == (1, False)
+        assert in_flight.do('2', lambda: 2) == (2, False)
+
+    def test_do__exception_propagates(self):
+        from calibre_plugins.goodreads_more_tags.sync import InFlight
+        in_flight = InFlight()
+        started = Event()
+        release = Event()
+        errors = []
+
+        def fail():
+            started.set()
+            release.wait(5)
+            raise ValueError('failed')
+
+        def call():
+            try:
+                in_flight.do('1', fail)
+            except ValueError as e:
+                errors.append(e)
+
+        leader = Thread(target = call)
+        leader.start()
+        started.wait(5)
+        follower = Thread(target = call)
+        follower.start()
+        time.sleep(0.1)
+        release.set()
+        leader.join(5)
+        follower.join(5)
+
+        assert len(errors) == 2
+        assert errors[0] is errors[1]
+
+    def test_do__cleaned_up(self):
+        from calibre_plugins.goodreads_more_tags.sync import InFlight
+        in_flight = InFlight()
+        in_flight.do('1', lambda: 1)
+        with pytest.raises(ValueError):
+            in_flight.do('2', lambda: int('x'))
+        assert len(in_flight) == 0
+        assert in_flight.do('1', lambda: 3) == (3, False)
+
+
+class TestChannel(object):
+    def test_get__order(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+        for i in range(3):
+            channel.put(i)
+        assert [channel.get(), channel.get(), channel.get()] == [0, 1, 2]
+
+    def test_get__waits(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+
+        def put_delayed():
+            time.sleep(0.1)
+            channel.put(1)
+
+        Thread(target = put_delayed).start()
+        assert channel.get(5) == 1
+
+    def test_get__timeout(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel, ChannelTimeoutError
+        channel = Channel()
+        start = time.time()
+        with pytest.raises(ChannelTimeoutError):
+            channel.get(0.2)
+        assert time.time() - start >= 0.19
+
+    def test_get__spurious_wakeup(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+
+        def wake_then_put():
+            for _ in range(5):
+                time.sleep(0.02)
+                with channel.lock:
+                    channel.not_empty.notify_all()
+            channel.put(1)
+
+        Thread(target = wake_then_put).start()
+        assert channel.get(5) == 1
+
+    def test_close__drains_remaining(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+        channel.put(1)
+        channel.close()
+        assert channel.get() == 1
+        assert channel.get() is None
+        assert channel.get(0) is None
+
+    def test_close__wakes_consumers(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+        results = []
+        consumers = [Thread(target = lambda: results.append(channel.get(5))) for _ in range(3)]
+        for consumer in consumers:
+            consumer.start()
+        time.sleep(0.1)
+        channel.close()
+        for consumer in consumers:
+            consumer.join(5)
+        assert results == [None, None, None]
+
+    def test_close__cannot_put(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel, ChannelClosedError
+        channel = Channel()
+        channel.close()
+        with pytest.raises(ChannelClosedError):
+            channel.put(1)
+
+    def test_iterate(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+
+        def produce():
+            for i in range(3):
+                time.sleep(0.02)
+                channel.put(i)
+            # None is an item like any other when iterating.
+            channel.put(None)
+            channel.close()
+
+        Thread(target = produce).start()
+        assert list(channel) == [0, 1, 2, None]
+
+    def test_iterate__timeout(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel, ChannelTimeoutError
+        channel = Channel()
+        channel.put(1)
+        iterator = channel.iterate(0.1)
+        assert next(iterator) == 1
+        with pytest.raises(ChannelTimeoutError):
+            next(iterator)
+
+    def test_many_producers__throughput(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+        producers = 32
+        items = 2000
+        received = []
+
+        def produce(producer):
+            for i in range(items):
+                channel.put((producer, i))
+
+        def consume():
+            received.extend(channel)
+
+        consumers = [Thread(target = consume) for _ in range(4)]
+        threads = [Thread(target = produce, args = (producer,)) for producer in range(producers)]
+        start = time.time()
+        for thread in consumers + threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        channel.close()
+        for consumer in consumers:
+            consumer.join()
+        duration = time.time() - start
+
+        assert sorted(received) == [(producer, i) for producer in range(producers) for i in range(items)]
+        # Very generous, this should take well under a second.
+        assert duration < 5
+
+    def test_many_producers__latency(self):
+        from calibre_plugins.goodreads_more_tags.sync import Channel
+        channel = Channel()
+        latencies = []
+
+        def produce():
+            for _ in range(20):
+                time.sleep(0.005)
+                channel.put(time.time())
+
+        def consume():
+            for sent in channel:
+                latencies.append(time.time() - sent)
+
+        consumer = Thread(target = consume)
+        consumer.start()
+        producers = [Thread(target = produce) for _ in range(16)]
+        for producer in producers:
+            producer.start()
+        for producer in producers:
+            producer.join()
+        channel.close()
+        consumer.join()
+
+        latencies.sort()
+        assert len(latencies) == 16 * 20
+        # A waiting consumer is woken up by every put, so items do not wait for a timeout or another put.
+        assert latencies[len(latencies) // 2] < 0.05
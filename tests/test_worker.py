@@ -0,0 +1,110 @@
+from queue import Queue
+import socket
+from threading import Event, Thread
+import time
+
+import pytest
+
+from tests.fixture_shelves import generate_shelves, render_page
+
+
+class TestWorkerShelves(object):
+    @pytest.fixture(autouse = True)
+    def throttled(self, monkeypatch):
+        """ Use an unlimited rate, keeping track of the times the requests were throttled. """
+        from calibre_plugins.goodreads_more_tags import worker
+        from calibre_plugins.goodreads_more_tags.pool import RateLimiter
+        rate_limiter = RateLimiter(0)
+        throttled = []
+        monkeypatch.setattr(rate_limiter, 'throttled', lambda retry_after = None: throttled.append(retry_after))
+        monkeypatch.setattr(worker, 'rate_limiter', rate_limiter)
+        return throttled
+
+    @pytest.fixture
+    def serve(self, browser):
+        """ Serve the pages of the shelves of book 1, returning the list of requested pages. """
+        requests = []
+
+        def serve(shelves, pages = None):
+            def respond(match):
+                page = int(match.group('page') or 1)
+                requests.append(page)
+                return (pages or {}).get(page) or render_page('1', shelves, page = page)
+            browser.add_response(r'.*/book/shelves/1(\?page=(?P<page>\d+))?$', respond)
+            return requests
+        return serve
+
+    def test_streamed__small_shelves_add_up(self, configs, browser, create_worker):
+        configs.goodreads_more_tags.treshold_absolute = 100
+        shelves = [
+            ('to-read', 5000),
+            ('fantasy', 1000),
+            ('adventure', 400),
+            ('sci-fi-fantasy', 60),
+            ('science-fiction', 50),
+            ('sf-fantasy', 40),
+        ]
+        browser.add_response(r'.*/book/shelves/1$', render_page('1', shelves))
+        results = Queue()
+        create_worker(result_queue = results).run()
+        assert sorted(results.get_nowait().tags) == ['Adventure', 'Fantasy', 'Science Fiction']
+
+    @pytest.mark.parametrize('stream', [True, False])
+    def test_pages__short_last_page(self, configs, serve, create_worker, throttled, stream):
+        configs.goodreads_more_tags.retrieval_pages = 5
+        configs.goodreads_more_tags.retrieval_stream = stream
+        shelves = generate_shelves(250, seed = 1)
+        requests = serve(shelves)
+        assert create_worker().get_shelves() == dict(shelves)
+        assert sorted(requests) == [1, 2, 3]
+        assert throttled == []
+
+    def test_pages__total_fits_one_page(self, configs, serve, create_worker):
+        configs.goodreads_more_tags.retrieval_pages = 5
+        shelves = generate_shelves(60, seed = 1)
+        requests = serve(shelves)
+        assert create_worker().get_shelves() == dict(shelves)
+        assert requests == [1]
+
+    @pytest.mark.parametrize('stream', [True, False])
+    def test_pages__empty_page_past_end(self, configs, serve, create_worker, throttled, stream):
+        configs.goodreads_more_tags.retrieval_pages = 5
+        configs.goodreads_more_tags.retrieval_stream = stream
+        shelves = generate_shelves(300, seed = 1)
+        # The first page claims 300 shelves, but the list ends after the second page.
+        requests = serve(shelves, { 3: render_page('1', shelves[:200], page = 3) })
+        assert create_worker().get_shelves() == dict(shelves[:200])
+        assert sorted(requests) == [1, 2, 3]
+        assert throttled == []
+
+    def test_shared__first_aborted(self, browser, create_worker):
+        shelves = generate_shelves(60, seed = 1)
+        started = Event()
+        abort = Event()
+        requests = []
+
+        def respond(match):
+            requests.append(match.group(0))
+            if len(requests) == 1:
+                # Keep the first retrieval busy until its worker is aborted.
+                started.set()
+                abort.wait(5)
+                raise socket.timeout('timed out')
+            return render_page('1', shelves)
+        browser.add_response(r'.*/book/shelves/1$', respond)
+
+        first = Thread(target = create_worker(abort = abort).run)
+        first.start()
+        assert started.wait(5)
+        results = Queue()
+        second = Thread(target = create_worker(result_queue = results).run)
+        second.start()
+        # Give the second worker the time to start waiting for the retrieval of the first one.
+        time.sleep(0.2)
+        abort.set()
+        first.join(5)
+        second.join(5)
+
+        # The second worker was not aborted, so it retrieved the shelves itself.
+        assert len(requests) == 2
+        assert results.get_nowait().tags